@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from aiogram.client.default import DefaultBotProperties
 import config
@@ -9,13 +10,28 @@ from aiohttp import web
 
 from config import TOKEN, WEBHOOK_URL, ADMIN_ID_LIST
 from db import create_db_and_tables
+from middlewares.sql_profiler import SQLProfilerMiddleware
+from middlewares.unit_of_work import UnitOfWorkMiddleware, UnitOfWorkCommitMiddleware
+from middlewares.user_lock import UserLockMiddleware
+from services.cart import CartService
+from services.user import UserService
+from utils.http_client import HttpClient
+from utils.keyboard_cache import KeyboardCache
 
 bot = Bot(TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher(storage=MemoryStorage())
+bot.session.middleware(UnitOfWorkCommitMiddleware())
+dp.update.outer_middleware(SQLProfilerMiddleware())
+dp.update.outer_middleware(UnitOfWorkMiddleware())
+dp.callback_query.middleware(UserLockMiddleware())
+background_tasks = set()
 
 
 async def on_startup(bot: Bot):
     await create_db_and_tables()
+    await KeyboardCache.build_static_menus()
+    background_tasks.add(asyncio.create_task(CartService.run_reservation_sweeper()))
+    background_tasks.add(asyncio.create_task(UserService.run_deposit_scanner()))
     await bot.set_webhook(WEBHOOK_URL)
     for admin in ADMIN_ID_LIST:
         try:
@@ -36,6 +52,7 @@ async def on_shutdown(dp):
 
 def main() -> None:
     dp.startup.register(on_startup)
+    dp.shutdown.register(HttpClient.close)
     app = web.Application()
     webhook_requests_handler = SimpleRequestHandler(
         dispatcher=dp,
@@ -28,6 +28,7 @@ class AllCategoriesCallback(BaseCallback, prefix="all_categories"):
     quantity: int
     confirmation: bool
     page: int
+    cursor: int
 
     @staticmethod
     def create(level: int,
@@ -36,19 +37,21 @@ class AllCategoriesCallback(BaseCallback, prefix="all_categories"):
                price: float = 0.0,
                quantity: int = 0,
                confirmation: bool = False,
-               page: int = 0) -> 'AllCategoriesCallback':
+               page: int = 0,
+               cursor: int = 0) -> 'AllCategoriesCallback':
         return AllCategoriesCallback(level=level, category_id=category_id, subcategory_id=subcategory_id, price=price,
-                                     quantity=quantity, confirmation=confirmation, page=page)
+                                     quantity=quantity, confirmation=confirmation, page=page, cursor=cursor)
 
 
 class MyProfileCallback(BaseCallback, prefix="my_profile"):
     action: str
     args_for_action: int | str
     page: int
+    cursor: int
 
     @staticmethod
-    def create(level: int, action: str = "", args_for_action="", page=0) -> 'MyProfileCallback':
-        return MyProfileCallback(level=level, action=action, args_for_action=args_for_action, page=page)
+    def create(level: int, action: str = "", args_for_action="", page=0, cursor=0) -> 'MyProfileCallback':
+        return MyProfileCallback(level=level, action=action, args_for_action=args_for_action, page=page, cursor=cursor)
 
 
 class CartCallback(BaseCallback, prefix="cart"):
@@ -56,12 +59,13 @@ class CartCallback(BaseCallback, prefix="cart"):
     cart_id: int
     cart_item_id: int
     confirmation: bool
+    cursor: int
 
     @staticmethod
     def create(level: int = 0, page: int = 0, cart_id: int = -1, cart_item_id: int = -1,
-               confirmation=False):
+               confirmation=False, cursor: int = 0):
         return CartCallback(level=level, page=page, cart_id=cart_id, cart_item_id=cart_item_id,
-                            confirmation=confirmation)
+                            confirmation=confirmation, cursor=cursor)
 
 
 class AdminMenuCallback(BaseCallback, prefix="admin_menu"):
@@ -105,16 +109,18 @@ class AdminInventoryManagementCallback(BaseCallback, prefix="inventory_managemen
     entity_id: int | None
     page: int
     confirmation: bool
+    cursor: int
 
     @staticmethod
     def create(level: int, add_type: AddType | None = None, entity_type: EntityType | None = None,
-               entity_id: int | None = None, page: int = 0, confirmation: bool = False):
+               entity_id: int | None = None, page: int = 0, confirmation: bool = False, cursor: int = 0):
         return AdminInventoryManagementCallback(level=level,
                                                 add_type=add_type,
                                                 entity_type=entity_type,
                                                 entity_id=entity_id,
                                                 page=page,
-                                                confirmation=confirmation)
+                                                confirmation=confirmation,
+                                                cursor=cursor)
 
 
 class UserManagementOperation(IntEnum):
@@ -128,12 +134,13 @@ class UserManagementCallback(BaseCallback, prefix="user_management"):
     page: int
     confirmation: bool
     buy_id: int | None
+    cursor: int
 
     @staticmethod
     def create(level: int, operation: UserManagementOperation | None = None, page: int = 0, confirmation: bool = False,
-               buy_id: int | None = None):
+               buy_id: int | None = None, cursor: int = 0):
         return UserManagementCallback(level=level, operation=operation, page=page, confirmation=confirmation,
-                                      buy_id=buy_id)
+                                      buy_id=buy_id, cursor=cursor)
 
 
 class StatisticsEntity(IntEnum):
@@ -152,11 +159,13 @@ class StatisticsCallback(BaseCallback, prefix="statistics"):
     statistics_entity: StatisticsEntity | None
     timedelta: StatisticsTimeDelta | None
     page: int
+    cursor: int
 
     @staticmethod
     def create(level: int, statistics_entity: StatisticsEntity | None = None,
-               timedelta: StatisticsTimeDelta | None = None, page: int = 0):
-        return StatisticsCallback(level=level, statistics_entity=statistics_entity, timedelta=timedelta, page=page)
+               timedelta: StatisticsTimeDelta | None = None, page: int = 0, cursor: int = 0):
+        return StatisticsCallback(level=level, statistics_entity=statistics_entity, timedelta=timedelta, page=page,
+                                  cursor=cursor)
 
 
 class WalletCallback(BaseCallback, prefix="wallet"):
@@ -1,3 +1,4 @@
+import json
 from dotenv import load_dotenv
 import os
 from enums.currency import Currency
@@ -17,8 +18,20 @@ SUPPORT_LINK = os.environ.get("SUPPORT_LINK")
 DB_ENCRYPTION = os.environ.get("DB_ENCRYPTION", False) == 'true'
 DB_NAME = os.environ.get("DB_NAME")
 DB_PASS = os.environ.get("DB_PASS")
+DB_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", 4))
+SQL_PROFILING = os.environ.get("SQL_PROFILING", False) == 'true'
+SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", 100))
+CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", 256))
+CART_RESERVATION_MINUTES = int(os.environ.get("CART_RESERVATION_MINUTES", 0))
+# "host=rate:burst,..." overrides the built-in request rate limits of the crypto API providers
+HTTP_RATE_LIMITS = {host: tuple(map(float, limit.split(":"))) for host, limit in
+                    (entry.split("=") for entry in os.environ.get("HTTP_RATE_LIMITS", "").split(",") if entry)}
 PAGE_ENTRIES = int(os.environ.get("PAGE_ENTRIES"))
 BOT_LANGUAGE = os.environ.get("BOT_LANGUAGE")
 MULTIBOT = os.environ.get("MULTIBOT", False) == 'true'
 ETHPLORER_API_KEY = os.environ.get("ETHPLORER_API_KEY")
 CURRENCY = Currency(os.environ.get("CURRENCY"))
+# The tokens accepted for deposits, each one is a Cryptocurrency member with its chain, contract, decimals and
+# the symbol it is priced by
+with open(os.environ.get("TOKENS_FILE", "tokens.json"), "r", encoding="UTF-8") as tokens_file:
+    TOKENS = {token["name"]: token for token in json.load(tokens_file)}
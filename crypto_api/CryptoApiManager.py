@@ -1,192 +1,272 @@
+import asyncio
+import logging
+from collections import defaultdict
 from datetime import datetime, timedelta
-import aiohttp
 import config
+from db import commit_unit_of_work
 from enums.cryptocurrency import Cryptocurrency
 from models.deposit import DepositDTO
 from models.user import UserDTO
-from services.deposit import DepositService
+from utils.http_client import HttpClient
+from utils.price_cache import PriceCache, PriceQuote
 
 
+# The deposit histories are read newest first in pages of this size, back to where the last scan got to
+HISTORY_PAGE_SIZE = 50
+# mempool.space has a fixed page size
+MEMPOOL_PAGE_SIZE = 25
+# The largest pages ethplorer and blockcypher return, used when a single second or block doesn't fit in a page
+ETHPLORER_MAX_PAGE_SIZE = 1000
+BLOCKCYPHER_MAX_PAGE_SIZE = 2000
+# How far back the first TRC20 scan of an address looks, the provider has no cheap full history
+TRC20_FIRST_SCAN_HOURS = 24
+
+
+# The deposit fetches take the position the last scan of the address got to, a block height or a timestamp,
+# and return the deposits from that position on together with the new position. The position itself is fetched
+# again, so the deposits of a block or second seen only in part are not missed, the caller skips the known ones.
 class CryptoApiManager:
-    min_timestamp = int((datetime.now() - timedelta(hours=24)).timestamp()) * 1000
 
     @staticmethod
     async def fetch_api_request(url: str, params: dict | None = None) -> dict:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data
+        # don't hold the write transaction of the current update while waiting on the provider
+        await commit_unit_of_work()
+        return await HttpClient.get_json(url, params)
 
     @staticmethod
-    async def get_new_btc_deposits(user_dto: UserDTO, deposits) -> float:
-        url = f'https://mempool.space/api/address/{user_dto.btc_address}/utxo'
-        data = await CryptoApiManager.fetch_api_request(url)
-        deposits = [deposit.tx_id for deposit in deposits if deposit.network == "BTC"]
-        deposit_sum = 0.0
-        for deposit in data:
-            if deposit["txid"] not in deposits and deposit['status']['confirmed']:
-                deposit_dto = DepositDTO(
-                    tx_id=deposit['txid'],
-                    user_id=user_dto.id,
-                    network="BTC",
-                    amount=deposit['value'],
-                    vout=deposit['vout']
-                )
-                await DepositService.create(deposit_dto)
-                deposit_sum += float(deposit["value"]) / 100_000_000
-        return deposit_sum
+    async def get_btc_deposits(user_dto: UserDTO, position: int | None) -> tuple[list[DepositDTO], int | None]:
+        # mempool.space pages the confirmed transactions newest first, after the last txid of a page
+        url = f'https://mempool.space/api/address/{user_dto.btc_address}/txs/chain'
+        deposits = []
+        positions = [] if position is None else [position]
+        while True:
+            data = await CryptoApiManager.fetch_api_request(url)
+            for transaction in data:
+                block_height = transaction['status']['block_height']
+                if position is not None and block_height < position:
+                    return deposits, max(positions)
+                positions.append(block_height)
+                deposits.extend(DepositDTO(tx_id=transaction['txid'],
+                                           user_id=user_dto.id,
+                                           network="BTC",
+                                           amount=output['value'],
+                                           vout=vout)
+                                for vout, output in enumerate(transaction['vout'])
+                                if output.get('scriptpubkey_address') == user_dto.btc_address)
+            if len(data) < MEMPOOL_PAGE_SIZE:
+                return deposits, max(positions, default=None)
+            url = f"https://mempool.space/api/address/{user_dto.btc_address}/txs/chain/{data[-1]['txid']}"
 
     @staticmethod
-    async def get_new_ltc_deposits(user_dto: UserDTO, deposits) -> float:
+    async def get_ltc_deposits(user_dto: UserDTO, position: int | None) -> tuple[list[DepositDTO], int | None]:
+        # blockcypher pages the outputs newest first, below a block height. A page may cut through the outputs
+        # of its last block, so that block is left out and fetched again in full at the start of the next page.
         url = f"https://api.blockcypher.com/v1/ltc/main/addrs/{user_dto.ltc_address}"
-        params = {"unspentOnly": "true"}
-        data = await CryptoApiManager.fetch_api_request(url, params=params)
-        deposits = [deposit.tx_id for deposit in deposits if deposit.network == "LTC"]
-        deposits_sum = 0.0
-        if data['n_tx'] > 0:
-            for deposit in data['txrefs']:
-                if deposit["confirmations"] > 0 and deposit['tx_hash'] not in deposits:
-                    deposit_dto = DepositDTO(
-                        tx_id=deposit['tx_hash'],
-                        user_id=user_dto.id,
-                        network='LTC',
-                        amount=deposit['value'],
-                        vout=deposit['tx_output_n']
-                    )
-                    await DepositService.create(deposit_dto)
-                    deposits_sum += float(deposit['value']) / 100_000_000
-        return deposits_sum
+        params = {"unspentOnly": "true", "limit": HISTORY_PAGE_SIZE}
+        if position is not None:
+            # only the outputs above this block height
+            params["after"] = position - 1
+        deposits = []
+        positions = [] if position is None else [position]
+        while True:
+            data = await CryptoApiManager.fetch_api_request(url, params=params)
+            txrefs = data.get('txrefs', [])
+            is_last_page = data.get('hasMore') is not True or len(txrefs) == 0
+            if is_last_page is False:
+                boundary = txrefs[-1]['block_height']
+                if txrefs[0]['block_height'] == boundary and params["limit"] < BLOCKCYPHER_MAX_PAGE_SIZE:
+                    # a single block fills the page, asked again with a larger one
+                    params["limit"] = min(params["limit"] * 2, BLOCKCYPHER_MAX_PAGE_SIZE)
+                    continue
+                if txrefs[0]['block_height'] == boundary:
+                    params["before"] = boundary
+                else:
+                    txrefs = [deposit for deposit in txrefs if deposit['block_height'] != boundary]
+                    params["before"] = boundary + 1
+                params["limit"] = HISTORY_PAGE_SIZE
+            txrefs = [deposit for deposit in txrefs if deposit['confirmations'] > 0]
+            positions.extend(deposit['block_height'] for deposit in txrefs)
+            deposits.extend(DepositDTO(tx_id=deposit['tx_hash'],
+                                       user_id=user_dto.id,
+                                       network='LTC',
+                                       amount=deposit['value'],
+                                       vout=deposit['tx_output_n'])
+                            for deposit in txrefs)
+            if is_last_page:
+                return deposits, max(positions, default=None)
 
     @staticmethod
-    async def get_sol_balance(user_dto: UserDTO, deposits) -> float:
+    async def get_sol_deposits(user_dto: UserDTO, position: int | None) -> tuple[list[DepositDTO], int | None]:
+        # solana.fm pages the transfers by page number. The time range is fixed when the scan starts,
+        # so the transfers made meanwhile don't shift the pages, and a transfer seen twice is kept once.
         url = f"https://api.solana.fm/v0/accounts/{user_dto.sol_address}/transfers"
-        data = await CryptoApiManager.fetch_api_request(url)
-        deposits = [deposit.tx_id for deposit in deposits if deposit.network == "SOL"]
-        deposits_sum = 0.0
-        if len(data['results']) > 0:
+        params = {"utcTo": int(datetime.now().timestamp()), "page": 1}
+        if position is not None:
+            params["utcFrom"] = position
+        transfers = {}
+        while True:
+            data = await CryptoApiManager.fetch_api_request(url, params)
             for deposit in data['results']:
-                if deposit['transactionHash'] not in deposits:
-                    for transfer in deposit['data']:
-                        if transfer['action'] == 'transfer' and transfer['destination'] == user_dto.sol_address and \
-                                transfer[
-                                    'status'] == 'Successful' and transfer['token'] == '':
-                            deposit_dto = DepositDTO(
-                                tx_id=deposit['transactionHash'],
-                                user_id=user_dto.id,
-                                network='SOL',
-                                amount=transfer['amount'],
-                                vout=transfer['instructionIndex']
-                            )
-                            await DepositService.create(deposit_dto)
-                            deposits_sum += float(transfer['amount'] / 1_000_000_000)
-        return deposits_sum
+                for transfer in deposit['data']:
+                    if transfer['action'] == 'transfer' and transfer['destination'] == user_dto.sol_address and \
+                            transfer['status'] == 'Successful' and transfer['token'] == '':
+                        transfers[(deposit['transactionHash'], transfer['instructionIndex'])] = transfer
+            if params["page"] >= data.get('pagination', {}).get('totalPages', 1):
+                break
+            params["page"] += 1
+        positions = [] if position is None else [position]
+        positions.extend(transfer['timestamp'] for transfer in transfers.values())
+        return [DepositDTO(tx_id=tx_id,
+                           user_id=user_dto.id,
+                           network='SOL',
+                           amount=transfer['amount'],
+                           vout=instruction_index)
+                for (tx_id, instruction_index), transfer in transfers.items()], max(positions, default=None)
 
     @staticmethod
-    async def get_usdt_trc20_balance(user_dto: UserDTO, deposits) -> float:
+    def get_token_deposits(user_dto: UserDTO, chain: str, transfers: list[tuple[str, str, str]]) -> list[DepositDTO]:
+        # The token transfers to the address as (tx_id, contract, value) in the provider's order. The providers
+        # don't return the log index, so the transfers of one transaction are numbered in that order instead,
+        # e.g. USDT and USDC sent in one batch are two deposits. The fetchers pass every transfer of a
+        # transaction exactly once, never a page cut through its block, so the number is the transfer's
+        # position in the transaction and the same on every scan. The transfers of other tokens are skipped.
+        tokens = Cryptocurrency.get_tokens(chain)
+        transfers_per_tx = defaultdict(int)
+        deposits = []
+        for tx_id, contract, value in transfers:
+            vout = transfers_per_tx[tx_id]
+            transfers_per_tx[tx_id] += 1
+            if contract.lower() in tokens:
+                deposits.append(DepositDTO(tx_id=tx_id,
+                                           user_id=user_dto.id,
+                                           network=chain,
+                                           token_name=tokens[contract.lower()].value,
+                                           amount=value,
+                                           vout=vout))
+        return deposits
+
+    @staticmethod
+    async def get_trc20_deposits(user_dto: UserDTO, position: int | None) -> tuple[list[DepositDTO], int | None]:
+        # One history call for every registered TRC20 token.
+        # Oldest first from the position, so a backlog longer than a page is caught up by the next scans.
+        if position is None:
+            position = int((datetime.now() - timedelta(hours=TRC20_FIRST_SCAN_HOURS)).timestamp()) * 1000
         url = f"https://api.trongrid.io/v1/accounts/{user_dto.trx_address}/transactions/trc20"
         params = {"only_confirmed": "true",
-                  "min_timestamp": CryptoApiManager.min_timestamp,
-                  "contract_address": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
-                  "only_to": "true"}
+                  "min_timestamp": position,
+                  "only_to": "true",
+                  "order_by": "block_timestamp,asc",
+                  "limit": 200}
         data = await CryptoApiManager.fetch_api_request(url, params=params)
-        deposits = [deposit.tx_id for deposit in deposits if
-                    deposit.network == "TRX" and deposit.token_name == "USDT_TRC20"]
-        deposits_sum = 0.0
-        for deposit in data['data']:
-            if deposit['transaction_id'] not in deposits:
-                deposit_dto = DepositDTO(
-                    tx_id=deposit['transaction_id'],
-                    user_id=user_dto.id,
-                    network='TRX',
-                    token_name='USDT_TRC20',
-                    amount=deposit['value'],
-                )
-                await DepositService.create(deposit_dto)
-                deposits_sum += float(deposit['value']) / pow(10, deposit['token_info']['decimals'])
-        return deposits_sum
+        deposits = data['data']
+        if len(deposits) == params["limit"]:
+            # A full page may cut through the transfers of its last block, the next scan starts with that block
+            boundary = deposits[-1]['block_timestamp']
+            if deposits[0]['block_timestamp'] != boundary:
+                deposits = [deposit for deposit in deposits if deposit['block_timestamp'] != boundary]
+                position = boundary
+            else:
+                # more transfers in one block than trongrid returns at once, the scans move on past it
+                position = boundary + 1
+        transfers = [(deposit['transaction_id'], deposit['token_info']['address'], deposit['value'])
+                     for deposit in deposits]
+        return CryptoApiManager.get_token_deposits(user_dto, "TRX", transfers), \
+            max([position, *(deposit['block_timestamp'] for deposit in deposits)])
 
     @staticmethod
-    async def get_usdt_erc20_balance(user_dto: UserDTO, deposits) -> float:
-        # TODO(Combine the function to obtain erc20 tokens.)
+    async def get_erc20_deposits(user_dto: UserDTO, position: int | None) -> tuple[list[DepositDTO], int | None]:
+        # One history call for every registered ERC20 token. ethplorer pages the operations newest first,
+        # up to and including a timestamp. A page may cut through the operations of its last second, so that
+        # second is left out and fetched again in full at the start of the next page.
         url = f'https://api.ethplorer.io/getAddressHistory/{user_dto.eth_address}'
         params = {
             "type": "transfer",
-            "token": "0xdAC17F958D2ee523a2206206994597C13D831ec7",
             "apiKey": config.ETHPLORER_API_KEY,
-            "limit": 1000
+            "limit": HISTORY_PAGE_SIZE
         }
-        data = await CryptoApiManager.fetch_api_request(url, params)
-        deposits = [deposit.tx_id for deposit in deposits if
-                    deposit.network == "ETH" and deposit.token_name == "USDT_ERC20"]
-        deposits_sum = 0.0
-        for deposit in data['operations']:
-            if deposit['transactionHash'] not in deposits and deposit['to'] == user_dto.eth_address:
-                deposit_dto = DepositDTO(
-                    tx_id=deposit['transactionHash'],
-                    user_id=user_dto.id,
-                    network='ETH',
-                    token_name='USDT_ERC20',
-                    amount=deposit['value']
-                )
-                await DepositService.create(deposit_dto)
-                deposits_sum += float(deposit['value']) / pow(10, 6)
-        return deposits_sum
+        transfers = []
+        positions = [] if position is None else [position]
+        while True:
+            data = await CryptoApiManager.fetch_api_request(url, params)
+            operations = data['operations']
+            is_last_page = len(operations) < params["limit"]
+            if position is not None and len(operations) > 0 and operations[-1]['timestamp'] < position:
+                operations = [operation for operation in operations if operation['timestamp'] >= position]
+                is_last_page = True
+            if is_last_page is False:
+                boundary = operations[-1]['timestamp']
+                if operations[0]['timestamp'] == boundary and params["limit"] < ETHPLORER_MAX_PAGE_SIZE:
+                    # a single second fills the page, asked again with a larger one
+                    params["limit"] = min(params["limit"] * 2, ETHPLORER_MAX_PAGE_SIZE)
+                    continue
+                if operations[0]['timestamp'] == boundary:
+                    params["timestamp"] = boundary - 1
+                else:
+                    operations = [operation for operation in operations if operation['timestamp'] != boundary]
+                    params["timestamp"] = boundary
+                params["limit"] = HISTORY_PAGE_SIZE
+            positions.extend(operation['timestamp'] for operation in operations)
+            transfers.extend((operation['transactionHash'], operation['tokenInfo']['address'], operation['value'])
+                             for operation in operations
+                             if operation['to'].lower() == user_dto.eth_address.lower())
+            if is_last_page:
+                return CryptoApiManager.get_token_deposits(user_dto, "ETH", transfers), max(positions, default=None)
 
     @staticmethod
-    async def get_usdc_erc20_balance(user_dto: UserDTO, deposits):
-        # TODO(Combine the function to obtain erc20 tokens.)
-        url = f'https://api.ethplorer.io/getAddressHistory/{user_dto.eth_address}'
-        params = {
-            "type": "transfer",
-            "token": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
-            "apiKey": config.ETHPLORER_API_KEY,
-            "limit": 1000
-        }
-        data = await CryptoApiManager.fetch_api_request(url, params)
-        deposits = [deposit.tx_id for deposit in deposits if
-                    deposit.network == "ETH" and deposit.token_name == "USDC_ERC20"]
-        deposits_sum = 0.0
-        for deposit in data['operations']:
-            if deposit['transactionHash'] not in deposits and deposit['to'] == user_dto.eth_address:
-                deposit_dto = DepositDTO(
-                    tx_id=deposit['transactionHash'],
-                    user_id=user_dto.id,
-                    network='ETH',
-                    token_name='USDC_ERC20',
-                    amount=deposit['value']
-                )
-                await DepositService.create(deposit_dto)
-                deposits_sum += float(deposit['value']) / pow(10, 6)
-        return deposits_sum
+    def get_kraken_pair(cryptocurrency: Cryptocurrency) -> tuple[str, str]:
+        return cryptocurrency.get_symbol(), config.CURRENCY.value
+
+    @staticmethod
+    def get_kraken_price(response_json: dict, base: str, quote: str) -> float | None:
+        # Kraken answers with its own pair names, e.g. XXBTZUSD for BTCUSD or SOLUSD for SOLUSD
+        kraken_base = "XBT" if base == "BTC" else base
+        for pair in (f"{kraken_base}{quote}", f"X{kraken_base}Z{quote}", f"{kraken_base}Z{quote}"):
+            ticker = response_json.get('result', {}).get(pair)
+            if ticker is not None:
+                return float(ticker['c'][0])
+        return None
+
+    @staticmethod
+    async def fetch_crypto_prices() -> dict[Cryptocurrency, float]:
+        # One Ticker call for every pair, only when Kraken rejects the batch the pairs are asked one by one
+        pairs = {cryptocurrency: CryptoApiManager.get_kraken_pair(cryptocurrency) for cryptocurrency in Cryptocurrency}
+        url = "https://api.kraken.com/0/public/Ticker"
+        response_json = await CryptoApiManager.fetch_api_request(
+            url, {"pair": ",".join(sorted({base + quote for base, quote in pairs.values()}))})
+        if len(response_json['error']) > 0:
+            logging.warning(f"Kraken rejected the batched ticker request: {response_json['error']}")
+            unique_pairs = sorted(set(pairs.values()))
+            responses = await asyncio.gather(*[CryptoApiManager.fetch_api_request(url, {"pair": base + quote})
+                                               for base, quote in unique_pairs], return_exceptions=True)
+            response_json = {"result": {}}
+            for response in responses:
+                if isinstance(response, dict):
+                    response_json["result"].update(response.get("result", {}))
+        prices = {}
+        for cryptocurrency, (base, quote) in pairs.items():
+            price = CryptoApiManager.get_kraken_price(response_json, base, quote)
+            if price is not None:
+                prices[cryptocurrency] = price
+        return prices
 
     @staticmethod
-    async def get_crypto_prices(cryptocurrency: Cryptocurrency) -> float:
-        match cryptocurrency:
-            case cryptocurrency.USDT_TRC20 | cryptocurrency.USDT_ERC20:
-                url = f'https://api.kraken.com/0/public/Ticker?pair=USDT{config.CURRENCY.value}'
-                response_json = await CryptoApiManager.fetch_api_request(url)
-            case cryptocurrency.USDC_ERC20:
-                url = f"https://api.kraken.com/0/public/Ticker?pair=USDC{config.CURRENCY.value}"
-                response_json = await CryptoApiManager.fetch_api_request(url)
-            case _:
-                url = f"https://api.kraken.com/0/public/Ticker?pair={cryptocurrency.value}{config.CURRENCY.value}"
-                response_json = await CryptoApiManager.fetch_api_request(url)
-        return float(next(iter(response_json['result'].values()))['c'][0])
+    async def get_crypto_quote(cryptocurrency: Cryptocurrency) -> PriceQuote:
+        # The quote is flagged as stale when the provider is down and the last known price is served
+        return await PriceCache.get_quote(cryptocurrency, CryptoApiManager.fetch_crypto_prices)
 
     @staticmethod
-    async def get_new_deposits_amount(user_dto: UserDTO, cryptocurrency: Cryptocurrency):
-        deposits = await DepositService.get_by_user_dto(user_dto)
-        match cryptocurrency:
-            case Cryptocurrency.BTC:
-                return await CryptoApiManager.get_new_btc_deposits(user_dto, deposits)
-            case Cryptocurrency.LTC:
-                return await CryptoApiManager.get_new_ltc_deposits(user_dto, deposits)
-            case Cryptocurrency.SOL:
-                return await CryptoApiManager.get_sol_balance(user_dto, deposits)
-            case Cryptocurrency.USDT_TRC20:
-                return await CryptoApiManager.get_usdt_trc20_balance(user_dto, deposits)
-            case Cryptocurrency.USDT_ERC20:
-                return await CryptoApiManager.get_usdt_erc20_balance(user_dto, deposits)
-            case Cryptocurrency.USDC_ERC20:
-                return await CryptoApiManager.get_usdc_erc20_balance(user_dto, deposits)
+    async def get_deposits(user_dto: UserDTO, chain: str, position: int | None) \
+            -> tuple[list[DepositDTO], int | None]:
+        # The confirmed deposits to the user's address on the chain from the position on, for the coin
+        # and every registered token of the chain. The new ones are picked by the caller.
+        match chain:
+            case "BTC":
+                return await CryptoApiManager.get_btc_deposits(user_dto, position)
+            case "LTC":
+                return await CryptoApiManager.get_ltc_deposits(user_dto, position)
+            case "SOL":
+                return await CryptoApiManager.get_sol_deposits(user_dto, position)
+            case "TRX":
+                return await CryptoApiManager.get_trc20_deposits(user_dto, position)
+            case "ETH":
+                return await CryptoApiManager.get_erc20_deposits(user_dto, position)
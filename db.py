@@ -1,14 +1,19 @@
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import partial
 from pathlib import Path
 from typing import Any
 
-from sqlalchemy import event, Engine, text, create_engine, Result, CursorResult
+import aiosqlite
+from sqlalchemy import event, Engine, text, Result, CursorResult
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 import config
 from config import DB_NAME
+from migrations import run_migrations
 from models.base import Base
+from utils.sql_profiler import SQLProfiler
 
 if config.DB_ENCRYPTION:
     # Installing sqlcipher3 on windows has some difficulties,
@@ -19,6 +24,7 @@ Imports of these models are needed to correctly create tables in the database.
 For more information see https://stackoverflow.com/questions/7478403/sqlalchemy-classes-across-files
 """
 from models.item import Item
+from models.inventorySummary import InventorySummary
 from models.cart import Cart
 from models.cartItem import CartItem
 from models.user import User
@@ -27,96 +33,172 @@ from models.buyItem import BuyItem
 from models.category import Category
 from models.subcategory import Subcategory
 from models.deposit import Deposit
+from models.depositWatch import DepositWatch
+from models.depositCursor import DepositCursor
 
-url = ""
-engine = None
-session_maker = None
+
+async def create_sqlcipher_connection() -> aiosqlite.Connection:
+    # aiosqlite runs every connection in its own worker thread, so sqlcipher I/O and the expensive key
+    # derivation never block the event loop. The key is applied once here and the connection is pooled.
+    connection = aiosqlite.Connection(partial(sqlcipher.connect, f"data/{DB_NAME}"), iter_chunk_size=64)
+    # same as the aiosqlite dialect does, a pooled connection must not keep the process alive on shutdown
+    connection.daemon = True
+    await connection
+    db_pass = config.DB_PASS.replace("'", "''")
+    await connection.execute(f"PRAGMA key = '{db_pass}'")
+    return connection
+
+
+url = f"sqlite+aiosqlite:///data/{DB_NAME}"
+engine_kwargs = {}
 if config.DB_ENCRYPTION:
-    url += f"sqlite+pysqlcipher://:{config.DB_PASS}@/data/{DB_NAME}"
-    engine = create_engine(url, echo=True, module=sqlcipher)
-    session_maker = sessionmaker(engine, expire_on_commit=False)
-else:
-    url += f"sqlite+aiosqlite:///data/{DB_NAME}"
-    engine = create_async_engine(url, echo=True)
-    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    engine_kwargs["async_creator"] = create_sqlcipher_connection
+# All writes go through a single pooled connection, so checkout commits are serialized in-process
+# instead of fighting over the SQLite write lock. Browse and statistics queries use a separate
+# pool of read-only connections which, thanks to WAL, never wait for the writer.
+engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0,
+                             **engine_kwargs)
+session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+reader_engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool,
+                                    pool_size=config.DB_READ_POOL_SIZE, max_overflow=0, **engine_kwargs)
+reader_session_maker = async_sessionmaker(reader_engine, class_=AsyncSession, expire_on_commit=False)
+if config.SQL_PROFILING:
+    SQLProfiler.enable()
 
 data_folder = Path("data")
 if data_folder.exists() is False:
     data_folder.mkdir()
 
 
+class UnitOfWork:
+    # One writer session/transaction shared by every repository call made while handling a Telegram update.
+    # The session is opened lazily on the first write, so read-only updates never occupy the single writer
+    # connection, and it is committed once by UnitOfWorkMiddleware when the update is handled.
+
+    def __init__(self):
+        self.session: AsyncSession | None = None
+
+    async def get_session(self) -> AsyncSession:
+        if self.session is None:
+            self.session = session_maker()
+        return self.session
+
+    async def commit(self):
+        if self.session is not None:
+            try:
+                await self.session.commit()
+            finally:
+                await self.close()
+
+    async def rollback(self):
+        if self.session is not None:
+            try:
+                await self.session.rollback()
+            finally:
+                await self.close()
+
+    async def close(self):
+        session = self.session
+        self.session = None
+        await session.close()
+
+
+current_unit_of_work: ContextVar[UnitOfWork | None] = ContextVar("current_unit_of_work", default=None)
+
+
+async def commit_unit_of_work():
+    # Commits the pending writes of the current update early and releases the writer connection.
+    # Called before network round trips, so the SQLite write lock is never held while waiting on them.
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is not None:
+        await unit_of_work.commit()
+
+
 @asynccontextmanager
-async def get_db_session() -> AsyncSession | Session:
-    session = None
-    try:
-        if config.DB_ENCRYPTION:
-            with session_maker() as sync_session:
-                session = sync_session
-                yield session
-        else:
-            async with session_maker() as async_session:
-                session = async_session
-                yield session
-    finally:
-        if isinstance(session, AsyncSession):
-            await session.close()
-        elif isinstance(session, Session):
-            session.close()
-
-
-async def session_execute(stmt, session: AsyncSession | Session) -> Result[Any] | CursorResult[Any]:
-    if isinstance(session, AsyncSession):
-        query_result = await session.execute(stmt)
-        return query_result
+async def get_db_session(read_only: bool = False) -> AsyncSession:
+    unit_of_work = current_unit_of_work.get()
+    # Reads join the ambient transaction only once it has written something, so they see its own changes
+    if unit_of_work is not None and (read_only is False or unit_of_work.session is not None):
+        yield await unit_of_work.get_session()
     else:
-        query_result = session.execute(stmt)
-        return query_result
+        maker = reader_session_maker if read_only else session_maker
+        async with maker() as session:
+            yield session
 
 
-async def session_refresh(session: AsyncSession | Session, instance: object) -> None:
-    if isinstance(session, AsyncSession):
-        await session.refresh(instance)
-    else:
-        session.refresh(instance)
+async def session_execute(stmt, session: AsyncSession,
+                          params: list[dict[str, Any]] | None = None) -> Result[Any] | CursorResult[Any]:
+    # With a list of params the statement is run executemany-style, prepared once for all rows
+    query_result = await session.execute(stmt, params)
+    return query_result
 
 
-async def session_commit(session: AsyncSession | Session) -> None:
-    if isinstance(session, AsyncSession):
+def chunked(values: list, size: int = None) -> list[list]:
+    # Splits the values of an IN (...) list so one statement never exceeds the bound parameters limit
+    size = size or SQLITE_MAX_VARIABLE_NUMBER
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+async def session_refresh(session: AsyncSession, instance: object) -> None:
+    await session.refresh(instance)
+
+
+async def session_commit(session: AsyncSession) -> None:
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is not None and unit_of_work.session is session:
+        # the unit of work commits once at the end of the update, until then only flush to get ids and defaults
+        await session.flush()
+    else:
         await session.commit()
+
+
+async def session_rollback(session: AsyncSession) -> None:
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is not None and unit_of_work.session is session:
+        # discards every pending write of the update and releases the writer connection
+        await unit_of_work.rollback()
     else:
-        session.commit()
+        await session.rollback()
+
+
+# SQLite storage profile, mmap_size is in bytes, a negative cache_size is in KiB, busy_timeout is in ms
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_CACHE_SIZE = -64 * 1024
+SQLITE_BUSY_TIMEOUT = 5000
+# The lowest default limit of bound parameters per statement, older SQLite and sqlcipher builds use 999
+SQLITE_MAX_VARIABLE_NUMBER = 999
 
 
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
     cursor.close()
 
 
-async def check_all_tables_exist(session: AsyncSession | Session):
-    for table in Base.metadata.tables.values():
-        sql_query = f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table.name}';"
-        if isinstance(session, AsyncSession):
-            result = await session.execute(text(sql_query))
-            if result.scalar() is None:
-                return False
-        else:
-            result = session.execute(text(sql_query))
-            if result.scalar() is None:
-                return False
-    return True
+def set_read_only_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+event.listen(reader_engine.sync_engine, "connect", set_read_only_pragma)
+
+
+# Moves the WAL content into the main database file, e.g. before sending the file to an admin
+async def wal_checkpoint():
+    await commit_unit_of_work()
+    async with session_maker() as session:
+        await session_execute(text("PRAGMA wal_checkpoint(TRUNCATE)"), session)
 
 
 async def create_db_and_tables():
-    async with get_db_session() as session:
-        if await check_all_tables_exist(session):
-            pass
-        else:
-            if isinstance(session, AsyncSession):
-                async with engine.begin() as conn:
-                    await conn.run_sync(Base.metadata.drop_all)
-                    await conn.run_sync(Base.metadata.create_all)
-            else:
-                Base.metadata.drop_all(bind=engine)
-                Base.metadata.create_all(bind=engine)
+    # create_all only creates the missing tables, existing tables and data are never dropped
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
@@ -1,5 +1,10 @@
 from enum import Enum
 
+import config
+
+# The coins are native to their own chain, the tokens are described by the token registry in config.TOKENS
+COIN_DECIMALS = {"BTC": 8, "LTC": 8, "SOL": 9}
+
 
 class Cryptocurrency(Enum):
     BTC = "BTC"
@@ -9,30 +14,30 @@ class Cryptocurrency(Enum):
     USDT_ERC20 = "USDT_ERC20"
     USDC_ERC20 = "USDC_ERC20"
 
+    def get_token(self) -> dict | None:
+        return config.TOKENS.get(self.value)
+
+    def get_chain(self) -> str:
+        token = self.get_token()
+        return self.value if token is None else token["chain"]
+
+    def get_symbol(self) -> str:
+        token = self.get_token()
+        return self.value if token is None else token["symbol"]
+
     def get_balance_field(self) -> str:
-        match self:
-            case Cryptocurrency.BTC:
-                return "btc_balance"
-            case Cryptocurrency.LTC:
-                return "ltc_balance"
-            case Cryptocurrency.SOL:
-                return "sol_balance"
-            case Cryptocurrency.USDT_TRC20:
-                return "usdt_trc20_balance"
-            case Cryptocurrency.USDT_ERC20:
-                return "usdt_erc20_balance"
-            case Cryptocurrency.USDC_ERC20:
-                return "usdc_erc20_balance"
+        return f"{self.value.lower()}_balance"
 
     def get_address_field(self) -> str:
-        match self:
-            case Cryptocurrency.BTC:
-                return "btc_address"
-            case Cryptocurrency.LTC:
-                return "ltc_address"
-            case Cryptocurrency.SOL:
-                return "sol_address"
-            case Cryptocurrency.USDT_TRC20:
-                return "trx_address"
-            case _:
-                return "eth_address"
+        return f"{self.get_chain().lower()}_address"
+
+    def get_decimals(self) -> int:
+        # The deposits are stored in the smallest unit of the coin or token
+        token = self.get_token()
+        return COIN_DECIMALS[self.value] if token is None else token["decimals"]
+
+    @staticmethod
+    def get_tokens(chain: str) -> dict[str, 'Cryptocurrency']:
+        # The registered tokens of a chain by their lowercase contract address
+        return {token["contract"].lower(): Cryptocurrency(name) for name, token in config.TOKENS.items()
+                if token["chain"] == chain}
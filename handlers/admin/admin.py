@@ -1,18 +1,24 @@
 import inspect
 from aiogram import types, Router, F
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from callbacks import AdminMenuCallback, AdminAnnouncementCallback, AdminInventoryManagementCallback, \
-    UserManagementCallback, StatisticsCallback, WalletCallback
+from callbacks import AdminMenuCallback
 from enums.bot_entity import BotEntity
 from handlers.admin.announcement import announcement_router
 from handlers.admin.inventory_management import inventory_management
 from handlers.admin.statistics import statistics
 from handlers.admin.user_management import user_management
 from handlers.admin.wallet import wallet
+from services.admin import AdminService
+from services.item import ItemService
+from utils.catalog_cache import CatalogCache
 from utils.custom_filters import AdminIdFilter
+from utils.http_client import HttpClient
+from utils.keyboard_cache import KeyboardCache
 from utils.localizator import Localizator
+from utils.price_cache import PriceCache
+from utils.sql_profiler import SQLProfiler
 
 admin_router = Router()
 admin_router.include_router(announcement_router)
@@ -27,26 +33,50 @@ async def admin_command_handler(message: types.message):
     await admin(message)
 
 
+@admin_router.message(Command("sql_profiling"), AdminIdFilter())
+async def sql_profiling_command_handler(message: types.message, command: CommandObject):
+    match command.args:
+        case "on":
+            SQLProfiler.enable()
+        case "off":
+            SQLProfiler.disable()
+        case "reset":
+            SQLProfiler.reset()
+    await message.answer(SQLProfiler.get_report())
+
+
+@admin_router.message(Command("catalog_cache"), AdminIdFilter())
+async def catalog_cache_command_handler(message: types.message, command: CommandObject):
+    match command.args:
+        case "reset":
+            CatalogCache.reset_stats()
+            KeyboardCache.reset_stats()
+        case "clear":
+            CatalogCache.invalidate()
+    await message.answer(CatalogCache.get_report() + "\n\n" + KeyboardCache.get_report())
+
+
+@admin_router.message(Command("http_stats"), AdminIdFilter())
+async def http_stats_command_handler(message: types.message, command: CommandObject):
+    if command.args == "reset":
+        HttpClient.reset()
+        PriceCache.reset_stats()
+    await message.answer(HttpClient.get_report() + PriceCache.get_report())
+
+
+@admin_router.message(Command("rebuild_inventory"), AdminIdFilter())
+async def rebuild_inventory_command_handler(message: types.message):
+    msg = await ItemService.rebuild_inventory_summary()
+    await message.answer(msg)
+
+
 async def admin(message: Message | CallbackQuery):
-    admin_menu_builder = InlineKeyboardBuilder()
-    admin_menu_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "announcements"),
-                              callback_data=AdminAnnouncementCallback.create(level=0))
-    admin_menu_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "inventory_management"),
-                              callback_data=AdminInventoryManagementCallback.create(level=0))
-    admin_menu_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "user_management"),
-                              callback_data=UserManagementCallback.create(level=0))
-    admin_menu_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "statistics"),
-                              callback_data=StatisticsCallback.create(level=0))
-    admin_menu_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "crypto_withdraw"),
-                              callback_data=WalletCallback.create(level=0))
-    admin_menu_builder.adjust(2)
+    msg, kb_markup = await AdminService.get_admin_menu()
     if isinstance(message, Message):
-        await message.answer(Localizator.get_text(BotEntity.ADMIN, "menu"),
-                             reply_markup=admin_menu_builder.as_markup())
+        await message.answer(msg, reply_markup=kb_markup)
     elif isinstance(message, CallbackQuery):
         callback = message
-        await callback.message.edit_text(Localizator.get_text(BotEntity.ADMIN, "menu"),
-                                         reply_markup=admin_menu_builder.as_markup())
+        await callback.message.edit_text(msg, reply_markup=kb_markup)
 
 
 @admin_router.callback_query(AdminIdFilter(), AdminMenuCallback.filter())
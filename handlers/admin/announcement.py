@@ -15,8 +15,8 @@ announcement_router = Router()
 
 
 async def announcement_menu(callback: CallbackQuery):
-    msg, kb_builder = await AdminService.get_announcement_menu()
-    await callback.message.edit_text(text=msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await AdminService.get_announcement_menu()
+    await callback.message.edit_text(text=msg, reply_markup=kb_markup)
 
 
 async def send_everyone(callback: CallbackQuery, state: FSMContext):
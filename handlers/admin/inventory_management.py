@@ -18,8 +18,8 @@ inventory_management = Router()
 
 async def inventory_management_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
-    msg, kb_builder = await AdminService.get_inventory_management_menu()
-    await callback.message.edit_text(text=msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await AdminService.get_inventory_management_menu()
+    await callback.message.edit_text(text=msg, reply_markup=kb_markup)
 
 
 async def add_items(callback: CallbackQuery, state: FSMContext):
@@ -5,6 +5,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
 import config
 from callbacks import StatisticsCallback
+from db import wal_checkpoint
 from services.admin import AdminService
 from utils.custom_filters import AdminIdFilter
 
@@ -13,8 +14,8 @@ statistics = Router()
 
 async def statistics_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
-    msg, kb_builder = await AdminService.get_statistics_menu()
-    await callback.message.edit_text(text=msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await AdminService.get_statistics_menu()
+    await callback.message.edit_text(text=msg, reply_markup=kb_markup)
 
 
 async def timedelta_picker(callback: CallbackQuery):
@@ -29,6 +30,7 @@ async def entity_statistics(callback: CallbackQuery):
 
 async def get_db_file(callback: CallbackQuery):
     await callback.answer()
+    await wal_checkpoint()
     with open(f"./data/{config.DB_NAME}", "rb") as f:
         await callback.message.bot.send_document(callback.from_user.id,
                                                  types.BufferedInputFile(file=f.read(), filename="database.db"))
@@ -17,8 +17,8 @@ user_management = Router()
 
 async def user_management_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
-    msg, kb_builder = await AdminService.get_user_management_menu()
-    await callback.message.edit_text(text=msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await AdminService.get_user_management_menu()
+    await callback.message.edit_text(text=msg, reply_markup=kb_markup)
 
 
 async def credit_management(callback: CallbackQuery, state: FSMContext):
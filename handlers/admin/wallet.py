@@ -13,13 +13,13 @@ wallet = Router()
 
 async def wallet_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
-    msg, kb_builder = await AdminService.get_wallet_menu()
-    await callback.message.edit_text(text=msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await AdminService.get_wallet_menu()
+    await callback.message.edit_text(text=msg, reply_markup=kb_markup)
 
 
 async def withdraw_crypto(callback: CallbackQuery):
-    msg, kb_builder = await AdminService.get_withdraw_menu()
-    await callback.message.edit_text(text=msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await AdminService.get_withdraw_menu()
+    await callback.message.edit_text(text=msg, reply_markup=kb_markup)
 
 
 @wallet.callback_query(AdminIdFilter(), WalletCallback.filter())
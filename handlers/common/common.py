@@ -1,29 +1,40 @@
+import math
+
 from aiogram import types
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+import config
 from enums.bot_entity import BotEntity
 from utils.localizator import Localizator
+from utils.pagination import LAST_PAGE_CURSOR, get_next_cursor, get_previous_cursor
 
 
-async def add_pagination_buttons(keyboard_builder: InlineKeyboardBuilder, unpacked_cb, max_page_function,
-                                 back_button) -> InlineKeyboardBuilder:
-    maximum_page = await max_page_function
+def add_pagination_buttons(keyboard_builder: InlineKeyboardBuilder, unpacked_cb, total: int,
+                           back_button, page_keys: list[int]) -> InlineKeyboardBuilder:
+    maximum_page = math.ceil(total / config.PAGE_ENTRIES) - 1
     buttons = []
     if unpacked_cb.page > 0:
         back_page_callback = unpacked_cb.__copy__()
         back_page_callback.page -= 1
+        if back_page_callback.page > 0 and len(page_keys) > 0:
+            back_page_callback.cursor = get_previous_cursor(page_keys)
+        else:
+            back_page_callback.cursor = 0
         first_page_callback = unpacked_cb.__copy__()
         first_page_callback.page = 0
+        first_page_callback.cursor = 0
         buttons.append(
             types.InlineKeyboardButton(text=Localizator.get_text(BotEntity.COMMON, "pagination_first"),
                                        callback_data=first_page_callback.pack()))
         buttons.append(
             types.InlineKeyboardButton(text=Localizator.get_text(BotEntity.COMMON, "pagination_previous"),
                                        callback_data=back_page_callback.pack()))
-    if unpacked_cb.page < maximum_page:
+    if unpacked_cb.page < maximum_page and len(page_keys) > 0:
         last_page_callback = unpacked_cb.__copy__()
         last_page_callback.page = maximum_page
+        last_page_callback.cursor = LAST_PAGE_CURSOR
         unpacked_cb.page += 1
+        unpacked_cb.cursor = get_next_cursor(page_keys)
         buttons.append(
             types.InlineKeyboardButton(text=Localizator.get_text(BotEntity.COMMON, "pagination_next"),
                                        callback_data=unpacked_cb.pack()))
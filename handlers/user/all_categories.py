@@ -19,22 +19,22 @@ async def all_categories_text_message(message: types.message):
 
 async def all_categories(message: Message | CallbackQuery):
     if isinstance(message, Message):
-        msg, kb_builder = await CategoryService.get_buttons()
-        await message.answer(msg, reply_markup=kb_builder.as_markup())
+        msg, kb_markup = await CategoryService.get_buttons()
+        await message.answer(msg, reply_markup=kb_markup)
     elif isinstance(message, CallbackQuery):
         callback = message
-        msg, kb_builder = await CategoryService.get_buttons(callback)
-        await callback.message.edit_text(msg, reply_markup=kb_builder.as_markup())
+        msg, kb_markup = await CategoryService.get_buttons(callback)
+        await callback.message.edit_text(msg, reply_markup=kb_markup)
 
 
 async def show_subcategories_in_category(callback: CallbackQuery):
-    msg, kb_builder = await SubcategoryService.get_buttons(callback)
-    await callback.message.edit_text(msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await SubcategoryService.get_buttons(callback)
+    await callback.message.edit_text(msg, reply_markup=kb_markup)
 
 
 async def select_quantity(callback: CallbackQuery):
-    msg, kb_builder = await SubcategoryService.get_select_quantity_buttons(callback)
-    await callback.message.edit_text(msg, reply_markup=kb_builder.as_markup())
+    msg, kb_markup = await SubcategoryService.get_select_quantity_buttons(callback)
+    await callback.message.edit_text(msg, reply_markup=kb_markup)
 
 
 async def add_to_cart_confirmation(callback: CallbackQuery):
@@ -47,7 +47,7 @@ async def add_to_cart(callback: CallbackQuery):
     await callback.message.edit_text(text=Localizator.get_text(BotEntity.USER, "item_added_to_cart"))
 
 
-@all_categories_router.callback_query(AllCategoriesCallback.filter(), IsUserExistFilter())
+@all_categories_router.callback_query(AllCategoriesCallback.filter(), IsUserExistFilter(), flags={"user_lock": True})
 async def navigate_categories(call: CallbackQuery, callback_data: AllCategoriesCallback):
     current_level = callback_data.level
 
@@ -40,7 +40,7 @@ async def buy_processing(callback: CallbackQuery):
     await callback.message.edit_text(msg, reply_markup=kb_builder.as_markup())
 
 
-@cart_router.callback_query(CartCallback.filter(), IsUserExistFilter())
+@cart_router.callback_query(CartCallback.filter(), IsUserExistFilter(), flags={"user_lock": True})
 async def navigate_cart_process(callback: CallbackQuery, callback_data: CartCallback):
     current_level = callback_data.level
 
@@ -34,8 +34,8 @@ async def my_profile(message: Message | CallbackQuery):
 
 
 async def top_up_balance(callback: CallbackQuery):
-    msg_text, kb_builder = await UserService.get_top_up_buttons(callback)
-    await callback.message.edit_text(text=msg_text, reply_markup=kb_builder.as_markup())
+    msg_text, kb_markup = await UserService.get_top_up_buttons()
+    await callback.message.edit_text(text=msg_text, reply_markup=kb_markup)
 
 
 async def purchase_history(callback: CallbackQuery):
@@ -51,8 +51,6 @@ async def refresh_balance(callback: CallbackQuery):
             await my_profile(callback)
         case UserResponse.BALANCE_NOT_REFRESHED:
             await callback.answer(msg, show_alert=True)
-        case UserResponse.BALANCE_REFRESH_COOLDOWN:
-            await callback.answer(msg, show_alert=True)
 
 
 async def get_order_from_history(callback: CallbackQuery):
@@ -65,7 +63,7 @@ async def top_up_by_method(callback: CallbackQuery):
     await callback.message.edit_text(text=msg, reply_markup=kb_builder.as_markup())
 
 
-@my_profile_router.callback_query(MyProfileCallback.filter(), IsUserExistFilter())
+@my_profile_router.callback_query(MyProfileCallback.filter(), IsUserExistFilter(), flags={"user_lock": True})
 async def navigate(callback: CallbackQuery, callback_data: MyProfileCallback):
     current_level = callback_data.level
 
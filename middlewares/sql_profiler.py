@@ -0,0 +1,24 @@
+from typing import Callable, Awaitable, Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from utils.sql_profiler import SQLProfiler
+
+
+class SQLProfilerMiddleware(BaseMiddleware):
+    # Counts the SQL statements executed while one Telegram update is handled
+
+    async def __call__(self,
+                       handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+                       event: Update,
+                       data: dict[str, Any]) -> Any:
+        if SQLProfiler.is_enabled() is False:
+            return await handler(event, data)
+        update_query_count = [0]
+        token = SQLProfiler.update_query_count.set(update_query_count)
+        try:
+            return await handler(event, data)
+        finally:
+            SQLProfiler.update_query_count.reset(token)
+            SQLProfiler.record_update(update_query_count[0])
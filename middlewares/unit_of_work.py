@@ -0,0 +1,43 @@
+from typing import Callable, Awaitable, Any
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Update
+
+from db import UnitOfWork, current_unit_of_work, commit_unit_of_work
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    # Runs every repository call of one Telegram update in a single transaction,
+    # committed once when the update is handled or rolled back on error
+
+    async def __call__(self,
+                       handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+                       event: Update,
+                       data: dict[str, Any]) -> Any:
+        unit_of_work = UnitOfWork()
+        data["unit_of_work"] = unit_of_work
+        token = current_unit_of_work.set(unit_of_work)
+        try:
+            result = await handler(event, data)
+            await unit_of_work.commit()
+            return result
+        except BaseException:
+            await unit_of_work.rollback()
+            raise
+        finally:
+            current_unit_of_work.reset(token)
+
+
+class UnitOfWorkCommitMiddleware(BaseRequestMiddleware):
+    # Commits the pending writes before any Bot API call, so a user is never told about an uncommitted
+    # purchase and the SQLite write lock is not held during the Telegram round trip
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot,
+                       method: TelegramMethod[TelegramType]):
+        await commit_unit_of_work()
+        return await make_request(bot, method)
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Callable, Awaitable, Any, Hashable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery
+
+from db import commit_unit_of_work
+from utils.keyed_lock import KeyedLock
+
+
+class UserLockMiddleware(BaseMiddleware):
+    # Handles the callbacks of one telegram user one at a time where the handler is flagged with user_lock,
+    # so a double tap on "Confirm" or a webhook redelivered by Telegram can't run buy_processing,
+    # refresh_balance or add_to_cart twice concurrently. A duplicate of a callback that is still in flight
+    # (the same callback data on the same message) waits for the original and is dropped instead of repeating
+    # its work. The other handlers, e.g. the admin announcement that runs for minutes, are never held up.
+    # Registered as an inner callback_query middleware, only there the matched handler and its flags are known,
+    # so the update is committed before the lock is released.
+
+    def __init__(self):
+        self.user_locks = KeyedLock()
+        self.in_flight: dict[Hashable, asyncio.Future] = {}
+        self.collapsed_count = 0
+
+    @staticmethod
+    def get_duplicate_key(callback: CallbackQuery, bot_id: int) -> Hashable:
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        return bot_id, callback.from_user.id, message_id, callback.data
+
+    async def __call__(self,
+                       handler: Callable[[CallbackQuery, dict[str, Any]], Awaitable[Any]],
+                       event: CallbackQuery,
+                       data: dict[str, Any]) -> Any:
+        if get_flag(data, "user_lock") is not True:
+            return await handler(event, data)
+        duplicate_key = UserLockMiddleware.get_duplicate_key(event, data["bot"].id)
+        original = self.in_flight.get(duplicate_key)
+        if original is not None:
+            self.collapsed_count += 1
+            logging.info(f"Dropped a duplicate callback {event.id} of user {event.from_user.id}")
+            # answered anyway, otherwise the button keeps spinning in the client until it times out
+            with suppress(TelegramAPIError):
+                await event.answer()
+            await asyncio.shield(original)
+            return None
+        done = asyncio.get_running_loop().create_future()
+        self.in_flight[duplicate_key] = done
+        try:
+            async with self.user_locks.acquire(event.from_user.id):
+                result = await handler(event, data)
+                await commit_unit_of_work()
+                return result
+        finally:
+            del self.in_flight[duplicate_key]
+            done.set_result(None)
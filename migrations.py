@@ -0,0 +1,103 @@
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection
+
+"""
+Forward-only schema migrations, applied in order at startup after the missing tables are created.
+The number of the last applied migration is stored in the database with PRAGMA user_version.
+Never edit or reorder an applied migration, append a new one instead. SQLite DDL is not wrapped
+in a transaction by the driver, so every statement must be idempotent (IF NOT EXISTS etc.)
+and a migration interrupted halfway is simply applied again on the next start.
+SQLite has no ADD COLUMN IF NOT EXISTS, so ALTER TABLE ... ADD COLUMN is skipped when the column
+already exists, e.g. when create_all has just created the table from the current model.
+"""
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "Indexes for catalog browsing and checkout", [
+        # CategoryRepository, SubcategoryRepository and ItemRepository only look at unsold items
+        "CREATE INDEX IF NOT EXISTS ix_items_unsold_category_subcategory "
+        "ON items (category_id, subcategory_id) WHERE is_sold = 0",
+        "CREATE INDEX IF NOT EXISTS ix_items_unsold_subcategory ON items (subcategory_id) WHERE is_sold = 0",
+        "CREATE INDEX IF NOT EXISTS ix_items_new ON items (is_new) WHERE is_new = 1",
+        "CREATE INDEX IF NOT EXISTS ix_carts_user_id ON carts (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_cart_items_cart_id ON cart_items (cart_id)",
+    ]),
+    (2, "Indexes for purchase history, deposits and statistics", [
+        "CREATE INDEX IF NOT EXISTS ix_buys_buyer_id ON buys (buyer_id)",
+        "CREATE INDEX IF NOT EXISTS ix_buys_buy_datetime ON buys (buy_datetime)",
+        "CREATE INDEX IF NOT EXISTS ix_buyItem_buy_id ON buyItem (buy_id)",
+        "CREATE INDEX IF NOT EXISTS ix_buyItem_item_id ON buyItem (item_id)",
+        "CREATE INDEX IF NOT EXISTS ix_deposits_user_id_network ON deposits (user_id, network)",
+        "CREATE INDEX IF NOT EXISTS ix_deposits_deposit_datetime ON deposits (deposit_datetime)",
+        "CREATE INDEX IF NOT EXISTS ix_users_registered_at ON users (registered_at)",
+    ]),
+    (3, "Backfill inventory_summary from the unsold items", [
+        # The table itself is created by create_all, the price is the one of the newest unsold item
+        "INSERT OR REPLACE INTO inventory_summary (category_id, subcategory_id, unsold_count, price) "
+        "SELECT category_id, subcategory_id, COUNT(id), "
+        "(SELECT i.price FROM items i WHERE i.category_id = items.category_id "
+        "AND i.subcategory_id = items.subcategory_id AND i.is_sold = 0 ORDER BY i.id DESC LIMIT 1) "
+        "FROM items WHERE is_sold = 0 GROUP BY category_id, subcategory_id",
+        "CREATE INDEX IF NOT EXISTS ix_inventory_summary_subcategory_id ON inventory_summary (subcategory_id)",
+    ]),
+    (4, "Cart reservations", [
+        "ALTER TABLE items ADD COLUMN reserved_by INTEGER REFERENCES cart_items (id) ON DELETE SET NULL",
+        "ALTER TABLE items ADD COLUMN reserved_until DATETIME",
+        "ALTER TABLE inventory_summary ADD COLUMN reserved_count INTEGER NOT NULL DEFAULT 0",
+        # releasing a cart item's holds and sweeping the expired ones only look at the held items
+        "CREATE INDEX IF NOT EXISTS ix_items_reserved_by ON items (reserved_by) WHERE reserved_by IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_items_reserved_until ON items (reserved_until) "
+        "WHERE reserved_until IS NOT NULL",
+    ]),
+    (5, "One cart line per subcategory", [
+        # merge the duplicate lines into the oldest one before the unique index can be created
+        "UPDATE cart_items SET quantity = (SELECT SUM(c.quantity) FROM cart_items c "
+        "WHERE c.cart_id = cart_items.cart_id AND c.subcategory_id = cart_items.subcategory_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, subcategory_id HAVING COUNT(id) > 1)",
+        "DELETE FROM cart_items WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, subcategory_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_cart_items_cart_id_subcategory_id "
+        "ON cart_items (cart_id, subcategory_id)",
+        # the unique index also serves the lookups by cart_id
+        "DROP INDEX IF EXISTS ix_cart_items_cart_id",
+    ]),
+    (6, "Deposits unique per transaction output and network", [
+        # SQLite can't drop the old UNIQUE (tx_id) constraint, the table is rebuilt. The copy starts the
+        # transaction, so the copy, the swap and the new indexes are applied together or not at all.
+        "CREATE TABLE IF NOT EXISTS deposits_rebuild (id INTEGER NOT NULL PRIMARY KEY, tx_id VARCHAR NOT NULL, "
+        "user_id INTEGER NOT NULL REFERENCES users (id), network VARCHAR NOT NULL, token_name VARCHAR, "
+        "amount BIGINT NOT NULL, is_withdrawn BOOLEAN, vout INTEGER, deposit_datetime DATETIME)",
+        "INSERT OR IGNORE INTO deposits_rebuild (id, tx_id, user_id, network, token_name, amount, is_withdrawn, "
+        "vout, deposit_datetime) SELECT id, tx_id, user_id, network, token_name, amount, is_withdrawn, "
+        "COALESCE(vout, 0), deposit_datetime FROM deposits",
+        "DROP TABLE deposits",
+        "ALTER TABLE deposits_rebuild RENAME TO deposits",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_deposits_tx_id_vout_network ON deposits (tx_id, vout, network)",
+        "CREATE INDEX IF NOT EXISTS ix_deposits_user_id_network ON deposits (user_id, network)",
+        "CREATE INDEX IF NOT EXISTS ix_deposits_deposit_datetime ON deposits (deposit_datetime)",
+    ]),
+]
+ADD_COLUMN_PATTERN = re.compile(r"ALTER TABLE (\w+) ADD COLUMN (\w+)", re.IGNORECASE)
+
+
+async def is_applied(conn: AsyncConnection, statement: str) -> bool:
+    add_column = ADD_COLUMN_PATTERN.match(statement)
+    if add_column is None:
+        return False
+    table, column = add_column.groups()
+    columns = await conn.execute(text(f"PRAGMA table_info({table})"))
+    return column in [table_column.name for table_column in columns]
+
+
+async def run_migrations(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        current_version = (await conn.execute(text("PRAGMA user_version"))).scalar_one()
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        async with engine.begin() as conn:
+            for statement in statements:
+                if await is_applied(conn, statement) is False:
+                    await conn.execute(text(statement))
+            await conn.execute(text(f"PRAGMA user_version = {version}"))
+        logging.info(f"Applied migration {version}: {description}")
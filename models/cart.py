@@ -2,11 +2,14 @@
 # to be able to checkout this cart at once together with a shipment fee. Only the
 # quantity, category, subcategory is stored because the unique item is not yet sold
 #
-# note that the item is NOT reserved or blocked so that the availability of the item
-# needs to be checked again during checkout
+# with CART_RESERVATION_MINUTES set, adding to the cart also reserves the unsold items
+# until the reservation expires, otherwise the item is NOT reserved or blocked and
+# the availability of the item is checked again during checkout
 from pydantic import BaseModel
 from sqlalchemy import Column, Integer, ForeignKey
 from models.base import Base
+from models.cartItem import CartItemDTO
+from models.item import ItemDTO
 
 
 class Cart(Base):
@@ -19,3 +22,12 @@ class Cart(Base):
 class CartDTO(BaseModel):
     id: int | None = None
     user_id: int | None = None
+
+
+class CheckoutDTO(BaseModel):
+    # purchased_items[i] are the items sold for sold_items[i]
+    sold_items: list[CartItemDTO] = []
+    purchased_items: list[list[ItemDTO]] = []
+    out_of_stock: list[CartItemDTO] = []
+    is_enough_money: bool = True
+    consume_records: float | None = None
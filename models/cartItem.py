@@ -20,3 +20,12 @@ class CartItemDTO(BaseModel):
     category_id: int | None = None
     subcategory_id: int | None = None
     quantity: int | None = None
+
+
+class CartItemDetailsDTO(CartItemDTO):
+    # available_qty excludes every reservation, reserved_qty is what this cart line itself holds
+    category_name: str
+    subcategory_name: str
+    price: float
+    available_qty: int
+    reserved_qty: int
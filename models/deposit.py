@@ -1,15 +1,18 @@
 from datetime import datetime
 
 from pydantic import BaseModel
-from sqlalchemy import Integer, Column, String, ForeignKey, Boolean, BigInteger, DateTime, func
+from sqlalchemy import Integer, Column, String, ForeignKey, Boolean, BigInteger, DateTime, func, Index
 
 from models.base import Base
 
 
 class Deposit(Base):
     __tablename__ = 'deposits'
+    # A transaction can pay several outputs, a deposit is one output of a transaction on a network.
+    # Account based networks have no outputs, their deposits are stored with vout 0.
+    __table_args__ = (Index("ux_deposits_tx_id_vout_network", "tx_id", "vout", "network", unique=True),)
     id = Column(Integer, primary_key=True)
-    tx_id = Column(String, nullable=False, unique=True)
+    tx_id = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     network = Column(String, nullable=False)
     token_name = Column(String, nullable=True)
@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String, ForeignKey
+
+from models.base import Base
+
+
+# How far the deposit scans of an address have got, so the next scan only asks the provider for newer activity.
+# The position is a block height or a timestamp, depending on what the chain's provider can filter by.
+class DepositCursor(Base):
+    __tablename__ = "deposit_cursors"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    network = Column(String, primary_key=True)
+    position = Column(Integer, nullable=False)
+
+
+class DepositCursorDTO(BaseModel):
+    user_id: int | None = None
+    network: str | None = None
+    position: int | None = None
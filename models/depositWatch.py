@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+
+from models.base import Base
+
+
+# A user who asked for a top-up address, the deposit scanner checks that address until watch_until
+class DepositWatch(Base):
+    __tablename__ = "deposit_watches"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    cryptocurrency = Column(String, primary_key=True)
+    watch_until = Column(DateTime, nullable=False)
+    # NULL until the first scan, so a new or refreshed watch is picked up by the next scanner run
+    scanned_at = Column(DateTime, nullable=True)
+
+
+class DepositWatchDTO(BaseModel):
+    user_id: int | None = None
+    cryptocurrency: str | None = None
+    watch_until: datetime | None = None
+    scanned_at: datetime | None = None
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.ext.hybrid import hybrid_property
+
+from models.base import Base
+
+
+# Materialized stock per (category, subcategory), maintained by ItemRepository in the same
+# transaction as the item changes so browsing never has to scan the ever-growing items table
+class InventorySummary(Base):
+    __tablename__ = "inventory_summary"
+
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    subcategory_id = Column(Integer, ForeignKey("subcategories.id", ondelete="CASCADE"), primary_key=True)
+    unsold_count = Column(Integer, nullable=False, default=0)
+    # unsold items currently held by cart reservations, they are not offered to other users
+    reserved_count = Column(Integer, nullable=False, default=0, server_default="0")
+    price = Column(Float, nullable=False)
+    last_restock_at = Column(DateTime, nullable=True)
+
+    @hybrid_property
+    def available_count(self):
+        return self.unsold_count - self.reserved_count
+
+
+class InventorySummaryDTO(BaseModel):
+    category_id: int | None = None
+    subcategory_id: int | None = None
+    unsold_count: int | None = None
+    reserved_count: int | None = None
+    price: float | None = None
+    last_restock_at: datetime | None = None
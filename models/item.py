@@ -1,7 +1,8 @@
 from dataclasses import dataclass
+from datetime import datetime
 
 from pydantic import BaseModel
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime
 from sqlalchemy.orm import relationship, backref
 
 from models.base import Base
@@ -23,6 +24,9 @@ class Item(Base):
     is_sold = Column(Boolean, nullable=False, default=False)
     is_new = Column(Boolean, nullable=False, default=True)
     description = Column(String, nullable=False)
+    # cart reservation, an unsold item is held for the cart item until reserved_until
+    reserved_by = Column(Integer, ForeignKey("cart_items.id", ondelete="SET NULL"), nullable=True)
+    reserved_until = Column(DateTime, nullable=True)
 
 
 class ItemDTO(BaseModel):
@@ -34,3 +38,5 @@ class ItemDTO(BaseModel):
     is_sold: bool | None = None
     is_new: bool | None = None
     description: str | None = None
+    reserved_by: int | None = None
+    reserved_until: datetime | None = None
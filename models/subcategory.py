@@ -14,3 +14,18 @@ class Subcategory(Base):
 class SubcategoryDTO(BaseModel):
     id: int | None
     name: str | None
+
+
+class SubcategoryStockDTO(BaseModel):
+    id: int
+    name: str
+    price: float
+    available_qty: int
+
+
+class SubcategoryDetailsDTO(BaseModel):
+    category_name: str
+    subcategory_name: str
+    price: float
+    description: str
+    available_qty: int
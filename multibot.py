@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 from typing import Any, Dict
@@ -17,7 +18,14 @@ from aiogram.webhook.aiohttp_server import (
     setup_application,
 )
 from db import create_db_and_tables
+from middlewares.sql_profiler import SQLProfilerMiddleware
+from middlewares.unit_of_work import UnitOfWorkMiddleware, UnitOfWorkCommitMiddleware
+from middlewares.user_lock import UserLockMiddleware
+from services.cart import CartService
+from services.user import UserService
 from utils.custom_filters import AdminIdFilter
+from utils.http_client import HttpClient
+from utils.keyboard_cache import KeyboardCache
 
 main_router_multibot = Router()
 
@@ -30,6 +38,7 @@ MAIN_BOT_PATH = "/webhook/main"
 OTHER_BOTS_PATH = "/webhook/bot/{bot_token}"
 
 OTHER_BOTS_URL = f"{BASE_URL}{OTHER_BOTS_PATH}"
+background_tasks = set()
 
 
 def is_bot_token(value: str) -> bool | Dict[str, Any]:
@@ -55,6 +64,9 @@ async def command_add_bot(message: Message, command: CommandObject, bot: Bot) ->
 async def on_startup(dispatcher: Dispatcher, bot: Bot):
     await bot.set_webhook(f"{BASE_URL}{MAIN_BOT_PATH}")
     await create_db_and_tables()
+    await KeyboardCache.build_static_menus()
+    background_tasks.add(asyncio.create_task(CartService.run_reservation_sweeper()))
+    background_tasks.add(asyncio.create_task(UserService.run_deposit_scanner()))
     for admin in config.ADMIN_ID_LIST:
         try:
             await bot.send_message(admin, 'Bot is working')
@@ -65,6 +77,7 @@ async def on_startup(dispatcher: Dispatcher, bot: Bot):
 def main(main_router):
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
     session = AiohttpSession()
+    session.middleware(UnitOfWorkCommitMiddleware())
     bot_settings = {"session": session, "parse_mode": ParseMode.HTML}
     bot = Bot(token=MAIN_BOT_TOKEN, **bot_settings)
     storage = MemoryStorage()
@@ -72,8 +85,12 @@ def main(main_router):
     main_dispatcher = Dispatcher(storage=storage)
     main_dispatcher.include_router(main_router_multibot)
     main_dispatcher.startup.register(on_startup)
+    main_dispatcher.shutdown.register(HttpClient.close)
 
     multibot_dispatcher = Dispatcher(storage=storage)
+    multibot_dispatcher.update.outer_middleware(SQLProfilerMiddleware())
+    multibot_dispatcher.update.outer_middleware(UnitOfWorkMiddleware())
+    multibot_dispatcher.callback_query.middleware(UserLockMiddleware())
     multibot_dispatcher.include_router(main_router)
 
     app = web.Application()
@@ -1,68 +1,60 @@
 import datetime
-import math
 
-from sqlalchemy import select, func, update
+from sqlalchemy import select, func, update, insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-import config
 from callbacks import StatisticsTimeDelta
-from db import get_db_session, session_execute, session_commit, session_refresh
+from db import get_db_session, session_execute, session_commit
 from models.buy import Buy, BuyDTO, RefundDTO
 from models.buyItem import BuyItem
 from models.item import Item
 from models.subcategory import Subcategory
 from models.user import User
+from utils.pagination import paginate, sort_page, with_total, get_total
 
 
 class BuyRepository:
     @staticmethod
-    async def get_by_buyer_id(user_id: int, page: int) -> list[BuyDTO]:
-        stmt = select(Buy).where(Buy.buyer_id == user_id).limit(config.PAGE_ENTRIES).offset(
-            page * config.PAGE_ENTRIES)
-        async with get_db_session() as session:
+    async def get_by_buyer_id(user_id: int, cursor: int) -> list[BuyDTO]:
+        stmt = paginate(select(Buy).where(Buy.buyer_id == user_id), Buy.id, cursor)
+        async with get_db_session(read_only=True) as session:
             buys = await session_execute(stmt, session)
-            return [BuyDTO.model_validate(buy, from_attributes=True) for buy in buys.scalars().all()]
+            return [BuyDTO.model_validate(buy, from_attributes=True) for buy in sort_page(buys.scalars().all(), cursor)]
 
     @staticmethod
-    async def create(buy_dto: BuyDTO) -> int:
-        async with get_db_session() as session:
-            buy = Buy(**buy_dto.model_dump())
-            session.add(buy)
-            await session_commit(session)
-            await session_refresh(session, buy)
-            return buy.id
-
-    @staticmethod
-    async def get_max_refund_page():
-        stmt = select(func.count(Buy.id)).where(Buy.is_refunded == 0)
-        async with get_db_session() as session:
-            not_refunded_buys = await session_execute(stmt, session)
-            not_refunded_buys = not_refunded_buys.scalar_one()
-            if not_refunded_buys % config.PAGE_ENTRIES == 0:
-                return not_refunded_buys / config.PAGE_ENTRIES - 1
-            else:
-                return math.trunc(not_refunded_buys / config.PAGE_ENTRIES)
+    async def create_many(buy_dto_list: list[BuyDTO], session: AsyncSession) -> list[int]:
+        # One multi-row INSERT ... RETURNING. SQLite doesn't promise the order of the returned rows,
+        # but the rows of one INSERT get ascending rowids in the order of buy_dto_list.
+        stmt = insert(Buy).returning(Buy.id)
+        buy_ids = await session_execute(stmt, session, [buy_dto.model_dump(exclude_none=True)
+                                                        for buy_dto in buy_dto_list])
+        return sorted(buy_ids.scalars().all())
 
     @staticmethod
-    async def get_refund_data(page: int) -> list[RefundDTO]:
+    async def get_refund_data(cursor: int) -> tuple[list[RefundDTO], int]:
+        # One row per buy, so the page limit counts buys and not their items
+        subcategory_name = (select(Subcategory.name)
+                            .join(Item, Item.subcategory_id == Subcategory.id)
+                            .join(BuyItem, BuyItem.item_id == Item.id)
+                            .where(BuyItem.buy_id == Buy.id)
+                            .limit(1)
+                            .scalar_subquery())
         stmt = (select(Buy.total_price,
                        Buy.quantity,
                        Buy.id.label("buy_id"),
                        User.telegram_id,
                        User.telegram_username,
                        User.id.label("user_id"),
-                       Subcategory.name.label("subcategory_name"))
-                .join(BuyItem, BuyItem.buy_id == Buy.id)
+                       subcategory_name.label("subcategory_name"))
                 .join(User, User.id == Buy.buyer_id)
-                .join(Item, Item.id == BuyItem.item_id)
-                .join(Subcategory, Subcategory.id == Item.subcategory_id)
-                .where(Buy.is_refunded == False)
-                .distinct()
-                .limit(config.PAGE_ENTRIES)
-                .offset(config.PAGE_ENTRIES * page))
-        async with get_db_session() as session:
+                .where(Buy.is_refunded == False))
+        total_stmt = select(func.count(Buy.id)).where(Buy.is_refunded == False)
+        stmt = paginate(with_total(stmt, total_stmt), Buy.id, cursor)
+        async with get_db_session(read_only=True) as session:
             refund_data = await session_execute(stmt, session)
+            refund_data = refund_data.mappings().all()
             return [RefundDTO.model_validate(refund_item, from_attributes=True) for refund_item in
-                    refund_data.mappings().all()]
+                    sort_page(refund_data, cursor)], get_total(refund_data)
 
     @staticmethod
     async def get_refund_data_single(buy_id: int) -> RefundDTO:
@@ -79,7 +71,7 @@ class BuyRepository:
                 .join(Subcategory, Subcategory.id == Item.subcategory_id)
                 .where(Buy.is_refunded == False, Buy.id == buy_id)
                 .limit(1))
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             refund_data = await session_execute(stmt, session)
             return RefundDTO.model_validate(refund_data.mappings().one(), from_attributes=True)
 
@@ -107,6 +99,6 @@ class BuyRepository:
         timedelta = datetime.timedelta(days=timedelta.value)
         time_interval = current_time - timedelta
         stmt = select(Buy).where(Buy.buy_datetime >= time_interval, Buy.is_refunded == False)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             buys = await session_execute(stmt, session)
             return [BuyDTO.model_validate(buy, from_attributes=True) for buy in buys.scalars().all()]
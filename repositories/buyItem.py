@@ -1,5 +1,7 @@
-from sqlalchemy import select
-from db import get_db_session, session_execute, session_commit
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import get_db_session, session_execute
 from models.buyItem import BuyItem, BuyItemDTO
 
 
@@ -7,13 +9,11 @@ class BuyItemRepository:
     @staticmethod
     async def get_single_by_buy_id(buy_id: int):
         stmt = select(BuyItem).where(BuyItem.buy_id == buy_id).limit(1)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             item_subcategory = await session_execute(stmt, session)
             return BuyItemDTO.model_validate(item_subcategory.scalar(), from_attributes=True)
 
     @staticmethod
-    async def create_many(buy_item_dto_list: list[BuyItemDTO]):
-        async with get_db_session() as session:
-            for buy_item_dto in buy_item_dto_list:
-                session.add(BuyItem(**buy_item_dto.model_dump()))
-            await session_commit(session)
\ No newline at end of file
+    async def create_many(buy_item_dto_list: list[BuyItemDTO], session: AsyncSession):
+        await session_execute(insert(BuyItem), session, [buy_item_dto.model_dump(exclude={"id"})
+                                                         for buy_item_dto in buy_item_dto_list])
@@ -1,12 +1,24 @@
-from sqlalchemy import select, update
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
 
-from db import get_db_session, session_execute, session_commit, session_refresh
-from models.cart import Cart, CartDTO
-from models.cartItem import CartItemDTO, CartItem
+import config
+from db import get_db_session, session_execute, session_commit, session_refresh, session_rollback
+from models.buy import BuyDTO
+from models.buyItem import BuyItemDTO
+from models.cart import Cart, CartDTO, CheckoutDTO
+from models.cartItem import CartItemDTO, CartItem, CartItemDetailsDTO
+from repositories.buy import BuyRepository
+from repositories.buyItem import BuyItemRepository
 from repositories.cartItem import CartItemRepository
+from repositories.item import ItemRepository
+from models.user import User, UserDTO
+from repositories.user import UserRepository
 
 
 class CartRepository:
+    # Carts are never deleted, so the cart id of a telegram user can be cached for the lifetime of the process
+    _cart_ids: dict[int, int] = {}
+
     @staticmethod
     async def get_or_create(user_id: int):
         stmt = select(Cart).where(Cart.user_id == user_id)
@@ -23,21 +35,71 @@ class CartRepository:
                 return CartDTO.model_validate(cart, from_attributes=True)
 
     @staticmethod
-    async def add_to_cart(cart_item: CartItemDTO, cart: CartDTO):
+    async def get_id_by_telegram_id(telegram_id: int) -> int:
+        cart_id = CartRepository._cart_ids.get(telegram_id)
+        if cart_id is not None:
+            return cart_id
+        stmt = select(Cart.id).join(User, User.id == Cart.user_id).where(User.telegram_id == telegram_id)
+        async with get_db_session(read_only=True) as session:
+            cart_id = await session_execute(stmt, session)
+            cart_id = cart_id.scalar()
+        if cart_id is None:
+            # not cached, the transaction creating the cart may still be rolled back
+            user = await UserRepository.get_by_tgid(UserDTO(telegram_id=telegram_id))
+            cart = await CartRepository.get_or_create(user.id)
+            return cart.id
+        CartRepository._cart_ids[telegram_id] = cart_id
+        return cart_id
+
+    @staticmethod
+    async def add_to_cart(cart_item: CartItemDTO):
+        # A cart has one line per subcategory, adding the same subcategory again increases its quantity
+        stmt = insert(CartItem).values(**cart_item.model_dump(exclude_none=True))
+        stmt = (stmt.on_conflict_do_update(index_elements=[CartItem.cart_id, CartItem.subcategory_id],
+                                           set_={"quantity": CartItem.quantity + stmt.excluded.quantity})
+                .returning(CartItem.id))
         async with get_db_session() as session:
-            # if there exists a cart with a cart_item with the same category and subcategory, increase the quantity
-            # and if not, there is either no cart_item in the cart at all or no cart_item of the same (sub-)category
-            get_old_cart_content_stmt = select(Cart).join(
-                CartItem, Cart.id == CartItem.cart_id).where(
-                Cart.id == cart.id,
-                CartItem.subcategory_id == cart_item.subcategory_id)
-            old_cart_records = await session_execute(get_old_cart_content_stmt, session)
-            old_cart_records = old_cart_records.scalar()
+            cart_item_id = await session_execute(stmt, session)
+            cart_item_id = cart_item_id.scalar_one()
+            if config.CART_RESERVATION_MINUTES > 0:
+                await ItemRepository.reserve(cart_item_id, cart_item.category_id, cart_item.subcategory_id,
+                                             cart_item.quantity, session)
+            await session_commit(session)
 
-            if old_cart_records is None:
-                await CartItemRepository.create(cart_item)
-            elif old_cart_records is not None:
-                quantity_update_stmt = (update(CartItem).where(CartItem.cart_id == cart.id)
-                                        .values(quantity=CartItem.quantity + cart_item.quantity))
-                await session_execute(quantity_update_stmt, session)
+    @staticmethod
+    async def checkout(user_id: int, cart_items: list[CartItemDetailsDTO]) -> CheckoutDTO:
+        # The whole checkout is one transaction: the items are claimed first, so the write lock is taken
+        # by the first statement, then the balance is debited and the buys are written in bulk.
+        # If anything is missing the transaction is rolled back and nothing is sold.
+        # The user pays the price quoted from the inventory summary, not the prices of the claimed rows.
+        checkout = CheckoutDTO()
+        is_reservation_enabled = config.CART_RESERVATION_MINUTES > 0
+        async with get_db_session() as session:
+            for cart_item in cart_items:
+                purchased_items = await ItemRepository.claim(cart_item.category_id, cart_item.subcategory_id,
+                                                             cart_item.quantity, session,
+                                                             cart_item.id if is_reservation_enabled else None)
+                if len(purchased_items) < cart_item.quantity:
+                    checkout.out_of_stock.append(cart_item)
+                checkout.sold_items.append(cart_item)
+                checkout.purchased_items.append(purchased_items)
+            if len(checkout.out_of_stock) > 0:
+                await session_rollback(session)
+                return checkout
+            cart_total = sum(cart_item.price * cart_item.quantity for cart_item in cart_items)
+            checkout.consume_records = await UserRepository.debit(user_id, cart_total, session)
+            if checkout.consume_records is None:
+                checkout.is_enough_money = False
+                await session_rollback(session)
+                return checkout
+            buy_dto_list = [BuyDTO(buyer_id=user_id, quantity=len(purchased_items),
+                                   total_price=cart_item.price * len(purchased_items))
+                            for cart_item, purchased_items in zip(cart_items, checkout.purchased_items)]
+            buy_ids = await BuyRepository.create_many(buy_dto_list, session)
+            buy_item_dto_list = [BuyItemDTO(item_id=item.id, buy_id=buy_id)
+                                 for buy_id, purchased_items in zip(buy_ids, checkout.purchased_items)
+                                 for item in purchased_items]
+            await BuyItemRepository.create_many(buy_item_dto_list, session)
+            await CartItemRepository.remove_many([cart_item.id for cart_item in cart_items], session)
             await session_commit(session)
+            return checkout
@@ -1,11 +1,15 @@
-import math
-
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import config
 from db import get_db_session, session_commit, session_refresh, session_execute
-from models.cart import Cart
-from models.cartItem import CartItemDTO, CartItem
+from models.cartItem import CartItemDTO, CartItem, CartItemDetailsDTO
+from models.category import Category
+from models.inventorySummary import InventorySummary
+from models.item import Item
+from models.subcategory import Subcategory
+from repositories.item import ItemRepository
+from utils.pagination import paginate, sort_page, with_total, get_total
 
 
 class CartItemRepository:
@@ -19,33 +23,58 @@ class CartItemRepository:
             return cart_item.id
 
     @staticmethod
-    async def get_by_user_id(user_id: int, page: int) -> list[CartItemDTO]:
-        stmt = select(CartItem).join(Cart, CartItem.cart_id == Cart.id).where(Cart.user_id == user_id).limit(
-            config.PAGE_ENTRIES).offset(config.PAGE_ENTRIES * page)
-        async with get_db_session() as session:
-            cart_items = await session_execute(stmt, session)
-            return [CartItemDTO.model_validate(cart_item, from_attributes=True) for cart_item in
-                    cart_items.scalars().all()]
+    def __select_details(cart_id: int):
+        # Every cart line with its names, current unit price and stock in one query, the stock of a line
+        # whose items were deleted is 0
+        reserved_qty = (select(func.count(Item.id))
+                        .where(Item.reserved_by == CartItem.id, Item.is_sold == False)
+                        .scalar_subquery())
+        return (select(CartItem.id,
+                       CartItem.cart_id,
+                       CartItem.category_id,
+                       CartItem.subcategory_id,
+                       CartItem.quantity,
+                       Category.name.label("category_name"),
+                       Subcategory.name.label("subcategory_name"),
+                       func.coalesce(InventorySummary.price, 0.0).label("price"),
+                       func.coalesce(InventorySummary.available_count, 0).label("available_qty"),
+                       reserved_qty.label("reserved_qty"))
+                .join(Category, Category.id == CartItem.category_id)
+                .join(Subcategory, Subcategory.id == CartItem.subcategory_id)
+                .outerjoin(InventorySummary, (InventorySummary.category_id == CartItem.category_id) &
+                           (InventorySummary.subcategory_id == CartItem.subcategory_id))
+                .where(CartItem.cart_id == cart_id))
 
     @staticmethod
-    async def get_maximum_page(user_id: int) -> int:
-        max_page = len(await CartItemRepository.get_all_by_user_id(user_id))
-        if max_page % config.PAGE_ENTRIES == 0:
-            return max_page / config.PAGE_ENTRIES - 1
-        else:
-            return math.trunc(max_page / config.PAGE_ENTRIES)
+    async def get_by_cart_id(cart_id: int, cursor: int) -> tuple[list[CartItemDetailsDTO], int]:
+        total_stmt = select(func.count(CartItem.id)).where(CartItem.cart_id == cart_id)
+        stmt = paginate(with_total(CartItemRepository.__select_details(cart_id), total_stmt), CartItem.id, cursor)
+        async with get_db_session(read_only=True) as session:
+            cart_items = await session_execute(stmt, session)
+            cart_items = cart_items.mappings().all()
+            return [CartItemDetailsDTO.model_validate(cart_item, from_attributes=True) for cart_item in
+                    sort_page(cart_items, cursor)], get_total(cart_items)
 
     @staticmethod
-    async def get_all_by_user_id(user_id: int) -> list[CartItemDTO]:
-        stmt = select(CartItem).join(Cart, CartItem.cart_id == Cart.id).where(Cart.user_id == user_id)
-        async with get_db_session() as session:
+    async def get_all_by_cart_id(cart_id: int) -> list[CartItemDetailsDTO]:
+        stmt = CartItemRepository.__select_details(cart_id).order_by(CartItem.id)
+        async with get_db_session(read_only=True) as session:
             cart_items = await session_execute(stmt, session)
-            return [CartItemDTO.model_validate(cart_item, from_attributes=True) for cart_item in
-                    cart_items.scalars().all()]
+            return [CartItemDetailsDTO.model_validate(cart_item, from_attributes=True) for cart_item in
+                    cart_items.mappings().all()]
 
     @staticmethod
     async def remove_from_cart(cart_item_id: int):
         stmt = delete(CartItem).where(CartItem.id == cart_item_id)
         async with get_db_session() as session:
+            if config.CART_RESERVATION_MINUTES > 0:
+                await ItemRepository.release([cart_item_id], session)
             await session_execute(stmt, session)
             await session_commit(session)
+
+    @staticmethod
+    async def remove_many(cart_item_ids: list[int], session: AsyncSession):
+        stmt = delete(CartItem).where(CartItem.id.in_(cart_item_ids))
+        if config.CART_RESERVATION_MINUTES > 0:
+            await ItemRepository.release(cart_item_ids, session)
+        await session_execute(stmt, session)
@@ -1,57 +1,41 @@
-import math
-
 from sqlalchemy import select, func
 
-import config
 from db import get_db_session, session_execute, session_commit, session_refresh
 from models.category import Category, CategoryDTO
-from models.item import Item
+from models.inventorySummary import InventorySummary
+from utils.catalog_cache import CatalogCache
+from utils.pagination import paginate, sort_page, with_total, get_total
 
 
 class CategoryRepository:
     @staticmethod
-    async def get(page: int) -> list[CategoryDTO]:
-        stmt = select(Category).join(Item, Item.category_id == Category.id).where(
-            Item.is_sold == 0).distinct().limit(config.PAGE_ENTRIES).offset(
-            page * config.PAGE_ENTRIES).group_by(Category.name)
-        async with get_db_session() as session:
-            category_names = await session_execute(stmt, session)
-            categories = category_names.scalars().all()
-            return [CategoryDTO.model_validate(category, from_attributes=True) for category in categories]
+    async def get(cursor: int) -> tuple[list[CategoryDTO], int]:
+        return await CatalogCache.get_or_load(("categories", cursor), lambda: CategoryRepository._load(cursor))
 
     @staticmethod
-    async def get_maximum_page() -> int:
-        unique_categories_subquery = (
-            select(Category.id)
-            .join(Item, Item.category_id == Category.id)
-            .filter(Item.is_sold == 0)
-            .distinct()
-        ).alias('unique_categories')
-        stmt = select(func.count()).select_from(unique_categories_subquery)
-        async with get_db_session() as session:
-            max_page = await session_execute(stmt, session)
-            max_page = max_page.scalar_one()
-            if max_page % config.PAGE_ENTRIES == 0:
-                return max_page / config.PAGE_ENTRIES - 1
-            else:
-                return math.trunc(max_page / config.PAGE_ENTRIES)
+    async def _load(cursor: int, stock_count=InventorySummary.available_count) -> tuple[list[CategoryDTO], int]:
+        in_stock = (select(InventorySummary.category_id)
+                    .where(InventorySummary.category_id == Category.id, stock_count > 0)
+                    .exists())
+        total_stmt = select(func.count()).select_from(Category).where(in_stock)
+        stmt = paginate(with_total(select(Category).where(in_stock), total_stmt), Category.id, cursor)
+        async with get_db_session(read_only=True) as session:
+            categories = await session_execute(stmt, session)
+            categories = categories.mappings().all()
+            return [CategoryDTO.model_validate(category["Category"], from_attributes=True) for category in
+                    sort_page(categories, cursor)], get_total(categories)
 
     @staticmethod
     async def get_by_id(category_id: int):
         stmt = select(Category).where(Category.id == category_id)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             category = await session_execute(stmt, session)
             return CategoryDTO.model_validate(category.scalar(), from_attributes=True)
 
     @staticmethod
-    async def get_to_delete(page: int) -> list[CategoryDTO]:
-        stmt = select(Category).join(Item, Item.category_id == Category.id
-                                     ).where(Item.is_sold == 0).distinct().limit(config.PAGE_ENTRIES).offset(
-            page * config.PAGE_ENTRIES).group_by(Category.name)
-        async with get_db_session() as session:
-            categories = await session_execute(stmt, session)
-            return [CategoryDTO.model_validate(category, from_attributes=True) for category in
-                    categories.scalars().all()]
+    async def get_to_delete(cursor: int) -> tuple[list[CategoryDTO], int]:
+        # the categories whose stock is all reserved in carts can be deleted too
+        return await CategoryRepository._load(cursor, InventorySummary.unsold_count)
 
     @staticmethod
     async def get_or_create(category_name: str):
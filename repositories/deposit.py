@@ -1,20 +1,28 @@
 import datetime
+from collections import defaultdict
 
-from sqlalchemy import select
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert
 
 from callbacks import StatisticsTimeDelta
-from db import get_db_session, session_execute, session_commit, session_refresh
+from db import get_db_session, session_execute, session_commit, chunked
+from enums.cryptocurrency import Cryptocurrency
 from models.deposit import Deposit, DepositDTO
-from models.user import UserDTO
+from repositories.user import UserRepository
 
 
 class DepositRepository:
     @staticmethod
-    async def get_by_user_dto(user_dto: UserDTO):
-        stmt = select(Deposit).where(Deposit.user_id == user_dto.id)
-        async with get_db_session() as session:
-            deposits = await session_execute(stmt, session)
-            return deposits.scalars().all()
+    async def get_keys_by_tx_ids(tx_ids: set[str]) -> set[tuple[str, int, str]]:
+        # Only the keys of the transactions a scan returned, looked up by the unique key,
+        # so the lookup doesn't grow with the user's history
+        deposit_keys = set()
+        async with get_db_session(read_only=True) as session:
+            for tx_ids_chunk in chunked(list(tx_ids)):
+                stmt = select(Deposit.tx_id, Deposit.vout, Deposit.network).where(Deposit.tx_id.in_(tx_ids_chunk))
+                keys_chunk = await session_execute(stmt, session)
+                deposit_keys.update(keys_chunk.tuples().all())
+        return deposit_keys
 
     @staticmethod
     async def get_by_timedelta(timedelta: StatisticsTimeDelta) -> list[DepositDTO]:
@@ -22,15 +30,34 @@ class DepositRepository:
         timedelta = datetime.timedelta(days=timedelta.value)
         time_interval = current_time - timedelta
         stmt = select(Deposit).where(Deposit.deposit_datetime >= time_interval)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             deposits = await session_execute(stmt, session)
             return [DepositDTO.model_validate(deposit, from_attributes=True) for deposit in deposits.scalars().all()]
 
     @staticmethod
-    async def create(deposit: DepositDTO) -> int:
+    async def get_count_since(user_id: int, since: datetime.datetime) -> int:
+        stmt = select(func.count(Deposit.id)).where(Deposit.user_id == user_id, Deposit.deposit_datetime > since)
+        async with get_db_session(read_only=True) as session:
+            deposits_count = await session_execute(stmt, session)
+            return deposits_count.scalar_one()
+
+    @staticmethod
+    async def ingest(deposits: list[DepositDTO], crypto_prices: dict[Cryptocurrency, float]) \
+            -> dict[Cryptocurrency, float]:
+        # The deposits of one scan are inserted and credited in one transaction. A deposit ingested meanwhile
+        # by a concurrent scan is skipped by the unique key and only the inserted ones are credited.
+        stmt = (insert(Deposit).on_conflict_do_nothing()
+                .returning(Deposit.network, Deposit.token_name, Deposit.amount))
+        deposits_amounts = defaultdict(float)
         async with get_db_session() as session:
-            dep = Deposit(**deposit.model_dump())
-            session.add(dep)
+            inserted = await session_execute(stmt, session,
+                                             [deposit.model_dump(exclude={"id", "is_withdrawn", "deposit_datetime"})
+                                              for deposit in deposits])
+            for network, token_name, amount in inserted.tuples().all():
+                cryptocurrency = Cryptocurrency(token_name or network)
+                deposits_amounts[cryptocurrency] += amount / pow(10, cryptocurrency.get_decimals())
+            for cryptocurrency, deposits_amount in deposits_amounts.items():
+                await UserRepository.credit(deposits[0].user_id, cryptocurrency.get_balance_field(), deposits_amount,
+                                            deposits_amount * crypto_prices[cryptocurrency], session)
             await session_commit(session)
-            await session_refresh(session, dep)
-            return dep.id
+            return deposits_amounts
@@ -0,0 +1,26 @@
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert
+
+from db import get_db_session, session_execute, session_commit
+from models.depositCursor import DepositCursor, DepositCursorDTO
+
+
+class DepositCursorRepository:
+    @staticmethod
+    async def get_position(user_id: int, network: str) -> int | None:
+        stmt = select(DepositCursor.position).where(DepositCursor.user_id == user_id,
+                                                    DepositCursor.network == network)
+        async with get_db_session(read_only=True) as session:
+            position = await session_execute(stmt, session)
+            return position.scalar_one_or_none()
+
+    @staticmethod
+    async def advance(deposit_cursor: DepositCursorDTO):
+        # The cursor only moves forward, a slower concurrent scan of the same address can't move it back
+        stmt = insert(DepositCursor).values(**deposit_cursor.model_dump())
+        stmt = stmt.on_conflict_do_update(index_elements=[DepositCursor.user_id, DepositCursor.network],
+                                          set_={"position": func.max(DepositCursor.position,
+                                                                     stmt.excluded.position)})
+        async with get_db_session() as session:
+            await session_execute(stmt, session)
+            await session_commit(session)
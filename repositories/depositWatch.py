@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from db import get_db_session, session_execute, session_commit
+from models.depositWatch import DepositWatch, DepositWatchDTO
+from models.user import User, UserDTO
+
+
+class DepositWatchRepository:
+    @staticmethod
+    async def watch(deposit_watch: DepositWatchDTO):
+        # Watching an address again extends the watch and asks for a scan on the next scanner run
+        stmt = insert(DepositWatch).values(**deposit_watch.model_dump())
+        stmt = stmt.on_conflict_do_update(index_elements=[DepositWatch.user_id, DepositWatch.cryptocurrency],
+                                          set_={"watch_until": stmt.excluded.watch_until,
+                                                "scanned_at": stmt.excluded.scanned_at})
+        async with get_db_session() as session:
+            await session_execute(stmt, session)
+            await session_commit(session)
+
+    @staticmethod
+    async def get_due(scanned_before: datetime, limit: int) -> list[tuple[DepositWatchDTO, UserDTO]]:
+        # The watches never scanned come first, then the ones scanned longest ago
+        stmt = (select(DepositWatch, User)
+                .join(User, User.id == DepositWatch.user_id)
+                .where(DepositWatch.watch_until >= datetime.now(),
+                       or_(DepositWatch.scanned_at == None, DepositWatch.scanned_at <= scanned_before))
+                .order_by(DepositWatch.scanned_at)
+                .limit(limit))
+        async with get_db_session(read_only=True) as session:
+            watches = await session_execute(stmt, session)
+            return [(DepositWatchDTO.model_validate(deposit_watch, from_attributes=True),
+                     UserDTO.model_validate(user, from_attributes=True))
+                    for deposit_watch, user in watches.tuples().all()]
+
+    @staticmethod
+    async def mark_scanned(deposit_watches: list[DepositWatchDTO], scanned_at: datetime):
+        async with get_db_session() as session:
+            await session_execute(update(DepositWatch), session,
+                                  [{"user_id": deposit_watch.user_id,
+                                    "cryptocurrency": deposit_watch.cryptocurrency,
+                                    "scanned_at": scanned_at} for deposit_watch in deposit_watches])
+            await session_commit(session)
+
+    @staticmethod
+    async def delete_expired() -> int:
+        stmt = delete(DepositWatch).where(DepositWatch.watch_until < datetime.now())
+        async with get_db_session() as session:
+            deleted = await session_execute(stmt, session)
+            await session_commit(session)
+            return deleted.rowcount
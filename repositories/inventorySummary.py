@@ -0,0 +1,117 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import get_db_session, session_execute, session_commit
+from models.inventorySummary import InventorySummary
+from models.item import Item, ItemDTO
+from utils.catalog_cache import CatalogCache
+
+
+class InventorySummaryRepository:
+    # The maintenance methods take the session of the item change, so the summary
+    # is always updated in the same transaction and the catalog cache is invalidated by its commit
+
+    @staticmethod
+    async def add_restock(items: list[ItemDTO], session: AsyncSession):
+        CatalogCache.invalidate_on_commit(session)
+        restocked = {}
+        for item in items:
+            key = (item.category_id, item.subcategory_id)
+            unsold_count, _ = restocked.get(key, (0, None))
+            restocked[key] = (unsold_count + 1, item.price)
+        now = datetime.now()
+        for (category_id, subcategory_id), (unsold_count, price) in restocked.items():
+            stmt = insert(InventorySummary).values(category_id=category_id,
+                                                   subcategory_id=subcategory_id,
+                                                   unsold_count=unsold_count,
+                                                   price=price,
+                                                   last_restock_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[InventorySummary.category_id, InventorySummary.subcategory_id],
+                set_={"unsold_count": InventorySummary.unsold_count + stmt.excluded.unsold_count,
+                      "price": stmt.excluded.price,
+                      "last_restock_at": stmt.excluded.last_restock_at})
+            await session_execute(stmt, session)
+
+    @staticmethod
+    async def subtract_sold(sold_counts: Counter, session: AsyncSession):
+        CatalogCache.invalidate_on_commit(session)
+        for (category_id, subcategory_id), sold_count in sold_counts.items():
+            stmt = (update(InventorySummary)
+                    .where(InventorySummary.category_id == category_id,
+                           InventorySummary.subcategory_id == subcategory_id)
+                    .values(unsold_count=InventorySummary.unsold_count - sold_count))
+            await session_execute(stmt, session)
+
+    @staticmethod
+    async def add_reserved(reserved_counts: Counter, session: AsyncSession):
+        if len(reserved_counts) == 0:
+            return
+        CatalogCache.invalidate_on_commit(session)
+        for (category_id, subcategory_id), reserved_count in reserved_counts.items():
+            stmt = (update(InventorySummary)
+                    .where(InventorySummary.category_id == category_id,
+                           InventorySummary.subcategory_id == subcategory_id)
+                    .values(reserved_count=InventorySummary.reserved_count + reserved_count))
+            await session_execute(stmt, session)
+
+    @staticmethod
+    async def subtract_reserved(released_counts: Counter, session: AsyncSession):
+        if len(released_counts) == 0:
+            return
+        CatalogCache.invalidate_on_commit(session)
+        for (category_id, subcategory_id), released_count in released_counts.items():
+            stmt = (update(InventorySummary)
+                    .where(InventorySummary.category_id == category_id,
+                           InventorySummary.subcategory_id == subcategory_id)
+                    .values(reserved_count=InventorySummary.reserved_count - released_count))
+            await session_execute(stmt, session)
+
+    @staticmethod
+    async def delete_by_category_id(category_id: int, session: AsyncSession):
+        CatalogCache.invalidate_on_commit(session)
+        stmt = delete(InventorySummary).where(InventorySummary.category_id == category_id)
+        await session_execute(stmt, session)
+
+    @staticmethod
+    async def delete_by_subcategory_id(subcategory_id: int, session: AsyncSession):
+        CatalogCache.invalidate_on_commit(session)
+        stmt = delete(InventorySummary).where(InventorySummary.subcategory_id == subcategory_id)
+        await session_execute(stmt, session)
+
+    @staticmethod
+    async def get_available_count(category_id: int, subcategory_id: int) -> int:
+        stmt = (select(InventorySummary.available_count)
+                .where(InventorySummary.category_id == category_id,
+                       InventorySummary.subcategory_id == subcategory_id))
+        async with get_db_session(read_only=True) as session:
+            available_count = await session_execute(stmt, session)
+            return available_count.scalar() or 0
+
+    @staticmethod
+    async def rebuild() -> int:
+        # Repair: recomputes the whole summary from the items table
+        latest_price = (select(Item.price)
+                        .where(Item.category_id == InventorySummary.category_id,
+                               Item.subcategory_id == InventorySummary.subcategory_id,
+                               Item.is_sold == False)
+                        .order_by(Item.id.desc())
+                        .limit(1)
+                        .scalar_subquery())
+        rebuild_stmt = insert(InventorySummary).from_select(
+            ["category_id", "subcategory_id", "unsold_count", "reserved_count", "price"],
+            select(Item.category_id, Item.subcategory_id, func.count(Item.id), func.count(Item.reserved_until),
+                   func.max(Item.price))
+            .where(Item.is_sold == False)
+            .group_by(Item.category_id, Item.subcategory_id))
+        async with get_db_session() as session:
+            CatalogCache.invalidate_on_commit(session)
+            await session_execute(delete(InventorySummary), session)
+            rebuilt = await session_execute(rebuild_stmt, session)
+            await session_execute(update(InventorySummary).values(price=latest_price), session)
+            await session_commit(session)
+            return rebuilt.rowcount
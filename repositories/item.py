@@ -1,8 +1,14 @@
-from sqlalchemy import select, func, update, delete
+from collections import Counter
+from datetime import datetime, timedelta
 
-from db import get_db_session, session_execute, session_commit
+from sqlalchemy import select, update, delete, insert, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from db import get_db_session, session_execute, session_commit, chunked
 from models.buyItem import BuyItem
 from models.item import Item, ItemDTO
+from repositories.inventorySummary import InventorySummaryRepository
 
 
 class ItemRepository:
@@ -13,55 +19,109 @@ class ItemRepository:
                 .where(Item.category_id == item_dto.category_id,
                        Item.subcategory_id == item_dto.subcategory_id)
                 .limit(1))
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             price = await session_execute(stmt, session)
             return price.scalar()
 
     @staticmethod
     async def get_available_qty(item_dto: ItemDTO) -> int:
-        sub_stmt = (select(Item)
-                    .where(Item.category_id == item_dto.category_id,
-                           Item.subcategory_id == item_dto.subcategory_id,
-                           Item.is_sold == False))
-        stmt = select(func.count()).select_from(sub_stmt)
-        async with get_db_session() as session:
-            available_qty = await session_execute(stmt, session)
-            return available_qty.scalar()
-
-    @staticmethod
-    async def get_single(category_id: int, subcategory_id: int):
-        stmt = (select(Item)
-                .where(Item.category_id == category_id,
-                       Item.subcategory_id == subcategory_id,
-                       Item.is_sold == False)
-                .limit(1))
-        async with get_db_session() as session:
-            item = await session_execute(stmt, session)
-            return ItemDTO.model_validate(item.scalar(), from_attributes=True)
+        return await InventorySummaryRepository.get_available_count(item_dto.category_id, item_dto.subcategory_id)
 
     @staticmethod
     async def get_by_id(item_id: int):
         stmt = select(Item).where(Item.id == item_id)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             item = await session_execute(stmt, session)
             return ItemDTO.model_validate(item.scalar(), from_attributes=True)
 
     @staticmethod
-    async def get_purchased_items(category_id: int, subcategory_id: int, quantity: int) -> list[ItemDTO]:
-        stmt = (select(Item)
-                .where(Item.category_id == category_id, Item.subcategory_id == subcategory_id,
-                       Item.is_sold == False).limit(quantity))
-        async with get_db_session() as session:
-            items = await session_execute(stmt, session)
-            return [ItemDTO.model_validate(item, from_attributes=True) for item in items.scalars().all()]
+    async def claim(category_id: int, subcategory_id: int, quantity: int, session: AsyncSession,
+                    cart_item_id: int | None = None) -> list[ItemDTO]:
+        # Marks up to quantity unsold items as sold and returns them. The is_sold check is repeated
+        # by the UPDATE itself, so an item can never be claimed by two checkouts. The items reserved
+        # for the cart item are taken first, then the items nobody holds or whose hold has expired.
+        unsold_filter = (Item.category_id == category_id, Item.subcategory_id == subcategory_id,
+                         Item.is_sold == False)
+        items = []
+        if cart_item_id is not None:
+            items += await ItemRepository.__claim(unsold_filter + (Item.reserved_by == cart_item_id,),
+                                                  quantity, session)
+        if len(items) < quantity:
+            is_not_held = or_(Item.reserved_until == None, Item.reserved_until < datetime.now())
+            items += await ItemRepository.__claim(unsold_filter + (is_not_held,), quantity - len(items), session)
+        return items
+
+    @staticmethod
+    async def __claim(claim_filter: tuple, quantity: int, session: AsyncSession) -> list[ItemDTO]:
+        claimable_ids = select(Item.id).where(*claim_filter).limit(quantity)
+        stmt = (update(Item)
+                .where(Item.id.in_(claimable_ids), Item.is_sold == False)
+                .values(is_sold=True, reserved_until=None)
+                .returning(Item.id, Item.category_id, Item.subcategory_id, Item.private_data, Item.price,
+                           Item.is_sold, Item.is_new, Item.description, Item.reserved_by))
+        items = await session_execute(stmt, session)
+        items = [ItemDTO.model_validate(item, from_attributes=True) for item in items.mappings().all()]
+        await ItemRepository.__update_summary(items, session)
+        return items
+
+    @staticmethod
+    async def __update_summary(sold_items: list[ItemDTO], session: AsyncSession):
+        # A sold item that was held (an expired hold of another cart included) also leaves the reserved count
+        sold_counts = Counter((item.category_id, item.subcategory_id) for item in sold_items)
+        released_counts = Counter((item.category_id, item.subcategory_id) for item in sold_items
+                                  if item.reserved_by is not None)
+        await InventorySummaryRepository.subtract_sold(sold_counts, session)
+        await InventorySummaryRepository.subtract_reserved(released_counts, session)
+
+    @staticmethod
+    async def reserve(cart_item_id: int, category_id: int, subcategory_id: int, quantity: int,
+                      session: AsyncSession) -> int:
+        # Holds up to quantity more free items for the cart item and extends its existing holds
+        reserved_until = datetime.now() + timedelta(minutes=config.CART_RESERVATION_MINUTES)
+        extend_stmt = (update(Item)
+                       .where(Item.reserved_by == cart_item_id, Item.is_sold == False)
+                       .values(reserved_until=reserved_until))
+        await session_execute(extend_stmt, session)
+        free_ids = (select(Item.id)
+                    .where(Item.category_id == category_id, Item.subcategory_id == subcategory_id,
+                           Item.is_sold == False, Item.reserved_until == None)
+                    .limit(quantity))
+        reserve_stmt = (update(Item)
+                        .where(Item.id.in_(free_ids), Item.reserved_until == None)
+                        .values(reserved_by=cart_item_id, reserved_until=reserved_until)
+                        .returning(Item.id))
+        reserved = await session_execute(reserve_stmt, session)
+        reserved_counts = Counter({(category_id, subcategory_id): len(reserved.all())})
+        await InventorySummaryRepository.add_reserved(+reserved_counts, session)
+        return reserved_counts.total()
+
+    @staticmethod
+    async def release(cart_item_ids: list[int], session: AsyncSession):
+        released_counts = Counter()
+        for ids_chunk in chunked(cart_item_ids):
+            stmt = (update(Item)
+                    .where(Item.reserved_by.in_(ids_chunk), Item.is_sold == False)
+                    .values(reserved_by=None, reserved_until=None)
+                    .returning(Item.category_id, Item.subcategory_id))
+            released = await session_execute(stmt, session)
+            released_counts.update(released.tuples().all())
+        await InventorySummaryRepository.subtract_reserved(released_counts, session)
 
     @staticmethod
-    async def update(item_dto_list: list[ItemDTO]):
+    async def release_expired(limit: int) -> int:
+        expired_ids = (select(Item.id)
+                       .where(Item.reserved_until < datetime.now(), Item.is_sold == False)
+                       .limit(limit))
+        stmt = (update(Item)
+                .where(Item.id.in_(expired_ids))
+                .values(reserved_by=None, reserved_until=None)
+                .returning(Item.category_id, Item.subcategory_id))
         async with get_db_session() as session:
-            for item in item_dto_list:
-                stmt = update(Item).where(Item.id == item.id).values(**item.model_dump())
-                await session_execute(stmt, session)
+            released = await session_execute(stmt, session)
+            released_counts = Counter(released.tuples().all())
+            await InventorySummaryRepository.subtract_reserved(released_counts, session)
             await session_commit(session)
+            return released_counts.total()
 
     @staticmethod
     async def get_by_buy_id(buy_id: int) -> list[ItemDTO]:
@@ -70,7 +130,7 @@ class ItemRepository:
             .join(BuyItem, BuyItem.item_id == Item.id)
             .where(BuyItem.buy_id == buy_id)
         )
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             result = await session_execute(stmt, session)
             return [ItemDTO.model_validate(item, from_attributes=True) for item in result.scalars().all()]
 
@@ -86,6 +146,7 @@ class ItemRepository:
         stmt = delete(Item).where(Item.category_id == entity_id, Item.is_sold == False)
         async with get_db_session() as session:
             await session_execute(stmt, session)
+            await InventorySummaryRepository.delete_by_category_id(entity_id, session)
             await session_commit(session)
 
     @staticmethod
@@ -93,25 +154,27 @@ class ItemRepository:
         stmt = delete(Item).where(Item.subcategory_id == entity_id, Item.is_sold == False)
         async with get_db_session() as session:
             await session_execute(stmt, session)
+            await InventorySummaryRepository.delete_by_subcategory_id(entity_id, session)
             await session_commit(session)
 
     @staticmethod
     async def add_many(items: list[ItemDTO]):
         async with get_db_session() as session:
-            [session.add(Item(**item.model_dump())) for item in items]
+            await session_execute(insert(Item), session, [item.model_dump(exclude_none=True) for item in items])
+            await InventorySummaryRepository.add_restock(items, session)
             await session_commit(session)
 
     @staticmethod
     async def get_new() -> list[ItemDTO]:
         stmt = select(Item).where(Item.is_new == 1)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             items = await session_execute(stmt, session)
             return [ItemDTO.model_validate(item, from_attributes=True) for item in items.scalars().all()]
 
     @staticmethod
     async def get_in_stock() -> list[ItemDTO]:
         stmt = select(Item).where(Item.is_sold == 0)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             items = await session_execute(stmt, session)
             return [ItemDTO.model_validate(item, from_attributes=True) for item in items.scalars().all()]
 
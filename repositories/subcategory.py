@@ -1,77 +1,78 @@
-import math
-
 from sqlalchemy import select, func
 
-import config
 from db import get_db_session, session_execute, session_commit, session_refresh
+from models.inventorySummary import InventorySummary
 from models.item import Item
-from models.subcategory import Subcategory, SubcategoryDTO
+from models.category import Category
+from models.subcategory import Subcategory, SubcategoryDTO, SubcategoryStockDTO, SubcategoryDetailsDTO
+from utils.catalog_cache import CatalogCache
+from utils.pagination import paginate, sort_page, with_total, get_total
 
 
 class SubcategoryRepository:
     @staticmethod
-    async def get_paginated_by_category_id(category_id: int, page: int) -> list[SubcategoryDTO]:
-        stmt = (select(Subcategory)
-                .join(Item, Item.subcategory_id == Subcategory.id)
-                .where(Item.category_id == category_id, Item.is_sold == False)
-                .distinct()
-                .limit(config.PAGE_ENTRIES)
-                .offset(page * config.PAGE_ENTRIES))
-        async with get_db_session() as session:
+    async def get_paginated_by_category_id(category_id: int, cursor: int) -> tuple[list[SubcategoryStockDTO], int]:
+        return await CatalogCache.get_or_load(("subcategories", category_id, cursor),
+                                              lambda: SubcategoryRepository._load_paginated(category_id, cursor))
+
+    @staticmethod
+    async def _load_paginated(category_id: int, cursor: int) -> tuple[list[SubcategoryStockDTO], int]:
+        in_stock_filter = (InventorySummary.category_id == category_id, InventorySummary.available_count > 0)
+        stmt = (select(Subcategory.id,
+                       Subcategory.name,
+                       InventorySummary.price,
+                       InventorySummary.available_count.label("available_qty"))
+                .join(InventorySummary, InventorySummary.subcategory_id == Subcategory.id)
+                .where(*in_stock_filter))
+        total_stmt = select(func.count()).select_from(InventorySummary).where(*in_stock_filter)
+        stmt = paginate(with_total(stmt, total_stmt), InventorySummary.subcategory_id, cursor)
+        async with get_db_session(read_only=True) as session:
             subcategories = await session_execute(stmt, session)
-            subcategories = subcategories.scalars().all()
-            return [SubcategoryDTO.model_validate(subcategory, from_attributes=True) for subcategory in subcategories]
+            subcategories = subcategories.mappings().all()
+            return [SubcategoryStockDTO.model_validate(subcategory, from_attributes=True) for subcategory in
+                    sort_page(subcategories, cursor)], get_total(subcategories)
 
     @staticmethod
-    async def max_page(category_id: int) -> int:
-        subquery = (select(Subcategory.id)
-                    .join(Item, Item.subcategory_id == Subcategory.id)
-                    .where(Item.category_id == category_id,
-                           Item.is_sold == False)
-                    .distinct())
-        stmt = select(func.count()).select_from(subquery)
-        async with get_db_session() as session:
-            maximum_page = await session_execute(stmt, session)
-            maximum_page = maximum_page.scalar_one()
-            if maximum_page % config.PAGE_ENTRIES == 0:
-                return maximum_page / config.PAGE_ENTRIES - 1
-            else:
-                return math.trunc(maximum_page / config.PAGE_ENTRIES)
+    async def get_details(category_id: int, subcategory_id: int) -> SubcategoryDetailsDTO:
+        description_subquery = (select(Item.description)
+                                .where(Item.category_id == category_id,
+                                       Item.subcategory_id == subcategory_id,
+                                       Item.is_sold == False)
+                                .limit(1)
+                                .scalar_subquery())
+        stmt = (select(Category.name.label("category_name"),
+                       Subcategory.name.label("subcategory_name"),
+                       InventorySummary.price,
+                       description_subquery.label("description"),
+                       InventorySummary.available_count.label("available_qty"))
+                .select_from(InventorySummary)
+                .join(Category, Category.id == InventorySummary.category_id)
+                .join(Subcategory, Subcategory.id == InventorySummary.subcategory_id)
+                .where(InventorySummary.category_id == category_id,
+                       InventorySummary.subcategory_id == subcategory_id))
+        async with get_db_session(read_only=True) as session:
+            details = await session_execute(stmt, session)
+            return SubcategoryDetailsDTO.model_validate(details.mappings().one(), from_attributes=True)
 
     @staticmethod
     async def get_by_id(subcategory_id: int) -> SubcategoryDTO:
         stmt = select(Subcategory).where(Subcategory.id == subcategory_id)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             subcategory = await session_execute(stmt, session)
             return SubcategoryDTO.model_validate(subcategory.scalar(), from_attributes=True)
 
     @staticmethod
-    async def get_to_delete(page: int) -> list[SubcategoryDTO]:
-        stmt = select(Subcategory).join(Item,
-                                        Item.subcategory_id == Subcategory.id).where(
-            Item.is_sold == 0).distinct().limit(config.PAGE_ENTRIES).offset(
-            page * config.PAGE_ENTRIES).group_by(Subcategory.name)
-        async with get_db_session() as session:
+    async def get_to_delete(cursor: int) -> tuple[list[SubcategoryDTO], int]:
+        in_stock = (select(InventorySummary.subcategory_id)
+                    .where(InventorySummary.subcategory_id == Subcategory.id, InventorySummary.unsold_count > 0)
+                    .exists())
+        total_stmt = select(func.count()).select_from(Subcategory).where(in_stock)
+        stmt = paginate(with_total(select(Subcategory).where(in_stock), total_stmt), Subcategory.id, cursor)
+        async with get_db_session(read_only=True) as session:
             subcategories = await session_execute(stmt, session=session)
-            return [SubcategoryDTO.model_validate(subcategory, from_attributes=True) for subcategory in
-                    subcategories.scalars().all()]
-
-    @staticmethod
-    async def get_maximum_page_to_delete() -> int:
-        unique_categories_subquery = (
-            select(Subcategory.id)
-            .join(Item, Item.subcategory_id == Subcategory.id)
-            .filter(Item.is_sold == 0)
-            .distinct()
-        ).alias('unique_categories')
-        stmt = select(func.count()).select_from(unique_categories_subquery)
-        async with get_db_session() as session:
-            max_page = await session_execute(stmt, session)
-            max_page = max_page.scalar_one()
-            if max_page % config.PAGE_ENTRIES == 0:
-                return max_page / config.PAGE_ENTRIES - 1
-            else:
-                return math.trunc(max_page / config.PAGE_ENTRIES)
+            subcategories = subcategories.mappings().all()
+            return [SubcategoryDTO.model_validate(subcategory["Subcategory"], from_attributes=True) for subcategory in
+                    sort_page(subcategories, cursor)], get_total(subcategories)
 
     @staticmethod
     async def get_or_create(subcategory_name: str):
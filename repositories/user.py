@@ -1,21 +1,21 @@
 import datetime
-import math
 
 from sqlalchemy import select, update, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 
-import config
 from callbacks import StatisticsTimeDelta
 from db import get_db_session, session_commit, session_execute, session_refresh
 
 from models.user import UserDTO, User
 from utils.CryptoAddressGenerator import CryptoAddressGenerator
+from utils.pagination import paginate, sort_page, with_total, get_total
 
 
 class UserRepository:
     @staticmethod
     async def get_by_tgid(user_dto: UserDTO) -> UserDTO | None:
         stmt = select(User).where(User.telegram_id == user_dto.telegram_id)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             user = await session_execute(stmt, session)
             user = user.scalar()
             if user is not None:
@@ -34,6 +34,38 @@ class UserRepository:
             await session_execute(stmt, session)
             await session_commit(session)
 
+    @staticmethod
+    async def debit(user_id: int, amount: float, session: AsyncSession) -> float | None:
+        # The balance is checked and spent by one statement, returns the new consume_records or None if too low
+        stmt = (update(User)
+                .where(User.id == user_id, User.top_up_amount - User.consume_records >= amount)
+                .values(consume_records=User.consume_records + amount)
+                .returning(User.consume_records))
+        consume_records = await session_execute(stmt, session)
+        return consume_records.scalar()
+
+    @staticmethod
+    async def credit(user_id: int, balance_field: str, crypto_amount: float, fiat_amount: float,
+                     session: AsyncSession):
+        # Incremented in place, a deposit credited in the background must not be lost to a concurrent update
+        balance_column = getattr(User, balance_field)
+        stmt = (update(User)
+                .where(User.id == user_id)
+                .values({balance_column: balance_column + crypto_amount,
+                         User.top_up_amount: User.top_up_amount + fiat_amount}))
+        await session_execute(stmt, session)
+
+    @staticmethod
+    async def adjust_balance(user_id: int, top_up_amount: float = 0.0, consume_records: float = 0.0):
+        # Incremented in place like credit and debit, so the admin corrections and refunds don't overwrite them
+        stmt = (update(User)
+                .where(User.id == user_id)
+                .values(top_up_amount=User.top_up_amount + top_up_amount,
+                        consume_records=User.consume_records + consume_records))
+        async with get_db_session() as session:
+            await session_execute(stmt, session)
+            await session_commit(session)
+
     @staticmethod
     async def create(user_dto: UserDTO) -> int:
         crypto_addr_gen = CryptoAddressGenerator()
@@ -54,14 +86,14 @@ class UserRepository:
     @staticmethod
     async def get_active() -> list[UserDTO]:
         stmt = select(User).where(User.can_receive_messages == True)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             users = await session_execute(stmt, session)
             return [UserDTO.model_validate(user, from_attributes=True) for user in users.scalars().all()]
 
     @staticmethod
     async def get_all_count() -> int:
         stmt = func.count(User.id)
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             users_count = await session_execute(stmt, session)
             return users_count.scalar_one()
 
@@ -69,7 +101,7 @@ class UserRepository:
     async def get_user_entity(user_entity: int | str) -> UserDTO | None:
         stmt = select(User).where(or_(User.telegram_id == user_entity, User.telegram_username == user_entity,
                                       User.id == user_entity))
-        async with get_db_session() as session:
+        async with get_db_session(read_only=True) as session:
             user = await session_execute(stmt, session)
             user = user.scalar()
             if user is None:
@@ -78,32 +110,15 @@ class UserRepository:
                 return UserDTO.model_validate(user, from_attributes=True)
 
     @staticmethod
-    async def get_by_timedelta(timedelta: StatisticsTimeDelta, page: int) -> tuple[list[UserDTO], int]:
+    async def get_by_timedelta(timedelta: StatisticsTimeDelta, cursor: int) -> tuple[list[UserDTO], int]:
         current_time = datetime.datetime.now()
         timedelta = datetime.timedelta(days=timedelta.value)
         time_interval = current_time - timedelta
-        users_stmt = (select(User)
-                      .where(User.registered_at >= time_interval, User.telegram_username != None)
-                      .limit(config.PAGE_ENTRIES)
-                      .offset(config.PAGE_ENTRIES * page))
-        users_count_stmt = select(func.count(User.id)).where(User.registered_at >= time_interval)
-        async with get_db_session() as session:
+        users_filter = (User.registered_at >= time_interval, User.telegram_username != None)
+        users_count_stmt = select(func.count(User.id)).where(*users_filter)
+        users_stmt = paginate(with_total(select(User).where(*users_filter), users_count_stmt), User.id, cursor)
+        async with get_db_session(read_only=True) as session:
             users = await session_execute(users_stmt, session)
-            users = [UserDTO.model_validate(user, from_attributes=True) for user in users.scalars().all()]
-            users_count = await session_execute(users_count_stmt, session)
-            return users, users_count.scalar_one()
-
-    @staticmethod
-    async def get_max_page_by_timedelta(timedelta: StatisticsTimeDelta) -> int:
-        current_time = datetime.datetime.now()
-        timedelta = datetime.timedelta(days=timedelta.value)
-        time_interval = current_time - timedelta
-        stmt = select(func.count(User.id)).where(User.registered_at >= time_interval,
-                                                 User.telegram_username != None)
-        async with get_db_session() as session:
-            users = await session_execute(stmt, session)
-            users = users.scalar_one()
-            if users % config.PAGE_ENTRIES == 0:
-                return users / config.PAGE_ENTRIES - 1
-            else:
-                return math.trunc(users / config.PAGE_ENTRIES)
+            users = users.mappings().all()
+            return [UserDTO.model_validate(user["User"], from_attributes=True) for user in
+                    sort_page(users, cursor)], get_total(users)
@@ -16,31 +16,45 @@ from handlers.user.all_categories import all_categories_router
 from handlers.user.my_profile import my_profile_router
 from services.user import UserService
 from utils.custom_filters import IsUserExistFilter
+from utils.keyboard_cache import KeyboardCache
 from utils.localizator import Localizator
 
 logging.basicConfig(level=logging.INFO)
 main_router = Router()
 
 
-@main_router.message(Command(commands=["start", "help"]))
-async def start(message: types.message):
+@KeyboardCache.static_menu("start_menu", variants=[(False,), (True,)])
+async def get_start_menu(is_admin: bool) -> tuple[str, types.ReplyKeyboardMarkup]:
     all_categories_button = types.KeyboardButton(text=Localizator.get_text(BotEntity.USER, "all_categories"))
     my_profile_button = types.KeyboardButton(text=Localizator.get_text(BotEntity.USER, "my_profile"))
     faq_button = types.KeyboardButton(text=Localizator.get_text(BotEntity.USER, "faq"))
     help_button = types.KeyboardButton(text=Localizator.get_text(BotEntity.USER, "help"))
     admin_menu_button = types.KeyboardButton(text=Localizator.get_text(BotEntity.ADMIN, "menu"))
     cart_button = types.KeyboardButton(text=Localizator.get_text(BotEntity.USER, "cart"))
+    keyboard = [[all_categories_button, my_profile_button], [faq_button, help_button],
+                [cart_button]]
+    if is_admin:
+        keyboard.append([admin_menu_button])
+    start_markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2, keyboard=keyboard)
+    return Localizator.get_text(BotEntity.COMMON, "start_message"), start_markup
+
+
+@KeyboardCache.static_menu("help_menu")
+async def get_help_menu() -> tuple[str, InlineKeyboardBuilder]:
+    admin_keyboard_builder = InlineKeyboardBuilder()
+    admin_keyboard_builder.button(text=Localizator.get_text(BotEntity.USER, "help_button"), url=SUPPORT_LINK)
+    return Localizator.get_text(BotEntity.USER, "help_string"), admin_keyboard_builder
+
+
+@main_router.message(Command(commands=["start", "help"]))
+async def start(message: types.message):
     telegram_id = message.from_user.id
     await UserService.create_if_not_exist(UserDTO(
         telegram_username=message.from_user.username,
         telegram_id=telegram_id
     ))
-    keyboard = [[all_categories_button, my_profile_button], [faq_button, help_button],
-                [cart_button]]
-    if telegram_id in config.ADMIN_ID_LIST:
-        keyboard.append([admin_menu_button])
-    start_markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2, keyboard=keyboard)
-    await message.answer(Localizator.get_text(BotEntity.COMMON, "start_message"), reply_markup=start_markup)
+    msg, start_markup = await get_start_menu(telegram_id in config.ADMIN_ID_LIST)
+    await message.answer(msg, reply_markup=start_markup)
 
 
 @main_router.message(F.text == Localizator.get_text(BotEntity.USER, "faq"), IsUserExistFilter())
@@ -50,11 +64,8 @@ async def faq(message: types.message):
 
 @main_router.message(F.text == Localizator.get_text(BotEntity.USER, "help"), IsUserExistFilter())
 async def support(message: types.message):
-    admin_keyboard_builder = InlineKeyboardBuilder()
-
-    admin_keyboard_builder.button(text=Localizator.get_text(BotEntity.USER, "help_button"), url=SUPPORT_LINK)
-    await message.answer(Localizator.get_text(BotEntity.USER, "help_string"),
-                         reply_markup=admin_keyboard_builder.as_markup())
+    msg, help_markup = await get_help_menu()
+    await message.answer(msg, reply_markup=help_markup)
 
 
 main_router.include_router(admin_router)
@@ -1,8 +1,9 @@
 import asyncio
 import logging
+import time
 from aiogram.exceptions import TelegramForbiddenError
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from callbacks import AdminAnnouncementCallback, AnnouncementType, AdminInventoryManagementCallback, EntityType, \
     AddType, UserManagementCallback, UserManagementOperation, StatisticsCallback, StatisticsEntity, StatisticsTimeDelta, \
@@ -17,14 +18,34 @@ from repositories.category import CategoryRepository
 from repositories.deposit import DepositRepository
 from repositories.item import ItemRepository
 from repositories.subcategory import SubcategoryRepository
+from models.user import UserDTO
 from repositories.user import UserRepository
+from utils.keyboard_cache import KeyboardCache
 from utils.localizator import Localizator
 
 
 class AdminService:
 
     @staticmethod
-    async def get_announcement_menu() -> tuple[str, InlineKeyboardBuilder]:
+    @KeyboardCache.static_menu("admin_menu")
+    async def get_admin_menu() -> tuple[str, InlineKeyboardMarkup]:
+        kb_builder = InlineKeyboardBuilder()
+        kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "announcements"),
+                          callback_data=AdminAnnouncementCallback.create(level=0))
+        kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "inventory_management"),
+                          callback_data=AdminInventoryManagementCallback.create(level=0))
+        kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "user_management"),
+                          callback_data=UserManagementCallback.create(level=0))
+        kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "statistics"),
+                          callback_data=StatisticsCallback.create(level=0))
+        kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "crypto_withdraw"),
+                          callback_data=WalletCallback.create(level=0))
+        kb_builder.adjust(2)
+        return Localizator.get_text(BotEntity.ADMIN, "menu"), kb_builder
+
+    @staticmethod
+    @KeyboardCache.static_menu("announcement_menu")
+    async def get_announcement_menu() -> tuple[str, InlineKeyboardMarkup]:
         kb_builder = InlineKeyboardBuilder()
         kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "send_everyone"),
                           callback_data=AdminAnnouncementCallback.create(1))
@@ -54,7 +75,7 @@ class AdminService:
                     user.can_receive_messages = False
                 elif "bot was blocked by the user" in e.message.lower():
                     user.can_receive_messages = False
-                    await UserRepository.update(user)
+                    await UserRepository.update(UserDTO(telegram_id=user.telegram_id, can_receive_messages=False))
             except Exception as e:
                 logging.error(e)
             finally:
@@ -65,7 +86,8 @@ class AdminService:
                                                                               users_count=all_users_count)
 
     @staticmethod
-    async def get_inventory_management_menu() -> tuple[str, InlineKeyboardBuilder]:
+    @KeyboardCache.static_menu("inventory_management_menu")
+    async def get_inventory_management_menu() -> tuple[str, InlineKeyboardMarkup]:
         kb_builder = InlineKeyboardBuilder()
         kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "add_items"),
                           callback_data=AdminInventoryManagementCallback.create(level=1, entity_type=EntityType.ITEM))
@@ -97,28 +119,26 @@ class AdminService:
         kb_builder = InlineKeyboardBuilder()
         match unpacked_cb.entity_type:
             case EntityType.CATEGORY:
-                categories = await CategoryRepository.get_to_delete(unpacked_cb.page)
+                categories, total = await CategoryRepository.get_to_delete(unpacked_cb.cursor)
                 [kb_builder.button(text=category.name, callback_data=AdminInventoryManagementCallback.create(
                     level=3,
                     entity_type=unpacked_cb.entity_type,
                     entity_id=category.id
                 )) for category in categories]
                 kb_builder.adjust(1)
-                kb_builder = await add_pagination_buttons(kb_builder, unpacked_cb,
-                                                          CategoryRepository.get_maximum_page(),
-                                                          unpacked_cb.get_back_button(0))
+                kb_builder = add_pagination_buttons(kb_builder, unpacked_cb, total, unpacked_cb.get_back_button(0),
+                                                    [category.id for category in categories])
                 return Localizator.get_text(BotEntity.ADMIN, "delete_category"), kb_builder
             case EntityType.SUBCATEGORY:
-                subcategories = await SubcategoryRepository.get_to_delete(unpacked_cb.page)
+                subcategories, total = await SubcategoryRepository.get_to_delete(unpacked_cb.cursor)
                 [kb_builder.button(text=subcategory.name, callback_data=AdminInventoryManagementCallback.create(
                     level=3,
                     entity_type=unpacked_cb.entity_type,
                     entity_id=subcategory.id
                 )) for subcategory in subcategories]
                 kb_builder.adjust(1)
-                kb_builder = await add_pagination_buttons(kb_builder, unpacked_cb,
-                                                          SubcategoryRepository.get_maximum_page_to_delete(),
-                                                          unpacked_cb.get_back_button(0))
+                kb_builder = add_pagination_buttons(kb_builder, unpacked_cb, total, unpacked_cb.get_back_button(0),
+                                                    [subcategory.id for subcategory in subcategories])
                 return Localizator.get_text(BotEntity.ADMIN, "delete_subcategory"), kb_builder
 
     @staticmethod
@@ -180,7 +200,8 @@ class AdminService:
                 return Localizator.get_text(BotEntity.ADMIN, "add_items_txt_msg"), kb_markup
 
     @staticmethod
-    async def get_user_management_menu() -> tuple[str, InlineKeyboardBuilder]:
+    @KeyboardCache.static_menu("user_management_menu")
+    async def get_user_management_menu() -> tuple[str, InlineKeyboardMarkup]:
         kb_builder = InlineKeyboardBuilder()
         kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "credit_management"),
                           callback_data=UserManagementCallback.create(1))
@@ -237,15 +258,13 @@ class AdminService:
         if user is None:
             return Localizator.get_text(BotEntity.ADMIN, "credit_management_user_not_found")
         elif operation == UserManagementOperation.ADD_BALANCE:
-            user.top_up_amount += float(message.text)
-            await UserRepository.update(user)
+            await UserRepository.adjust_balance(user.id, top_up_amount=float(message.text))
             return Localizator.get_text(BotEntity.ADMIN, "credit_management_added_success").format(
                 amount=message.text,
                 telegram_id=user.telegram_id,
                 currency_text=Localizator.get_currency_text())
         else:
-            user.consume_records += float(message.text)
-            await UserRepository.update(user)
+            await UserRepository.adjust_balance(user.id, consume_records=float(message.text))
             return Localizator.get_text(BotEntity.ADMIN, "credit_management_reduced_success").format(
                 amount=message.text,
                 telegram_id=user.telegram_id,
@@ -255,7 +274,7 @@ class AdminService:
     async def get_refund_menu(callback: CallbackQuery) -> tuple[str, InlineKeyboardBuilder]:
         unpacked_cb = UserManagementCallback.unpack(callback.data)
         kb_builder = InlineKeyboardBuilder()
-        refund_data = await BuyRepository.get_refund_data(unpacked_cb.page)
+        refund_data, total = await BuyRepository.get_refund_data(unpacked_cb.cursor)
         for refund_item in refund_data:
             callback = UserManagementCallback.create(
                 unpacked_cb.level + 1,
@@ -276,8 +295,8 @@ class AdminService:
                     currency_sym=Localizator.get_currency_symbol()),
                     callback_data=callback)
         kb_builder.adjust(1)
-        kb_builder = await add_pagination_buttons(kb_builder, unpacked_cb,
-                                                  BuyRepository.get_max_refund_page(), unpacked_cb.get_back_button(0))
+        kb_builder = add_pagination_buttons(kb_builder, unpacked_cb, total, unpacked_cb.get_back_button(0),
+                                            [refund_item.buy_id for refund_item in refund_data])
         return Localizator.get_text(BotEntity.ADMIN, "refund_menu"), kb_builder
 
     @staticmethod
@@ -306,7 +325,8 @@ class AdminService:
                 currency_sym=Localizator.get_currency_symbol()), kb_builder
 
     @staticmethod
-    async def get_statistics_menu() -> tuple[str, InlineKeyboardBuilder]:
+    @KeyboardCache.static_menu("statistics_menu")
+    async def get_statistics_menu() -> tuple[str, InlineKeyboardMarkup]:
         kb_builder = InlineKeyboardBuilder()
         kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "users_statistics"),
                           callback_data=StatisticsCallback.create(1, StatisticsEntity.USERS))
@@ -345,15 +365,12 @@ class AdminService:
         kb_builder = InlineKeyboardBuilder()
         match unpacked_cb.statistics_entity:
             case StatisticsEntity.USERS:
-                users, users_count = await UserRepository.get_by_timedelta(unpacked_cb.timedelta, unpacked_cb.page)
+                users, users_count = await UserRepository.get_by_timedelta(unpacked_cb.timedelta, unpacked_cb.cursor)
                 [kb_builder.button(text=user.telegram_username, url=f't.me/{user.telegram_username}') for user in users
                  if user.telegram_username]
                 kb_builder.adjust(1)
-                kb_builder = await add_pagination_buttons(
-                    kb_builder,
-                    unpacked_cb,
-                    UserRepository.get_max_page_by_timedelta(unpacked_cb.timedelta),
-                    None)
+                kb_builder = add_pagination_buttons(kb_builder, unpacked_cb, users_count, None,
+                                                    [user.id for user in users])
                 kb_builder.row(AdminConstants.back_to_main_button, unpacked_cb.get_back_button())
                 return Localizator.get_text(BotEntity.ADMIN, "new_users_msg").format(
                     users_count=len(users),
@@ -373,47 +390,34 @@ class AdminService:
                     buys_count=len(buys), currency_sym=Localizator.get_currency_symbol()), kb_builder
             case StatisticsEntity.DEPOSITS:
                 deposits = await DepositRepository.get_by_timedelta(unpacked_cb.timedelta)
-                fiat_amount = 0.0
-                btc_amount = 0.0
-                ltc_amount = 0.0
-                sol_amount = 0.0
-                usdt_trc20_amount = 0.0
-                usdt_erc20_amount = 0.0
-                usdc_erc20_amount = 0.0
+                amounts = {cryptocurrency: 0.0 for cryptocurrency in Cryptocurrency}
                 for deposit in deposits:
-                    match deposit.network:
-                        case "BTC":
-                            btc_amount += deposit.amount / pow(10, 8)
-                        case "LTC":
-                            ltc_amount += deposit.amount / pow(10, 8)
-                        case "SOL":
-                            sol_amount += deposit.amount / pow(10, 9)
-                        case "TRX":
-                            divided_amount = deposit.amount / pow(10, 6)
-                            fiat_amount += divided_amount
-                            usdt_trc20_amount += divided_amount
-                        case "ETH":
-                            divided_amount = deposit.amount / pow(10, 6)
-                            fiat_amount += divided_amount
-                            match deposit.token_name:
-                                case "USDT_ERC20":
-                                    usdt_erc20_amount += divided_amount
-                                case "USDC_ERC20":
-                                    usdc_erc20_amount += divided_amount
-                btc_price = await CryptoApiManager.get_crypto_prices(Cryptocurrency.BTC)
-                ltc_price = await CryptoApiManager.get_crypto_prices(Cryptocurrency.LTC)
-                sol_price = await CryptoApiManager.get_crypto_prices(Cryptocurrency.SOL)
-                fiat_amount += (btc_amount * btc_price) + (ltc_amount * ltc_price) + (sol_amount * sol_price)
-                kb_builder.row(AdminConstants.back_to_main_button, unpacked_cb.get_back_button())
-                return Localizator.get_text(BotEntity.ADMIN, "deposits_statistics_msg").format(
+                    cryptocurrency = Cryptocurrency(deposit.token_name or deposit.network)
+                    amounts[cryptocurrency] += deposit.amount / pow(10, cryptocurrency.get_decimals())
+                fiat_amount = 0.0
+                stale_quotes = {}
+                for cryptocurrency, amount in amounts.items():
+                    if amount > 0:
+                        price_quote = await CryptoApiManager.get_crypto_quote(cryptocurrency)
+                        fiat_amount += amount * price_quote.price
+                        if price_quote.is_stale:
+                            stale_quotes[cryptocurrency] = price_quote
+                msg = Localizator.get_text(BotEntity.ADMIN, "deposits_statistics_msg").format(
                     timedelta=unpacked_cb.timedelta, deposits_count=len(deposits),
-                    btc_amount=btc_amount, ltc_amount=ltc_amount,
-                    sol_amount=sol_amount, usdt_trc20_amount=usdt_trc20_amount,
-                    usdt_erc20_amount=usdt_erc20_amount, usdc_erc20_amount=usdc_erc20_amount, fiat_amount=fiat_amount,
-                    currency_text=Localizator.get_currency_text()), kb_builder
+                    **{f"{cryptocurrency.value.lower()}_amount": amount for cryptocurrency, amount in amounts.items()},
+                    fiat_amount=fiat_amount,
+                    currency_text=Localizator.get_currency_text())
+                if len(stale_quotes) > 0:
+                    msg += Localizator.get_text(BotEntity.ADMIN, "stale_prices_warning").format(
+                        cryptocurrencies=", ".join(cryptocurrency.value for cryptocurrency in stale_quotes),
+                        minutes=max(int((time.monotonic() - price_quote.fetched_at) // 60)
+                                    for price_quote in stale_quotes.values()))
+                kb_builder.row(AdminConstants.back_to_main_button, unpacked_cb.get_back_button())
+                return msg, kb_builder
 
     @staticmethod
-    async def get_wallet_menu() -> tuple[str, InlineKeyboardBuilder]:
+    @KeyboardCache.static_menu("wallet_menu")
+    async def get_wallet_menu() -> tuple[str, InlineKeyboardMarkup]:
         kb_builder = InlineKeyboardBuilder()
         kb_builder.button(text=Localizator.get_text(BotEntity.ADMIN, "withdraw_funds"),
                           callback_data=WalletCallback.create(1))
@@ -421,7 +425,8 @@ class AdminService:
         return Localizator.get_text(BotEntity.ADMIN, "crypto_withdraw"), kb_builder
 
     @staticmethod
-    async def get_withdraw_menu():
+    @KeyboardCache.static_menu("withdraw_menu")
+    async def get_withdraw_menu() -> tuple[str, InlineKeyboardMarkup]:
         kb_builder = InlineKeyboardBuilder()
         kb_builder.row(AdminConstants.back_to_main_button)
         return Localizator.get_text(BotEntity.ADMIN, "choose_crypto_to_withdraw"), kb_builder
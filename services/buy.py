@@ -21,8 +21,7 @@ class BuyService:
         buy.is_refunded = True
         await BuyRepository.update(buy)
         user = await UserRepository.get_by_tgid(UserDTO(telegram_id=refund_data.telegram_id))
-        user.consume_records = user.consume_records - refund_data.total_price
-        await UserRepository.update(user)
+        await UserRepository.adjust_balance(user.id, consume_records=-refund_data.total_price)
         await NotificationService.refund(refund_data)
         if refund_data.telegram_username:
             return Localizator.get_text(BotEntity.ADMIN, "successfully_refunded_with_username").format(
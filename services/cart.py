@@ -1,65 +1,62 @@
+import asyncio
+import logging
+
 from aiogram.types import CallbackQuery, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from callbacks import AllCategoriesCallback, CartCallback
 from enums.bot_entity import BotEntity
 from handlers.common.common import add_pagination_buttons
-from models.buy import BuyDTO
-from models.buyItem import BuyItemDTO
-from models.cartItem import CartItemDTO
-from models.item import ItemDTO
+from models.cart import CheckoutDTO
+from models.cartItem import CartItemDTO, CartItemDetailsDTO
 from models.user import UserDTO
-from repositories.buy import BuyRepository
-from repositories.buyItem import BuyItemRepository
 from repositories.cart import CartRepository
 from repositories.cartItem import CartItemRepository
 from repositories.item import ItemRepository
-from repositories.subcategory import SubcategoryRepository
 from repositories.user import UserRepository
 from services.message import MessageService
 from services.notification import NotificationService
 from utils.localizator import Localizator
 
 
+# The sweeper releases the expired cart reservations in batches, each one a short transaction
+RESERVATION_SWEEP_INTERVAL = 60
+RESERVATION_SWEEP_BATCH = 500
+
+
 class CartService:
 
     @staticmethod
     async def add_to_cart(callback: CallbackQuery):
         unpacked_cb = AllCategoriesCallback.unpack(callback.data)
-        user = await UserRepository.get_by_tgid(UserDTO(telegram_id=callback.from_user.id))
-        cart = await CartRepository.get_or_create(user.id)
+        cart_id = await CartRepository.get_id_by_telegram_id(callback.from_user.id)
         cart_item = CartItemDTO(
             category_id=unpacked_cb.category_id,
             subcategory_id=unpacked_cb.subcategory_id,
             quantity=unpacked_cb.quantity,
-            cart_id=cart.id
+            cart_id=cart_id
         )
-        await CartRepository.add_to_cart(cart_item, cart)
+        await CartRepository.add_to_cart(cart_item)
 
     @staticmethod
     async def create_buttons(message: Message | CallbackQuery):
-        user = await UserRepository.get_by_tgid(UserDTO(telegram_id=message.from_user.id))
-        page = 0 if isinstance(message, Message) else CartCallback.unpack(message.data).page
-        cart_items = await CartItemRepository.get_by_user_id(user.id, 0)
+        unpacked_cb = CartCallback.create(0) if isinstance(message, Message) else CartCallback.unpack(message.data)
+        page, cursor = unpacked_cb.page, unpacked_cb.cursor
+        cart_id = await CartRepository.get_id_by_telegram_id(message.from_user.id)
+        cart_items, total = await CartItemRepository.get_by_cart_id(cart_id, cursor)
         kb_builder = InlineKeyboardBuilder()
         for cart_item in cart_items:
-            item_dto = ItemDTO(category_id=cart_item.category_id, subcategory_id=cart_item.subcategory_id)
-            price = await ItemRepository.get_price(item_dto)
-            subcategory = await SubcategoryRepository.get_by_id(cart_item.subcategory_id)
             kb_builder.button(text=Localizator.get_text(BotEntity.USER, "cart_item_button").format(
-                subcategory_name=subcategory.name,
+                subcategory_name=cart_item.subcategory_name,
                 qty=cart_item.quantity,
-                total_price=cart_item.quantity * price,
+                total_price=cart_item.quantity * cart_item.price,
                 currency_sym=Localizator.get_currency_symbol()),
-                callback_data=CartCallback.create(1, page, cart_item_id=cart_item.id))
-        if len(kb_builder.as_markup().inline_keyboard) > 0:
-            cart = await CartRepository.get_or_create(user.id)
-            unpacked_cb = CartCallback.create(0) if isinstance(message, Message) else CartCallback.unpack(message.data)
+                callback_data=CartCallback.create(1, page, cart_item_id=cart_item.id, cursor=cursor))
+        if len(cart_items) > 0:
             kb_builder.button(text=Localizator.get_text(BotEntity.USER, "checkout"),
-                              callback_data=CartCallback.create(2, page, cart.id))
+                              callback_data=CartCallback.create(2, page, cart_id, cursor=cursor))
             kb_builder.adjust(1)
-            kb_builder = await add_pagination_buttons(kb_builder, unpacked_cb,
-                                                      CartItemRepository.get_maximum_page(user.id),
-                                                      None)
+            kb_builder = add_pagination_buttons(kb_builder, unpacked_cb, total, None,
+                                                [cart_item.id for cart_item in cart_items])
             return Localizator.get_text(BotEntity.USER, "cart"), kb_builder
         else:
             return Localizator.get_text(BotEntity.USER, "no_cart_items"), kb_builder
@@ -81,18 +78,15 @@ class CartService:
             return Localizator.get_text(BotEntity.USER, "delete_cart_item_confirmation"), kb_builder
 
     @staticmethod
-    async def __create_checkout_msg(cart_items: list[CartItemDTO]) -> str:
+    def __create_checkout_msg(cart_items: list[CartItemDetailsDTO]) -> str:
         message_text = Localizator.get_text(BotEntity.USER, "cart_confirm_checkout_process")
         message_text += "<b>\n\n"
         cart_grand_total = 0.0
 
         for cart_item in cart_items:
-            item_dto = ItemDTO(category_id=cart_item.category_id, subcategory_id=cart_item.subcategory_id)
-            price = await ItemRepository.get_price(item_dto)
-            subcategory = await SubcategoryRepository.get_by_id(cart_item.subcategory_id)
-            line_item_total = price * cart_item.quantity
+            line_item_total = cart_item.price * cart_item.quantity
             cart_line_item = Localizator.get_text(BotEntity.USER, "cart_item_button").format(
-                subcategory_name=subcategory.name, qty=cart_item.quantity,
+                subcategory_name=cart_item.subcategory_name, qty=cart_item.quantity,
                 total_price=line_item_total, currency_sym=Localizator.get_currency_symbol()
             )
             cart_grand_total += line_item_total
@@ -104,9 +98,9 @@ class CartService:
 
     @staticmethod
     async def checkout_processing(callback: CallbackQuery) -> tuple[str, InlineKeyboardBuilder]:
-        user = await UserRepository.get_by_tgid(UserDTO(telegram_id=callback.from_user.id))
-        cart_items = await CartItemRepository.get_all_by_user_id(user.id)
-        message_text = await CartService.__create_checkout_msg(cart_items)
+        cart_id = await CartRepository.get_id_by_telegram_id(callback.from_user.id)
+        cart_items = await CartItemRepository.get_all_by_cart_id(cart_id)
+        message_text = CartService.__create_checkout_msg(cart_items)
         kb_builder = InlineKeyboardBuilder()
         kb_builder.button(text=Localizator.get_text(BotEntity.COMMON, "confirm"),
                           callback_data=CartCallback.create(3,
@@ -118,51 +112,57 @@ class CartService:
     @staticmethod
     async def buy_processing(callback: CallbackQuery) -> tuple[str, InlineKeyboardBuilder]:
         unpacked_cb = CartCallback.unpack(callback.data)
-        user = await UserRepository.get_by_tgid(UserDTO(telegram_id=callback.from_user.id))
-        cart_items = await CartItemRepository.get_all_by_user_id(user.id)
-        cart_total = 0.0
-        out_of_stock = []
-        for cart_item in cart_items:
-            item_dto = ItemDTO(category_id=cart_item.category_id, subcategory_id=cart_item.subcategory_id)
-            price = await ItemRepository.get_price(item_dto)
-            cart_total += price * cart_item.quantity
-            is_in_stock = await ItemRepository.get_available_qty(item_dto) >= cart_item.quantity
-            if is_in_stock is False:
-                out_of_stock.append(cart_item)
-        is_enough_money = (user.top_up_amount - user.consume_records) >= cart_total
         kb_builder = InlineKeyboardBuilder()
-        if unpacked_cb.confirmation and len(out_of_stock) == 0 and is_enough_money:
-            sold_items = []
-            msg = ""
-            for cart_item in cart_items:
-                price = await ItemRepository.get_price(ItemDTO(category_id=cart_item.category_id,
-                                                               subcategory_id=cart_item.subcategory_id))
-                purchased_items = await ItemRepository.get_purchased_items(cart_item.category_id,
-                                                                           cart_item.subcategory_id, cart_item.quantity)
-                buy_dto = BuyDTO(buyer_id=user.id, quantity=cart_item.quantity, total_price=cart_item.quantity * price)
-                buy_id = await BuyRepository.create(buy_dto)
-                buy_item_dto_list = [BuyItemDTO(item_id=item.id, buy_id=buy_id) for item in purchased_items]
-                await BuyItemRepository.create_many(buy_item_dto_list)
-                for item in purchased_items:
-                    item.is_sold = True
-                await ItemRepository.update(purchased_items)
-                await CartItemRepository.remove_from_cart(cart_item.id)
-                sold_items.append(cart_item)
-                msg += MessageService.create_message_with_bought_items(purchased_items)
-            user.consume_records = user.consume_records + cart_total
-            await UserRepository.update(user)
-            await NotificationService.new_buy(sold_items, user)
-            return msg, kb_builder
-        elif unpacked_cb.confirmation is False:
+        if unpacked_cb.confirmation is False:
             kb_builder.row(unpacked_cb.get_back_button(0))
             return Localizator.get_text(BotEntity.USER, "purchase_confirmation_declined"), kb_builder
-        elif is_enough_money is False:
-            kb_builder.row(unpacked_cb.get_back_button(0))
-            return Localizator.get_text(BotEntity.USER, "insufficient_funds"), kb_builder
-        elif len(out_of_stock) > 0:
+        user = await UserRepository.get_by_tgid(UserDTO(telegram_id=callback.from_user.id))
+        cart_id = await CartRepository.get_id_by_telegram_id(callback.from_user.id)
+        cart_items = await CartItemRepository.get_all_by_cart_id(cart_id)
+        if len(cart_items) == 0:
+            return Localizator.get_text(BotEntity.USER, "no_cart_items"), kb_builder
+        # A cart that can't be bought according to the snapshot is refused before taking the write lock,
+        # the checkout transaction checks the stock and the balance again
+        cart_total = sum(cart_item.price * cart_item.quantity for cart_item in cart_items)
+        checkout = CheckoutDTO(
+            out_of_stock=[cart_item for cart_item in cart_items
+                          if cart_item.available_qty + cart_item.reserved_qty < cart_item.quantity],
+            is_enough_money=user.top_up_amount - user.consume_records >= cart_total)
+        if len(checkout.out_of_stock) == 0 and checkout.is_enough_money:
+            checkout = await CartRepository.checkout(user.id, cart_items)
+        if len(checkout.out_of_stock) > 0:
             kb_builder.row(unpacked_cb.get_back_button(0))
             msg = Localizator.get_text(BotEntity.USER, "out_of_stock")
-            for item in out_of_stock:
-                subcategory = await SubcategoryRepository.get_by_id(item.subcategory_id)
-                msg += subcategory.name + "\n"
+            for item in checkout.out_of_stock:
+                msg += item.subcategory_name + "\n"
+            return msg, kb_builder
+        elif checkout.is_enough_money is False:
+            kb_builder.row(unpacked_cb.get_back_button(0))
+            return Localizator.get_text(BotEntity.USER, "insufficient_funds"), kb_builder
+        else:
+            msg = ""
+            for purchased_items in checkout.purchased_items:
+                msg += MessageService.create_message_with_bought_items(purchased_items)
+            user.consume_records = checkout.consume_records
+            await NotificationService.new_buy(checkout.sold_items, user)
             return msg, kb_builder
+
+    @staticmethod
+    async def release_expired_reservations() -> int:
+        released_total = 0
+        released = RESERVATION_SWEEP_BATCH
+        while released == RESERVATION_SWEEP_BATCH:
+            released = await ItemRepository.release_expired(RESERVATION_SWEEP_BATCH)
+            released_total += released
+        return released_total
+
+    @staticmethod
+    async def run_reservation_sweeper():
+        while True:
+            await asyncio.sleep(RESERVATION_SWEEP_INTERVAL)
+            try:
+                released = await CartService.release_expired_reservations()
+                if released > 0:
+                    logging.info(f"Released {released} expired cart reservations")
+            except Exception as e:
+                logging.exception(e)
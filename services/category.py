@@ -1,31 +1,37 @@
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from callbacks import AllCategoriesCallback
 from enums.bot_entity import BotEntity
 from handlers.common.common import add_pagination_buttons
 from repositories.category import CategoryRepository
+from utils.catalog_cache import CatalogCache
+from utils.keyboard_cache import KeyboardCache
 from utils.localizator import Localizator
 
 
 class CategoryService:
 
     @staticmethod
-    async def get_buttons(callback: CallbackQuery | None = None) -> tuple[str, InlineKeyboardBuilder]:
+    async def get_buttons(callback: CallbackQuery | None = None) -> tuple[str, InlineKeyboardMarkup]:
         if callback is None:
             unpacked_cb = AllCategoriesCallback.create(0)
         else:
             unpacked_cb = AllCategoriesCallback.unpack(callback.data)
-        categories = await CategoryRepository.get(unpacked_cb.page)
+        return await KeyboardCache.get_or_build(("categories", unpacked_cb.pack(), CatalogCache.inventory_version),
+                                                lambda: CategoryService.__create_buttons(unpacked_cb))
+
+    @staticmethod
+    async def __create_buttons(unpacked_cb: AllCategoriesCallback) -> tuple[str, InlineKeyboardBuilder]:
+        categories, total = await CategoryRepository.get(unpacked_cb.cursor)
         categories_builder = InlineKeyboardBuilder()
         [categories_builder.button(text=category.name,
                                    callback_data=AllCategoriesCallback.create(
                                        level=1,
                                        category_id=category.id)) for category in categories]
         categories_builder.adjust(2)
-        categories_builder = await add_pagination_buttons(categories_builder, unpacked_cb,
-                                                          CategoryRepository.get_maximum_page(),
-                                                          None)
-        if len(categories_builder.as_markup().inline_keyboard) == 0:
+        categories_builder = add_pagination_buttons(categories_builder, unpacked_cb, total, None,
+                                                    [category.id for category in categories])
+        if len(categories) == 0:
             return Localizator.get_text(BotEntity.USER, "no_categories"), categories_builder
         else:
             return Localizator.get_text(BotEntity.USER, "all_categories"), categories_builder
@@ -4,6 +4,7 @@ from callbacks import AddType
 from enums.bot_entity import BotEntity
 from models.item import ItemDTO
 from repositories.category import CategoryRepository
+from repositories.inventorySummary import InventorySummaryRepository
 from repositories.item import ItemRepository
 from repositories.subcategory import SubcategoryRepository
 from utils.localizator import Localizator
@@ -19,19 +20,30 @@ class ItemService:
     async def get_in_stock_items():
         return await ItemRepository.get_in_stock()
 
+    @staticmethod
+    async def __get_or_create_ids(category_name: str, subcategory_name: str, ids_cache: dict) -> tuple[int, int]:
+        # An import file repeats the same few (sub-)categories, so each one is looked up once per file
+        key = (category_name, subcategory_name)
+        if key not in ids_cache:
+            category = await CategoryRepository.get_or_create(category_name)
+            subcategory = await SubcategoryRepository.get_or_create(subcategory_name)
+            ids_cache[key] = (category.id, subcategory.id)
+        return ids_cache[key]
+
     @staticmethod
     async def parse_items_json(path_to_file):
         with open(path_to_file, 'r', encoding='utf-8') as file:
             items = load(file)
             items_list = []
+            ids_cache = {}
             for item in items:
-                category = await CategoryRepository.get_or_create(item['category'])
-                subcategory = await SubcategoryRepository.get_or_create(item['subcategory'])
+                category_id, subcategory_id = await ItemService.__get_or_create_ids(item['category'],
+                                                                                    item['subcategory'], ids_cache)
                 item.pop('category')
                 item.pop('subcategory')
                 items_list.append(ItemDTO(
-                    category_id=category.id,
-                    subcategory_id=subcategory.id,
+                    category_id=category_id,
+                    subcategory_id=subcategory_id,
                     **item
                 ))
             return items_list
@@ -41,13 +53,14 @@ class ItemService:
         with open(path_to_file, 'r', encoding='utf-8') as file:
             lines = file.readlines()
             items_list = []
+            ids_cache = {}
             for line in lines:
                 category_name, subcategory_name, description, price, private_data = line.split(';')
-                category = await CategoryRepository.get_or_create(category_name)
-                subcategory = await SubcategoryRepository.get_or_create(subcategory_name)
+                category_id, subcategory_id = await ItemService.__get_or_create_ids(category_name, subcategory_name,
+                                                                                    ids_cache)
                 items_list.append(ItemDTO(
-                    category_id=category.id,
-                    subcategory_id=subcategory.id,
+                    category_id=category_id,
+                    subcategory_id=subcategory_id,
                     price=float(price),
                     description=description,
                     private_data=private_data
@@ -68,3 +81,8 @@ class ItemService:
             return Localizator.get_text(BotEntity.ADMIN, "add_items_err").format(adding_result=e)
         finally:
             Path(path_to_file).unlink(missing_ok=True)
+
+    @staticmethod
+    async def rebuild_inventory_summary() -> str:
+        rows = await InventorySummaryRepository.rebuild()
+        return Localizator.get_text(BotEntity.ADMIN, "inventory_summary_rebuilt").format(rows=rows)
@@ -5,15 +5,12 @@ from aiogram.enums import ParseMode
 from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from config import ADMIN_ID_LIST, TOKEN
+from db import commit_unit_of_work
 from enums.bot_entity import BotEntity
 from enums.cryptocurrency import Cryptocurrency
 from models.buy import RefundDTO
-from models.cartItem import CartItemDTO
-from models.item import ItemDTO
+from models.cartItem import CartItemDetailsDTO
 from models.user import UserDTO
-from repositories.category import CategoryRepository
-from repositories.item import ItemRepository
-from repositories.subcategory import SubcategoryRepository
 from utils.localizator import Localizator
 
 
@@ -29,12 +26,14 @@ class NotificationService:
 
     @staticmethod
     async def send_to_admins(message: str, reply_markup: types.InlineKeyboardMarkup):
-        bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-        for admin_id in ADMIN_ID_LIST:
-            try:
-                await bot.send_message(admin_id, f"<b>{message}</b>", reply_markup=reply_markup)
-            except Exception as e:
-                logging.error(e)
+        await commit_unit_of_work()
+        # closed on exit, the deposit scanner sends these in the background for every credited deposit
+        async with Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML)) as bot:
+            for admin_id in ADMIN_ID_LIST:
+                try:
+                    await bot.send_message(admin_id, f"<b>{message}</b>", reply_markup=reply_markup)
+                except Exception as e:
+                    logging.error(e)
 
     @staticmethod
     async def new_deposit(deposit_amount: float, cryptocurrency: Cryptocurrency, fiat_amount: float, user_dto: UserDTO):
@@ -62,32 +61,43 @@ class NotificationService:
         await NotificationService.send_to_admins(message, user_button)
 
     @staticmethod
-    async def new_buy(sold_items: list[CartItemDTO], user: UserDTO):
+    async def deposit_credited(deposit_amount: float, cryptocurrency: Cryptocurrency, fiat_amount: float,
+                               user_dto: UserDTO):
+        user_notification = Localizator.get_text(BotEntity.USER, "deposit_credited_notification").format(
+            value=deposit_amount,
+            crypto_name=cryptocurrency.value.replace('_', ' '),
+            fiat_amount=fiat_amount,
+            currency_sym=Localizator.get_currency_symbol())
+        await commit_unit_of_work()
+        try:
+            async with Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML)) as bot:
+                await bot.send_message(user_dto.telegram_id, text=user_notification)
+        except Exception as e:
+            logging.warning(e)
+
+    @staticmethod
+    async def new_buy(sold_items: list[CartItemDetailsDTO], user: UserDTO):
         user_button = await NotificationService.make_user_button(user.telegram_username)
         cart_grand_total = 0.0
         message = ""
         for item in sold_items:
-            price = await ItemRepository.get_price(ItemDTO(subcategory_id=item.subcategory_id,
-                                                           category_id=item.category_id))
-            category = await CategoryRepository.get_by_id(item.category_id)
-            subcategory = await SubcategoryRepository.get_by_id(item.subcategory_id)
-            cart_item_total = price * item.quantity
+            cart_item_total = item.price * item.quantity
             cart_grand_total += cart_item_total
             if user.telegram_username:
                 message += Localizator.get_text(BotEntity.ADMIN, "notification_purchase_with_tgid").format(
                     username=user.telegram_username,
                     total_price=cart_item_total,
                     quantity=item.quantity,
-                    category_name=category.name,
-                    subcategory_name=subcategory.name,
+                    category_name=item.category_name,
+                    subcategory_name=item.subcategory_name,
                     currency_sym=Localizator.get_currency_symbol()) + "\n"
             else:
                 message += Localizator.get_text(BotEntity.ADMIN, "notification_purchase_with_username").format(
                     telegram_id=user.telegram_id,
                     total_price=cart_item_total,
                     quantity=item.quantity,
-                    category_name=category.name,
-                    subcategory_name=subcategory.name,
+                    category_name=item.category_name,
+                    subcategory_name=item.subcategory_name,
                     currency_sym=Localizator.get_currency_symbol()) + "\n"
         message += Localizator.get_text(BotEntity.USER, "cart_grand_total_string").format(
             cart_grand_total=cart_grand_total, currency_sym=Localizator.get_currency_symbol())
@@ -100,8 +110,9 @@ class NotificationService:
             quantity=refund_data.quantity,
             subcategory=refund_data.subcategory_name,
             currency_sym=Localizator.get_currency_symbol())
+        await commit_unit_of_work()
         try:
-            bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-            await bot.send_message(refund_data.telegram_id, text=user_notification)
+            async with Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML)) as bot:
+                await bot.send_message(refund_data.telegram_id, text=user_notification)
         except Exception as _:
             pass
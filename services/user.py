@@ -1,21 +1,36 @@
-from datetime import datetime
-from aiogram.types import CallbackQuery
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from callbacks import MyProfileCallback
 from crypto_api.CryptoApiManager import CryptoApiManager
 from enums.bot_entity import BotEntity
 from enums.cryptocurrency import Cryptocurrency
 from enums.user import UserResponse
+from models.depositCursor import DepositCursorDTO
+from models.depositWatch import DepositWatchDTO
 from models.user import User, UserDTO
 from repositories.buy import BuyRepository
 from repositories.buyItem import BuyItemRepository
 from repositories.cart import CartRepository
+from repositories.deposit import DepositRepository
+from repositories.depositCursor import DepositCursorRepository
+from repositories.depositWatch import DepositWatchRepository
 from repositories.item import ItemRepository
 from repositories.subcategory import SubcategoryRepository
 from repositories.user import UserRepository
 from services.notification import NotificationService
+from utils.keyboard_cache import KeyboardCache
 from utils.localizator import Localizator
 
+# Addresses are watched for a while after the user asked for one, the scanner visits each of them once per interval
+DEPOSIT_WATCH_MINUTES = 120
+DEPOSIT_SCAN_INTERVAL = 30
+DEPOSIT_SCAN_BATCH = 100
+DEPOSIT_SCAN_CONCURRENCY = 2
+
 
 class UserService:
 
@@ -27,43 +42,118 @@ class UserService:
                 user_id = await UserRepository.create(user_dto)
                 await CartRepository.get_or_create(user_id)
             case _:
-                update_user_dto = UserDTO(**user.__dict__)
-                update_user_dto.can_receive_messages = True
-                update_user_dto.telegram_username = user_dto.telegram_username
+                # only the changed fields, the balances may be credited by the deposit scanner meanwhile
+                update_user_dto = UserDTO(telegram_id=user.telegram_id, can_receive_messages=True,
+                                          telegram_username=user_dto.telegram_username)
                 await UserRepository.update(update_user_dto)
 
     @staticmethod
     async def get(user_dto: UserDTO) -> User | None:
         return await UserRepository.get_by_tgid(user_dto)
 
+    @staticmethod
+    async def watch_deposits(user_id: int, cryptocurrency: Cryptocurrency):
+        await DepositWatchRepository.watch(DepositWatchDTO(
+            user_id=user_id,
+            cryptocurrency=cryptocurrency.value,
+            watch_until=datetime.now() + timedelta(minutes=DEPOSIT_WATCH_MINUTES)))
+
     @staticmethod
     async def refresh_balance(callback: CallbackQuery) -> tuple[str, UserResponse]:
-        user_dto = UserDTO.model_validate(await UserRepository.get_by_tgid(UserDTO(telegram_id=callback.from_user.id)),
-                                          from_attributes=True)
+        # The deposits are ingested by the deposit scanner, the refresh only reports the ones credited since the
+        # previous refresh and asks the scanner to look at the address again on its next run
+        user_dto = await UserRepository.get_by_tgid(UserDTO(telegram_id=callback.from_user.id))
         cryptocurrency = Cryptocurrency(MyProfileCallback.unpack(callback.data).args_for_action)
-        now_time = datetime.now()
-        if user_dto.last_balance_refresh is None or (
-                user_dto.last_balance_refresh is not None and (
-                now_time - user_dto.last_balance_refresh).total_seconds() > 30):
-            user_dto.last_balance_refresh = now_time
-            await UserRepository.update(user_dto)
-            deposits_amount = await CryptoApiManager.get_new_deposits_amount(user_dto, cryptocurrency)
-            if deposits_amount > 0:
-                crypto_price = await CryptoApiManager.get_crypto_prices(cryptocurrency)
-                fiat_amount = deposits_amount * crypto_price
-                new_crypto_balance = getattr(user_dto, cryptocurrency.get_balance_field()) + deposits_amount
-                setattr(user_dto, cryptocurrency.get_balance_field(), new_crypto_balance)
-                user_dto.top_up_amount = user_dto.top_up_amount + fiat_amount
-                await UserRepository.update(user_dto)
-                await NotificationService.new_deposit(deposits_amount, cryptocurrency, fiat_amount, user_dto)
-                return (Localizator.get_text(BotEntity.USER, "balance_refreshed_successfully"),
-                        UserResponse.BALANCE_REFRESHED)
-            else:
-                return (Localizator.get_text(BotEntity.USER, "balance_not_refreshed"),
-                        UserResponse.BALANCE_NOT_REFRESHED)
+        await UserService.watch_deposits(user_dto.id, cryptocurrency)
+        deposits_count = await DepositRepository.get_count_since(user_dto.id,
+                                                                 user_dto.last_balance_refresh or datetime.min)
+        await UserRepository.update(UserDTO(telegram_id=user_dto.telegram_id, last_balance_refresh=datetime.now()))
+        if deposits_count > 0:
+            return (Localizator.get_text(BotEntity.USER, "balance_refreshed_successfully"),
+                    UserResponse.BALANCE_REFRESHED)
         else:
-            return (Localizator.get_text(BotEntity.USER, "balance_refresh_timeout"),
-                    UserResponse.BALANCE_REFRESH_COOLDOWN)
+            return (Localizator.get_text(BotEntity.USER, "balance_not_refreshed"),
+                    UserResponse.BALANCE_NOT_REFRESHED)
+
+    @staticmethod
+    async def credit_new_deposits(user_dto: UserDTO, chain: str) -> float:
+        position = await DepositCursorRepository.get_position(user_dto.id, chain)
+        deposits, new_position = await CryptoApiManager.get_deposits(user_dto, chain, position)
+        deposit_keys = await DepositRepository.get_keys_by_tx_ids({deposit.tx_id for deposit in deposits})
+        new_deposits = [deposit for deposit in deposits
+                        if (deposit.tx_id, deposit.vout, deposit.network) not in deposit_keys]
+        if len(new_deposits) == 0:
+            await UserService.advance_deposit_cursor(user_dto.id, chain, position, new_position)
+            return 0.0
+        # the prices are fetched before the write transaction, which must not wait on the network
+        crypto_prices = {}
+        for cryptocurrency in {Cryptocurrency(deposit.token_name or deposit.network) for deposit in new_deposits}:
+            price_quote = await CryptoApiManager.get_crypto_quote(cryptocurrency)
+            if price_quote.is_stale:
+                logging.warning(f"Crediting {cryptocurrency.value} deposits of user {user_dto.id} "
+                                f"at a stale price of {price_quote.price}")
+            crypto_prices[cryptocurrency] = price_quote.price
+        deposits_amounts = await DepositRepository.ingest(new_deposits, crypto_prices)
+        # moved only after the deposits are in, a scan failing before that starts over from the old position
+        await UserService.advance_deposit_cursor(user_dto.id, chain, position, new_position)
+        for cryptocurrency, deposits_amount in deposits_amounts.items():
+            fiat_amount = deposits_amount * crypto_prices[cryptocurrency]
+            await NotificationService.new_deposit(deposits_amount, cryptocurrency, fiat_amount, user_dto)
+            await NotificationService.deposit_credited(deposits_amount, cryptocurrency, fiat_amount, user_dto)
+        return sum(deposits_amounts.values())
+
+    @staticmethod
+    async def advance_deposit_cursor(user_id: int, chain: str, position: int | None, new_position: int | None):
+        if new_position is not None and new_position != position:
+            await DepositCursorRepository.advance(DepositCursorDTO(user_id=user_id, network=chain,
+                                                                   position=new_position))
+
+    @staticmethod
+    async def scan_deposits(chain: str, user_dto: UserDTO):
+        try:
+            await UserService.credit_new_deposits(user_dto, chain)
+        except Exception as e:
+            logging.warning(f"Deposit scan of {chain} for user {user_dto.id} failed: {e!r}")
+
+    @staticmethod
+    async def scan_chain(chain: str, users: list[UserDTO]):
+        # Each chain has its own provider, its addresses are scanned a few at a time to stay within its quota
+        semaphore = asyncio.Semaphore(DEPOSIT_SCAN_CONCURRENCY)
+
+        async def scan(user_dto: UserDTO):
+            async with semaphore:
+                await UserService.scan_deposits(chain, user_dto)
+
+        await asyncio.gather(*[scan(user_dto) for user_dto in users])
+
+    @staticmethod
+    async def scan_watched_deposits() -> int:
+        scan_started_at = datetime.now()
+        deposit_watches = await DepositWatchRepository.get_due(
+            scan_started_at - timedelta(seconds=DEPOSIT_SCAN_INTERVAL), DEPOSIT_SCAN_BATCH)
+        if len(deposit_watches) == 0:
+            return 0
+        # marked first, so an address whose scan keeps failing waits for its turn like the others
+        await DepositWatchRepository.mark_scanned([deposit_watch for deposit_watch, _ in deposit_watches],
+                                                  scan_started_at)
+        # one scan per chain and address covers the coin and all the tokens watched on it
+        chains = defaultdict(dict)
+        for deposit_watch, user_dto in deposit_watches:
+            chains[Cryptocurrency(deposit_watch.cryptocurrency).get_chain()][user_dto.id] = user_dto
+        await asyncio.gather(*[UserService.scan_chain(chain, list(users.values())) for chain, users in chains.items()])
+        return sum(len(users) for users in chains.values())
+
+    @staticmethod
+    async def run_deposit_scanner():
+        while True:
+            await asyncio.sleep(DEPOSIT_SCAN_INTERVAL)
+            try:
+                await DepositWatchRepository.delete_expired()
+                scanned = await UserService.scan_watched_deposits()
+                if scanned > 0:
+                    logging.info(f"Scanned {scanned} watched deposit addresses")
+            except Exception as e:
+                logging.exception(e)
 
     @staticmethod
     async def get_my_profile_buttons(user_dto: UserDTO) -> tuple[str, InlineKeyboardBuilder]:
@@ -88,8 +178,9 @@ class UserService:
         return message, kb_builder
 
     @staticmethod
-    async def get_top_up_buttons(callback: CallbackQuery) -> tuple[str, InlineKeyboardBuilder]:
-        unpacked_cb = MyProfileCallback.unpack(callback.data)
+    @KeyboardCache.static_menu("top_up_menu")
+    async def get_top_up_buttons() -> tuple[str, InlineKeyboardMarkup]:
+        unpacked_cb = MyProfileCallback.create(1, "top_up")
         kb_builder = InlineKeyboardBuilder()
         kb_builder.button(text=Localizator.get_text(BotEntity.COMMON, "btc_top_up"),
                           callback_data=MyProfileCallback.create(unpacked_cb.level + 1,
@@ -119,7 +210,7 @@ class UserService:
             -> tuple[str, InlineKeyboardBuilder]:
         unpacked_cb = MyProfileCallback.unpack(callback.data)
         user = await UserRepository.get_by_tgid(UserDTO(telegram_id=telegram_id))
-        buys = await BuyRepository.get_by_buyer_id(user.id, unpacked_cb.page)
+        buys = await BuyRepository.get_by_buyer_id(user.id, unpacked_cb.cursor)
         kb_builder = InlineKeyboardBuilder()
         for buy in buys:
             buy_item = await BuyItemRepository.get_single_by_buy_id(buy.id)
@@ -136,7 +227,7 @@ class UserService:
                 ))
         kb_builder.adjust(1)
         kb_builder.row(unpacked_cb.get_back_button(0))
-        if len(kb_builder.as_markup().inline_keyboard) > 1:
+        if len(buys) > 0:
             return Localizator.get_text(BotEntity.USER, "purchases"), kb_builder
         else:
             return Localizator.get_text(BotEntity.USER, "no_purchases"), kb_builder
@@ -147,6 +238,7 @@ class UserService:
         payment_method = Cryptocurrency(unpacked_cb.args_for_action)
         user = await UserService.get(UserDTO(telegram_id=callback.from_user.id))
         addr = getattr(user, payment_method.get_address_field())
+        await UserService.watch_deposits(user.id, payment_method)
         bot = await callback.bot.get_me()
         msg = Localizator.get_text(BotEntity.USER, "top_up_balance_msg").format(
             bot_name=bot.first_name,
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+
+"""
+The tests run against a throwaway SQLite database in a temporary working directory,
+without the .env of the bot and without opening an ngrok tunnel.
+Run them from the repository root with: python -m pytest tests (or python -m unittest discover tests)
+"""
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_ROOT))
+os.environ.update(DB_NAME="test.db", DB_ENCRYPTION="false", TOKENS_FILE=str(REPOSITORY_ROOT / "tokens.json"))
+for name, value in dict(WEBHOOK_PATH="/", WEBAPP_HOST="localhost", WEBAPP_PORT="5000", TOKEN="1:test",
+                        ADMIN_ID_LIST="1", PAGE_ENTRIES="8", BOT_LANGUAGE="en", CURRENCY="USD").items():
+    os.environ.setdefault(name, value)
+sys.modules["ngrok_executor"] = types.SimpleNamespace(start_ngrok=lambda: "https://localhost")
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import text  # noqa: E402
+
+import db  # noqa: E402
+from repositories.cart import CartRepository  # noqa: E402
+from utils.catalog_cache import CatalogCache  # noqa: E402
+
+
+class DatabaseTestCase(IsolatedAsyncioTestCase):
+    # Every test starts with an empty, fully migrated database. The pooled connections belong to the event loop
+    # of the test, so they are closed after each one.
+
+    async def asyncSetUp(self):
+        for path in Path("data").glob(f"{db.DB_NAME}*"):
+            path.unlink()
+        CatalogCache.invalidate()
+        CartRepository._cart_ids.clear()
+        await db.create_db_and_tables()
+
+    async def asyncTearDown(self):
+        await db.engine.dispose()
+        await db.reader_engine.dispose()
+
+    @staticmethod
+    async def execute(statement: str, params: dict | list[dict] | None = None) -> list:
+        async with db.session_maker() as session:
+            result = await session.execute(text(statement), params)
+            rows = result.all() if result.returns_rows else []
+            await session.commit()
+            return rows
+
+    @staticmethod
+    async def create_user(user_id: int, top_up_amount: float = 0.0):
+        # inserted directly, UserRepository.create derives the wallet addresses from a new seed
+        await DatabaseTestCase.execute(
+            "INSERT INTO users (id, telegram_id, btc_address, ltc_address, trx_address, eth_address, sol_address, "
+            "seed, top_up_amount, consume_records, btc_balance, ltc_balance, sol_balance, usdt_trc20_balance, "
+            "usdt_erc20_balance, usdc_erc20_balance) VALUES (:id, :id, 'btc' || :id, 'ltc' || :id, 'trx' || :id, "
+            "'eth' || :id, 'sol' || :id, 'seed' || :id, :top_up_amount, 0, 0, 0, 0, 0, 0, 0)",
+            {"id": user_id, "top_up_amount": top_up_amount})
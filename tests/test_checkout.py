@@ -0,0 +1,76 @@
+import asyncio
+import random
+
+from tests import DatabaseTestCase
+from db import UnitOfWork, current_unit_of_work
+from models.cart import CheckoutDTO
+from models.item import ItemDTO
+from repositories.cart import CartRepository
+from repositories.cartItem import CartItemRepository
+from repositories.category import CategoryRepository
+from repositories.item import ItemRepository
+from repositories.subcategory import SubcategoryRepository
+
+
+class ConcurrentCheckoutTest(DatabaseTestCase):
+    items_per_subcategory = 10
+    users = 30
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        category = await CategoryRepository.get_or_create("category")
+        subcategories = [await SubcategoryRepository.get_or_create(name) for name in ("first", "second")]
+        await ItemRepository.add_many([ItemDTO(category_id=category.id, subcategory_id=subcategory.id,
+                                               private_data=f"{subcategory.name} {number}", price=1.0,
+                                               description="description")
+                                       for subcategory in subcategories
+                                       for number in range(self.items_per_subcategory)])
+        # more demand than stock, and some of the users can't afford their cart
+        generator = random.Random(0)
+        for user_id in range(1, self.users + 1):
+            await self.create_user(user_id, top_up_amount=generator.choice([3.0, 100.0]))
+            await self.execute("INSERT INTO carts (id, user_id) VALUES (:id, :id)", {"id": user_id})
+            await self.execute("INSERT INTO cart_items (cart_id, category_id, subcategory_id, quantity) "
+                               "VALUES (:cart_id, :category_id, :subcategory_id, :quantity)",
+                               [{"cart_id": user_id, "category_id": category.id, "subcategory_id": subcategory.id,
+                                 "quantity": generator.randint(1, 3)} for subcategory in subcategories])
+
+    @staticmethod
+    async def checkout(user_id: int) -> CheckoutDTO:
+        # each checkout in its own unit of work, like the updates handled by UnitOfWorkMiddleware
+        unit_of_work = UnitOfWork()
+        token = current_unit_of_work.set(unit_of_work)
+        try:
+            cart_items = await CartItemRepository.get_all_by_cart_id(user_id)
+            checkout = await CartRepository.checkout(user_id, cart_items)
+            await unit_of_work.commit()
+            return checkout
+        except BaseException:
+            await unit_of_work.rollback()
+            raise
+        finally:
+            current_unit_of_work.reset(token)
+
+    async def test_concurrent_checkouts_sell_each_item_once(self):
+        checkouts = await asyncio.gather(*[self.checkout(user_id) for user_id in range(1, self.users + 1)])
+        completed = [checkout for checkout in checkouts
+                     if len(checkout.out_of_stock) == 0 and checkout.is_enough_money]
+        self.assertGreater(len(completed), 0)
+        self.assertLess(len(completed), self.users)
+
+        (repeated_sales,), = await self.execute("SELECT COUNT(*) FROM (SELECT item_id FROM buyItem "
+                                                "GROUP BY item_id HAVING COUNT(*) > 1)")
+        (sold,), = await self.execute("SELECT COUNT(*) FROM items WHERE is_sold = 1")
+        (buy_items,), = await self.execute("SELECT COUNT(*) FROM buyItem")
+        self.assertEqual(repeated_sales, 0)
+        self.assertEqual(sold, buy_items)
+        self.assertEqual(buy_items, sum(len(items) for checkout in completed for items in checkout.purchased_items))
+
+        (consumed, paid), = await self.execute("SELECT (SELECT SUM(consume_records) FROM users), "
+                                               "(SELECT SUM(total_price) FROM buys)")
+        (overdrawn,), = await self.execute("SELECT COUNT(*) FROM users WHERE consume_records > top_up_amount")
+        self.assertAlmostEqual(consumed, paid)
+        self.assertEqual(overdrawn, 0)
+        (unsold,), = await self.execute("SELECT COUNT(*) FROM items WHERE is_sold = 0")
+        (summary_unsold,), = await self.execute("SELECT SUM(unsold_count) FROM inventory_summary")
+        self.assertEqual(unsold, summary_unsold)
@@ -0,0 +1,185 @@
+import json
+import time
+from collections import defaultdict
+from unittest.mock import AsyncMock, patch
+
+from yarl import URL
+
+from tests import DatabaseTestCase
+from crypto_api.CryptoApiManager import CryptoApiManager
+from enums.cryptocurrency import Cryptocurrency
+from services.notification import NotificationService
+from services.user import UserService
+from repositories.user import UserRepository
+from models.user import UserDTO
+from utils.price_cache import PriceCache
+
+USDT_TRC20 = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
+USDT_ERC20 = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+
+
+class ProviderStandIn:
+    # Serves the deposit histories the way the real providers page them: mempool.space after a txid,
+    # blockcypher below an exclusive block height, solana.fm by page number, trongrid oldest first
+    # from an inclusive timestamp and ethplorer newest first up to an inclusive timestamp
+    solana_page_size = 20
+    # the first TRC20 scan only looks back a day, the other histories are read from the start
+    start_positions = {"TRX": int(time.time() - 3600) * 1000}
+
+    def __init__(self):
+        # the transfers to the user's addresses in chain order as (tx_id, index in tx, block or time, amount)
+        self.transfers: dict[str, list[tuple[str, int, int, int]]] = defaultdict(list)
+        self.calls = 0
+        self.payload_bytes = 0
+
+    def add(self, chain: str, count: int, per_tx: int, per_block: int):
+        # the new transfers are made in new transactions of the next blocks
+        transfers = self.transfers[chain]
+        first_tx = int(transfers[-1][0].removeprefix(chain)) + 1 if len(transfers) > 0 else 0
+        first_position = transfers[-1][2] + 1 if len(transfers) > 0 else self.start_positions.get(chain, 1000)
+        for number in range(count):
+            tx_number = number // per_tx
+            transfers.append((f"{chain}{first_tx + tx_number}", number % per_tx,
+                              first_position + number // per_block, 1000 + len(transfers)))
+
+    def expected_keys(self, chain: str) -> set[tuple[str, int]]:
+        return {(tx_id, index) for tx_id, index, _, _ in self.transfers[chain]}
+
+    def expected_amount(self, chain: str) -> int:
+        return sum(amount for _, _, _, amount in self.transfers[chain])
+
+    async def __call__(self, url: str, params: dict | None = None) -> dict | list:
+        params = params or {}
+        url = URL(url)
+        match url.host:
+            case "mempool.space":
+                response = self.mempool(url.path.split("/"))
+            case "api.blockcypher.com":
+                response = self.blockcypher(params)
+            case "api.solana.fm":
+                response = self.solana(params)
+            case "api.trongrid.io":
+                response = self.trongrid(params)
+            case "api.ethplorer.io":
+                response = self.ethplorer(params)
+            case _:
+                response = {"error": [], "result": {"XXBTZUSD": {"c": ["50000"]}, "XLTCZUSD": {"c": ["80"]},
+                                                    "SOLUSD": {"c": ["150"]}, "USDTZUSD": {"c": ["1"]},
+                                                    "USDCUSD": {"c": ["1"]}}}
+        self.calls += 1
+        self.payload_bytes += len(json.dumps(response))
+        return response
+
+    def mempool(self, path: list[str]) -> list:
+        transactions = {}
+        for tx_id, index, height, amount in self.transfers["BTC"]:
+            transaction = transactions.setdefault(tx_id, {"txid": tx_id, "status": {"block_height": height},
+                                                          "vout": []})
+            transaction["vout"].append({"scriptpubkey_address": "btc1", "value": amount})
+        transactions = list(transactions.values())[::-1]
+        if path[-1] != "chain":
+            transactions = transactions[[tx["txid"] for tx in transactions].index(path[-1]) + 1:]
+        return transactions[:25]
+
+    def blockcypher(self, params: dict) -> dict:
+        txrefs = [{"tx_hash": tx_id, "tx_output_n": index, "value": amount, "confirmations": 1,
+                   "block_height": height} for tx_id, index, height, amount in self.transfers["LTC"][::-1]
+                  if height > params.get("after", -1) and height < params.get("before", 2 ** 31)]
+        return {"txrefs": txrefs[:params["limit"]], "hasMore": len(txrefs) > params["limit"]}
+
+    def solana(self, params: dict) -> dict:
+        transactions = {}
+        for tx_id, index, timestamp, amount in self.transfers["SOL"][::-1]:
+            if params.get("utcFrom", 0) <= timestamp <= params["utcTo"]:
+                transactions.setdefault(tx_id, {"transactionHash": tx_id, "data": []})["data"].append(
+                    {"action": "transfer", "status": "Successful", "destination": "sol1", "token": "",
+                     "amount": amount, "instructionIndex": index, "timestamp": timestamp})
+        results = list(transactions.values())
+        page = params["page"]
+        return {"results": results[(page - 1) * self.solana_page_size:page * self.solana_page_size],
+                "pagination": {"currentPage": page,
+                               "totalPages": max(1, -(-len(results) // self.solana_page_size))}}
+
+    def trongrid(self, params: dict) -> dict:
+        data = [{"transaction_id": tx_id, "block_timestamp": timestamp, "value": str(amount),
+                 "token_info": {"address": USDT_TRC20}} for tx_id, _, timestamp, amount in self.transfers["TRX"]
+                if timestamp >= params["min_timestamp"]]
+        return {"data": data[:params["limit"]]}
+
+    def ethplorer(self, params: dict) -> dict:
+        operations = [{"transactionHash": tx_id, "timestamp": timestamp, "to": "eth1", "value": str(amount),
+                       "tokenInfo": {"address": USDT_ERC20}}
+                      for tx_id, _, timestamp, amount in self.transfers["ETH"][::-1]
+                      if timestamp <= params.get("timestamp", timestamp)]
+        return {"operations": operations[:params["limit"]]}
+
+
+class DepositScanTest(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await self.create_user(1)
+        self.user = await UserRepository.get_by_tgid(UserDTO(telegram_id=1))
+        self.provider = ProviderStandIn()
+        PriceCache._quotes.clear()
+        for patcher in (patch.object(CryptoApiManager, "fetch_api_request", self.provider),
+                        patch.object(NotificationService, "new_deposit", AsyncMock()),
+                        patch.object(NotificationService, "deposit_credited", AsyncMock())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def get_deposit_keys(self, chain: str) -> set[tuple[str, int]]:
+        rows = await self.execute("SELECT tx_id, vout FROM deposits WHERE network = :network", {"network": chain})
+        return {(tx_id, vout) for tx_id, vout in rows}
+
+    async def assert_credited_once(self, chain: str, cryptocurrency: Cryptocurrency):
+        self.assertEqual(await self.get_deposit_keys(chain), self.provider.expected_keys(chain))
+        user = await UserRepository.get_by_tgid(UserDTO(telegram_id=1))
+        self.assertAlmostEqual(getattr(user, cryptocurrency.get_balance_field()),
+                               self.provider.expected_amount(chain) / pow(10, cryptocurrency.get_decimals()))
+
+    async def scan_until_caught_up(self, chain: str, max_scans: int = 20):
+        # the TRC20 scan reads one page per run and catches up on a backlog over the next runs
+        for _ in range(max_scans):
+            if await UserService.credit_new_deposits(self.user, chain) == 0:
+                return
+        self.fail(f"{chain} scan didn't catch up")
+
+    async def test_every_transfer_across_page_boundaries_is_credited_once(self):
+        # the page sizes are 25 (BTC), 50 (LTC, ETH), 20 transactions (SOL) and 200 (TRX), the blocks and
+        # seconds are cut by the pages and the TRC20 and ERC20 transactions carry several transfers each
+        cases = [("BTC", Cryptocurrency.BTC, 2, 4), ("LTC", Cryptocurrency.LTC, 2, 6),
+                 ("SOL", Cryptocurrency.SOL, 1, 3), ("TRX", Cryptocurrency.USDT_TRC20, 3, 9),
+                 ("ETH", Cryptocurrency.USDT_ERC20, 3, 9)]
+        for chain, cryptocurrency, per_tx, per_block in cases:
+            with self.subTest(chain=chain):
+                self.provider.add(chain, 61, per_tx, per_block)
+                self.provider.add(chain, 540, per_tx, per_block)
+                await self.scan_until_caught_up(chain)
+                await self.assert_credited_once(chain, cryptocurrency)
+                self.provider.add(chain, 7, per_tx, per_block)
+                await self.scan_until_caught_up(chain)
+                await self.assert_credited_once(chain, cryptocurrency)
+
+    async def test_single_second_larger_than_a_page(self):
+        self.provider.add("ETH", 120, 3, 120)
+        self.provider.add("LTC", 120, 1, 120)
+        await self.scan_until_caught_up("ETH")
+        await self.scan_until_caught_up("LTC")
+        await self.assert_credited_once("ETH", Cryptocurrency.USDT_ERC20)
+        await self.assert_credited_once("LTC", Cryptocurrency.LTC)
+
+    async def test_rescan_payload_stays_flat_as_history_grows(self):
+        for chain, per_tx in (("BTC", 1), ("LTC", 1), ("SOL", 1), ("TRX", 2), ("ETH", 2)):
+            with self.subTest(chain=chain):
+                payloads = []
+                for history in (100, 2000):
+                    self.provider.add(chain, history - len(self.provider.transfers[chain]), per_tx, per_tx)
+                    await self.scan_until_caught_up(chain, max_scans=50)
+                    self.provider.add(chain, per_tx, per_tx, per_tx)
+                    self.provider.calls = self.provider.payload_bytes = 0
+                    await UserService.credit_new_deposits(self.user, chain)
+                    payloads.append((self.provider.calls, self.provider.payload_bytes))
+                (calls_small, bytes_small), (calls_large, bytes_large) = payloads
+                self.assertEqual(calls_small, calls_large)
+                self.assertLess(bytes_large, bytes_small * 1.2)
@@ -0,0 +1,38 @@
+import re
+
+from tests import DatabaseTestCase
+from migrations import MIGRATIONS
+
+# The hot-path lookups of the repositories and the index the migrations created for each of them
+HOT_PATH_QUERIES = [
+    ("SELECT id FROM items WHERE category_id = 1 AND subcategory_id = 1 AND is_sold = 0 LIMIT 3",
+     "ix_items_unsold_category_subcategory"),
+    ("SELECT COUNT(id) FROM items WHERE subcategory_id = 1 AND is_sold = 0", "ix_items_unsold_subcategory"),
+    ("SELECT id FROM items WHERE is_new = 1", "ix_items_new"),
+    ("SELECT id FROM items WHERE reserved_by = 1", "ix_items_reserved_by"),
+    ("SELECT id FROM items WHERE reserved_until < '2026-01-01'", "ix_items_reserved_until"),
+    ("SELECT id FROM carts WHERE user_id = 1", "ix_carts_user_id"),
+    ("SELECT id, quantity FROM cart_items WHERE cart_id = 1", "ux_cart_items_cart_id_subcategory_id"),
+    ("SELECT id FROM buys WHERE buyer_id = 1 ORDER BY buy_datetime DESC", "ix_buys_buyer_id"),
+    ("SELECT COUNT(id) FROM buys WHERE buy_datetime > '2026-01-01'", "ix_buys_buy_datetime"),
+    ("SELECT item_id FROM buyItem WHERE buy_id = 1", "ix_buyItem_buy_id"),
+    ("SELECT buy_id FROM buyItem WHERE item_id = 1", "ix_buyItem_item_id"),
+    ("SELECT SUM(amount) FROM deposits WHERE user_id = 1 AND network = 'BTC'", "ix_deposits_user_id_network"),
+    ("SELECT tx_id, vout, network FROM deposits WHERE tx_id IN ('a', 'b')", "ux_deposits_tx_id_vout_network"),
+    ("SELECT COUNT(id) FROM deposits WHERE deposit_datetime > '2026-01-01'", "ix_deposits_deposit_datetime"),
+    ("SELECT COUNT(id) FROM users WHERE registered_at > '2026-01-01'", "ix_users_registered_at"),
+    ("SELECT category_id FROM inventory_summary WHERE subcategory_id = 1", "ix_inventory_summary_subcategory_id"),
+]
+
+
+class MigrationsTest(DatabaseTestCase):
+
+    async def test_every_migration_is_applied(self):
+        (user_version,), = await self.execute("PRAGMA user_version")
+        self.assertEqual(user_version, MIGRATIONS[-1][0])
+
+    async def test_hot_path_queries_use_the_indexes(self):
+        for query, index in HOT_PATH_QUERIES:
+            with self.subTest(index=index):
+                plan = " ".join(row.detail for row in await self.execute(f"EXPLAIN QUERY PLAN {query}"))
+                self.assertRegex(plan, rf"SEARCH \w+ USING (COVERING )?INDEX {re.escape(index)}\b")
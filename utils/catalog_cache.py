@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import config
+
+
+# Read-through LRU cache for the catalog pages, which are identical for every user between restocks.
+# The inventory version is bumped after the commit of a session that changed the stock, so a page
+# loaded from a snapshot older than that commit is never stored under the new version.
+class CatalogCache:
+    max_size = config.CATALOG_CACHE_SIZE
+    inventory_version = 0
+    hits = 0
+    misses = 0
+    _entries: OrderedDict[Hashable, tuple[int, Any]] = OrderedDict()
+
+    @staticmethod
+    async def get_or_load(key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = CatalogCache._entries.get(key)
+        if entry is not None and entry[0] == CatalogCache.inventory_version:
+            CatalogCache._entries.move_to_end(key)
+            CatalogCache.hits += 1
+            return entry[1]
+        CatalogCache.misses += 1
+        version = CatalogCache.inventory_version
+        value = await loader()
+        if version == CatalogCache.inventory_version:
+            CatalogCache._entries[key] = (version, value)
+            CatalogCache._entries.move_to_end(key)
+            while len(CatalogCache._entries) > CatalogCache.max_size:
+                CatalogCache._entries.popitem(last=False)
+        return value
+
+    @staticmethod
+    def invalidate_on_commit(session: AsyncSession):
+        session.sync_session.info["inventory_changed"] = True
+
+    @staticmethod
+    def invalidate():
+        CatalogCache.inventory_version += 1
+        CatalogCache._entries.clear()
+
+    @staticmethod
+    def reset_stats():
+        CatalogCache.hits = 0
+        CatalogCache.misses = 0
+
+    @staticmethod
+    def get_report() -> str:
+        requests_count = CatalogCache.hits + CatalogCache.misses
+        hit_ratio = CatalogCache.hits / requests_count * 100 if requests_count else 0
+        return (f"<b>Catalog cache</b>\n"
+                f"Inventory version: {CatalogCache.inventory_version}\n"
+                f"Entries: {len(CatalogCache._entries)}/{CatalogCache.max_size}\n"
+                f"Hits: {CatalogCache.hits}, misses: {CatalogCache.misses}, hit ratio {hit_ratio:.1f}%")
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_after_commit(session: Session):
+    if session.info.pop("inventory_changed", False):
+        CatalogCache.invalidate()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_after_rollback(session: Session, previous_transaction):
+    session.info.pop("inventory_changed", None)
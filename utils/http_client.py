@@ -0,0 +1,202 @@
+import asyncio
+import bisect
+import html
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+
+import aiohttp
+from yarl import URL
+
+import config
+from utils.sql_profiler import HISTOGRAM_BUCKETS_MS
+
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10
+# Requests per second and burst of the providers' free tiers, the hosts not listed here are not limited
+RATE_LIMITS = {
+    "mempool.space": (5, 10),
+    "api.blockcypher.com": (3, 3),
+    "api.trongrid.io": (10, 10),
+    "api.ethplorer.io": (2, 2),
+    "api.solana.fm": (5, 5),
+    "api.kraken.com": (1, 15),
+    **config.HTTP_RATE_LIMITS,
+}
+# A request that would have to queue longer than this for its provider's quota fails instead
+RATE_LIMIT_MAX_WAIT = 10
+
+
+class TokenBucket:
+    # Waiting requests take their token in advance, the balance goes negative, so they are served in FIFO order
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    async def acquire(self, max_wait: float) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        wait = (1 - self.tokens) / self.rate
+        if wait > max_wait:
+            raise TimeoutError(f"Rate limit queue is full, the next free slot is in {wait:.1f} s")
+        self.tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return max(wait, 0)
+
+
+@dataclass
+class HostStats:
+    count: int = 0
+    errors: int = 0
+    retries: int = 0
+    coalesced: int = 0
+    throttled: int = 0
+    throttled_ms: float = 0.0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    histogram: list[int] = field(default_factory=lambda: [0] * (len(HISTOGRAM_BUCKETS_MS) + 1))
+
+
+# One long-lived aiohttp session for all the crypto providers, so the keep-alive connections
+# (and their DNS lookups and TLS handshakes) are reused between requests
+class HttpClient:
+    connections_limit = 100
+    connections_per_host_limit = 10
+    timeout = aiohttp.ClientTimeout(total=15, connect=5)
+    hosts: dict[str, HostStats] = {}
+    _session: aiohttp.ClientSession | None = None
+    _rate_limits: dict[str, TokenBucket] = {host: TokenBucket(rate, burst)
+                                            for host, (rate, burst) in RATE_LIMITS.items()}
+    _in_flight: dict[tuple, asyncio.Task] = {}
+
+    @staticmethod
+    def get_session() -> aiohttp.ClientSession:
+        if HttpClient._session is None or HttpClient._session.closed:
+            connector = aiohttp.TCPConnector(limit=HttpClient.connections_limit,
+                                             limit_per_host=HttpClient.connections_per_host_limit,
+                                             ttl_dns_cache=300)
+            HttpClient._session = aiohttp.ClientSession(connector=connector, timeout=HttpClient.timeout)
+        return HttpClient._session
+
+    @staticmethod
+    async def close():
+        if HttpClient._session is not None and HttpClient._session.closed is False:
+            await HttpClient._session.close()
+        HttpClient._session = None
+
+    @staticmethod
+    def _is_retryable(status: int) -> bool:
+        # Rate limited and server error responses are worth another attempt, the rest is raised right away
+        return status == 429 or status >= 500
+
+    @staticmethod
+    def _get_retry_delay(attempt: int, retry_after: str | None = None) -> float:
+        # Full jitter, so the users refreshing at the same time don't retry in lockstep
+        delay = random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return min(delay, RETRY_MAX_DELAY)
+
+    @staticmethod
+    def _get_stats(host: str) -> HostStats:
+        stats = HttpClient.hosts.get(host)
+        if stats is None:
+            stats = HostStats()
+            HttpClient.hosts[host] = stats
+        return stats
+
+    @staticmethod
+    def _record(host: str, elapsed_ms: float, is_error: bool, is_retry: bool):
+        stats = HttpClient._get_stats(host)
+        stats.count += 1
+        stats.errors += is_error
+        stats.retries += is_retry
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.histogram[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, elapsed_ms)] += 1
+
+    @staticmethod
+    async def _throttle(host: str):
+        rate_limit = HttpClient._rate_limits.get(host)
+        if rate_limit is not None:
+            wait = await rate_limit.acquire(RATE_LIMIT_MAX_WAIT)
+            if wait > 0:
+                stats = HttpClient._get_stats(host)
+                stats.throttled += 1
+                stats.throttled_ms += wait * 1000
+
+    @staticmethod
+    async def get_json(url: str, params: dict | None = None) -> dict:
+        # Identical requests in flight share one upstream call, e.g. a refresh and the deposit scanner
+        # asking for the same address at once
+        key = (url, tuple(sorted((params or {}).items())))
+        request = HttpClient._in_flight.get(key)
+        if request is None:
+            request = asyncio.create_task(HttpClient._get_json(url, params))
+            HttpClient._in_flight[key] = request
+            request.add_done_callback(lambda _: HttpClient._forget_request(key))
+        else:
+            HttpClient._get_stats(URL(url).host).coalesced += 1
+        return await asyncio.shield(request)
+
+    @staticmethod
+    def _forget_request(key: tuple):
+        request = HttpClient._in_flight.pop(key)
+        if request.cancelled() is False:
+            # retrieved here, so a failure nobody waits for anymore is not logged as never retrieved
+            request.exception()
+
+    @staticmethod
+    async def _get_json(url: str, params: dict | None = None) -> dict:
+        host = URL(url).host
+        session = HttpClient.get_session()
+        attempt = 0
+        while True:
+            await HttpClient._throttle(host)
+            start_time = time.perf_counter()
+            try:
+                async with session.get(url, params=params) as response:
+                    if HttpClient._is_retryable(response.status) and attempt < MAX_RETRIES:
+                        HttpClient._record(host, (time.perf_counter() - start_time) * 1000, True, attempt > 0)
+                        delay = HttpClient._get_retry_delay(attempt, response.headers.get("Retry-After"))
+                        logging.warning(f"{host} responded {response.status}, retrying in {delay:.1f} s")
+                    else:
+                        response.raise_for_status()
+                        data = await response.json(content_type=None)
+                        HttpClient._record(host, (time.perf_counter() - start_time) * 1000, False, attempt > 0)
+                        return data
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                HttpClient._record(host, (time.perf_counter() - start_time) * 1000, True, attempt > 0)
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = HttpClient._get_retry_delay(attempt)
+                logging.warning(f"{host} request failed: {e!r}, retrying in {delay:.1f} s")
+            except aiohttp.ClientResponseError:
+                HttpClient._record(host, (time.perf_counter() - start_time) * 1000, True, attempt > 0)
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def reset():
+        HttpClient.hosts.clear()
+
+    @staticmethod
+    def get_report() -> str:
+        report = (f"<b>HTTP providers</b>\n"
+                  f"Histogram buckets, ms: {', '.join(map(str, HISTOGRAM_BUCKETS_MS))}, inf\n\n")
+        for host, stats in sorted(HttpClient.hosts.items(), key=lambda item: item[1].total_ms, reverse=True):
+            avg_ms = stats.total_ms / stats.count if stats.count else 0
+            report += (f"<b>{html.escape(host)}</b> x{stats.count}, errors {stats.errors}, "
+                       f"retries {stats.retries}, avg {avg_ms:.1f} ms, max {stats.max_ms:.1f} ms\n"
+                       f"coalesced {stats.coalesced}, throttled {stats.throttled} "
+                       f"for {stats.throttled_ms:.0f} ms\n"
+                       f"{stats.histogram}\n\n")
+        return report
@@ -0,0 +1,70 @@
+import functools
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable
+
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup
+from aiogram.utils.keyboard import KeyboardBuilder
+
+from utils.localizator import Localizator
+
+Markup = InlineKeyboardMarkup | ReplyKeyboardMarkup
+MenuBuilder = Callable[..., Awaitable[tuple[str, KeyboardBuilder | Markup]]]
+
+
+# Finished menus (text and markup) keyed by menu, its arguments and the l10n catalog version, so a hot menu
+# is packed once instead of on every tap. Catalog menus add the inventory version to their key.
+class KeyboardCache:
+    max_size = 1024
+    hits = 0
+    misses = 0
+    _entries: OrderedDict[Hashable, tuple[str, Markup]] = OrderedDict()
+    _static_menus: list[tuple[MenuBuilder, list[tuple]]] = []
+
+    @staticmethod
+    async def get_or_build(key: tuple, build: Callable[[], Awaitable[tuple[str, KeyboardBuilder | Markup]]]) \
+            -> tuple[str, Markup]:
+        key = (*key, Localizator.get_catalog_version())
+        entry = KeyboardCache._entries.get(key)
+        if entry is not None:
+            KeyboardCache._entries.move_to_end(key)
+            KeyboardCache.hits += 1
+            return entry
+        KeyboardCache.misses += 1
+        text, keyboard = await build()
+        if isinstance(keyboard, KeyboardBuilder):
+            keyboard = keyboard.as_markup()
+        entry = (text, keyboard)
+        KeyboardCache._entries[key] = entry
+        while len(KeyboardCache._entries) > KeyboardCache.max_size:
+            KeyboardCache._entries.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def static_menu(name: str, variants: list[tuple] | None = None):
+        # For menus that only depend on their arguments, the listed argument variants are built at startup
+        def decorator(build: MenuBuilder) -> Callable[..., Awaitable[tuple[str, Markup]]]:
+            @functools.wraps(build)
+            async def wrapper(*args):
+                return await KeyboardCache.get_or_build((name, *args), lambda: build(*args))
+
+            KeyboardCache._static_menus.append((wrapper, variants or [()]))
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def reset_stats():
+        KeyboardCache.hits = 0
+        KeyboardCache.misses = 0
+
+    @staticmethod
+    def get_report() -> str:
+        return (f"<b>Keyboard cache</b>\n"
+                f"Entries: {len(KeyboardCache._entries)}/{KeyboardCache.max_size}\n"
+                f"Hits: {KeyboardCache.hits}, misses: {KeyboardCache.misses}")
+
+    @staticmethod
+    async def build_static_menus():
+        for menu, variants in KeyboardCache._static_menus:
+            for args in variants:
+                await menu(*args)
@@ -0,0 +1,33 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Hashable
+
+
+class KeyedLock:
+    # One asyncio.Lock per key, created on first use and dropped as soon as nobody holds or waits for it,
+    # so the registry only contains the keys that are busy right now and never grows with the number of users
+
+    def __init__(self):
+        self._locks: dict[Hashable, tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: Hashable):
+        lock, users_count = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users_count + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users_count = self._locks[key]
+            if users_count == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users_count - 1)
+
+    def is_locked(self, key: Hashable) -> bool:
+        return key in self._locks
+
+    def __len__(self) -> int:
+        return len(self._locks)
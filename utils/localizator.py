@@ -1,25 +1,74 @@
 import json
+import logging
+import os
+import time
+from types import MappingProxyType
+
 import config
 from enums.bot_entity import BotEntity
 
 
 class Localizator:
     localization_filename = f"./l10n/{config.BOT_LANGUAGE}.json"
+    # How often (in seconds) the l10n file is checked for changes, so translators can edit it without a restart
+    reload_check_interval = 1.0
+    _catalog: MappingProxyType | None = None
+    _catalog_mtime: float | None = None
+    _next_reload_check = 0.0
+    _currency_symbol: str | None = None
+    _currency_text: str | None = None
 
     @staticmethod
-    def get_text(entity: BotEntity, key: str) -> str:
+    def _load_catalog(mtime: float) -> None:
         with open(Localizator.localization_filename, "r", encoding="UTF-8") as f:
-            if entity == BotEntity.ADMIN:
-                return json.loads(f.read())["admin"][key]
-            elif entity == BotEntity.USER:
-                return json.loads(f.read())["user"][key]
-            else:
-                return json.loads(f.read())["common"][key]
+            localization = json.loads(f.read())
+        catalog = MappingProxyType({
+            BotEntity.ADMIN: MappingProxyType(localization["admin"]),
+            BotEntity.USER: MappingProxyType(localization["user"]),
+            BotEntity.COMMON: MappingProxyType(localization["common"])
+        })
+        currency = config.CURRENCY.value.lower()
+        Localizator._currency_symbol = catalog[BotEntity.COMMON][f"{currency}_symbol"]
+        Localizator._currency_text = catalog[BotEntity.COMMON][f"{currency}_text"]
+        Localizator._catalog = catalog
+        Localizator._catalog_mtime = mtime
+
+    @staticmethod
+    def _get_catalog() -> MappingProxyType:
+        now = time.monotonic()
+        if Localizator._catalog is None or now >= Localizator._next_reload_check:
+            Localizator._next_reload_check = now + Localizator.reload_check_interval
+            try:
+                mtime = os.stat(Localizator.localization_filename).st_mtime
+                if mtime != Localizator._catalog_mtime:
+                    Localizator._load_catalog(mtime)
+            except (OSError, ValueError, KeyError) as e:
+                if Localizator._catalog is None:
+                    raise
+                # Keep serving the previous catalog while the file is half-edited, broken or being replaced
+                logging.warning(f"Failed to reload {Localizator.localization_filename}: {e}")
+        return Localizator._catalog
+
+    @staticmethod
+    def get_text(entity: BotEntity, key: str) -> str:
+        catalog = Localizator._get_catalog()
+        if entity == BotEntity.ADMIN or entity == BotEntity.USER:
+            return catalog[entity][key]
+        else:
+            return catalog[BotEntity.COMMON][key]
+
+    @staticmethod
+    def get_catalog_version() -> tuple[str, float]:
+        # Changes whenever the catalog is reloaded, so anything rendered from it can be cached by this key
+        Localizator._get_catalog()
+        return config.BOT_LANGUAGE, Localizator._catalog_mtime
 
     @staticmethod
     def get_currency_symbol():
-        return Localizator.get_text(BotEntity.COMMON, f"{config.CURRENCY.value.lower()}_symbol")
+        Localizator._get_catalog()
+        return Localizator._currency_symbol
 
     @staticmethod
     def get_currency_text():
-        return Localizator.get_text(BotEntity.COMMON, f"{config.CURRENCY.value.lower()}_text")
+        Localizator._get_catalog()
+        return Localizator._currency_text
@@ -0,0 +1,44 @@
+from typing import Sequence
+
+from sqlalchemy import Select
+
+import config
+
+# Keyset (seek) pagination over an ascending unique integer key, so a deep page costs the same as the first one.
+# The cursor carried in the callback data next to the page number is:
+# 0 - the first page, k > 0 - the page after the row with key k,
+# -k - 1 - the page before the row with key k, LAST_PAGE_CURSOR - the last page.
+LAST_PAGE_CURSOR = -1
+
+
+def paginate(stmt: Select, key_column, cursor: int) -> Select:
+    if cursor >= 0:
+        return stmt.where(key_column > cursor).order_by(key_column).limit(config.PAGE_ENTRIES)
+    # Backward pages are read in descending order from the index and put back in order by sort_page
+    if cursor != LAST_PAGE_CURSOR:
+        stmt = stmt.where(key_column < -cursor - 1)
+    return stmt.order_by(key_column.desc()).limit(config.PAGE_ENTRIES)
+
+
+def with_total(stmt: Select, total_stmt: Select) -> Select:
+    # The total is an uncorrelated scalar subquery, evaluated once, so a page comes with its total in one round trip.
+    # COUNT(*) OVER() would only count the rows left after the cursor.
+    return stmt.add_columns(total_stmt.scalar_subquery().label("total"))
+
+
+def get_total(rows: Sequence) -> int:
+    return rows[0]["total"] if len(rows) > 0 else 0
+
+
+def sort_page(rows: Sequence, cursor: int) -> list:
+    if cursor >= 0:
+        return list(rows)
+    return list(reversed(rows))
+
+
+def get_next_cursor(keys: list[int]) -> int:
+    return keys[-1]
+
+
+def get_previous_cursor(keys: list[int]) -> int:
+    return -keys[0] - 1
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable
+
+from db import commit_unit_of_work
+
+
+@dataclass
+class PriceQuote:
+    price: float
+    fetched_at: float
+    is_stale: bool = False
+
+
+# Crypto prices of every supported cryptocurrency, refreshed together by one provider call at most once per TTL.
+# Concurrent callers share the refresh in flight, and while the provider is down the last known prices
+# are served flagged as stale until they are older than max_stale_seconds.
+class PriceCache:
+    ttl_seconds = 60
+    max_stale_seconds = 3600
+    hits = 0
+    misses = 0
+    stale = 0
+    _quotes: dict[Hashable, PriceQuote] = {}
+    _refresh: asyncio.Task | None = None
+
+    @staticmethod
+    async def _load(loader: Callable[[], Awaitable[dict[Hashable, float]]]):
+        prices = await loader()
+        fetched_at = time.monotonic()
+        for key, price in prices.items():
+            PriceCache._quotes[key] = PriceQuote(price, fetched_at)
+
+    @staticmethod
+    async def get_quote(key: Hashable, loader: Callable[[], Awaitable[dict[Hashable, float]]]) -> PriceQuote:
+        quote = PriceCache._quotes.get(key)
+        if quote is not None and time.monotonic() - quote.fetched_at < PriceCache.ttl_seconds:
+            PriceCache.hits += 1
+            return quote
+        PriceCache.misses += 1
+        # don't hold the write transaction of the current update while waiting on the refresh
+        await commit_unit_of_work()
+        if PriceCache._refresh is None:
+            PriceCache._refresh = asyncio.create_task(PriceCache._load(loader))
+            PriceCache._refresh.add_done_callback(PriceCache._clear_refresh)
+        try:
+            await asyncio.shield(PriceCache._refresh)
+        except Exception as e:
+            if quote is None or time.monotonic() - quote.fetched_at >= PriceCache.max_stale_seconds:
+                raise
+            logging.warning(f"Price refresh failed, serving the last known {key} price: {e!r}")
+            PriceCache.stale += 1
+            return PriceQuote(quote.price, quote.fetched_at, is_stale=True)
+        quote = PriceCache._quotes.get(key)
+        if quote is None:
+            raise KeyError(f"No price for {key}")
+        return quote
+
+    @staticmethod
+    def _clear_refresh(refresh: asyncio.Task):
+        PriceCache._refresh = None
+        if refresh.cancelled() is False:
+            # retrieved here, so a failed refresh nobody waits for anymore is not logged as never retrieved
+            refresh.exception()
+
+    @staticmethod
+    def reset_stats():
+        PriceCache.hits = 0
+        PriceCache.misses = 0
+        PriceCache.stale = 0
+
+    @staticmethod
+    def get_report() -> str:
+        now = time.monotonic()
+        report = (f"<b>Price cache</b>\n"
+                  f"Hits: {PriceCache.hits}, misses: {PriceCache.misses}, stale: {PriceCache.stale}\n")
+        for key, quote in PriceCache._quotes.items():
+            report += f"{getattr(key, 'value', key)}: {quote.price} ({now - quote.fetched_at:.0f} s old)\n"
+        return report
@@ -0,0 +1,131 @@
+import bisect
+import html
+import logging
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import greenlet
+from sqlalchemy import event, Engine
+
+import config
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last bucket is unbounded
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    histogram: list[int] = field(default_factory=lambda: [0] * (len(HISTOGRAM_BUCKETS_MS) + 1))
+    callers: Counter = field(default_factory=Counter)
+
+
+class SQLProfiler:
+    slow_query_threshold_ms = config.SQL_SLOW_QUERY_MS
+    statements: dict[str, StatementStats] = {}
+    updates_count = 0
+    updates_queries_total = 0
+    updates_queries_max = 0
+    # Mutable [count] cell set by SQLProfilerMiddleware for the duration of one Telegram update
+    update_query_count: ContextVar[list[int] | None] = ContextVar("update_query_count", default=None)
+    _enabled = False
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return SQLProfiler._enabled
+
+    @staticmethod
+    def enable():
+        # The listeners are only attached while profiling is on, so a disabled profiler costs nothing
+        if SQLProfiler._enabled is False:
+            event.listen(Engine, "before_cursor_execute", SQLProfiler._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", SQLProfiler._after_cursor_execute)
+            SQLProfiler._enabled = True
+
+    @staticmethod
+    def disable():
+        if SQLProfiler._enabled:
+            event.remove(Engine, "before_cursor_execute", SQLProfiler._before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", SQLProfiler._after_cursor_execute)
+            SQLProfiler._enabled = False
+
+    @staticmethod
+    def reset():
+        SQLProfiler.statements.clear()
+        SQLProfiler.updates_count = 0
+        SQLProfiler.updates_queries_total = 0
+        SQLProfiler.updates_queries_max = 0
+
+    @staticmethod
+    def _get_caller() -> str:
+        # With AsyncSession the statement runs in a greenlet, the awaiting coroutines live in the parent's frames
+        current_greenlet = greenlet.getcurrent()
+        if current_greenlet.parent is not None:
+            frame = current_greenlet.parent.gr_frame
+        else:
+            frame = sys._getframe()
+        while frame is not None:
+            if frame.f_globals.get("__name__", "").startswith("repositories."):
+                return frame.f_code.co_qualname
+            frame = frame.f_back
+        return "unknown"
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profiler_start_time = time.perf_counter()
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start_time = getattr(context, "_profiler_start_time", None)
+        if start_time is None:
+            return
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        # The aiosqlite adapter buffers result rows right after execute, the sync drivers only know rowcount
+        buffered_rows = getattr(cursor, "_rows", None)
+        rows = len(buffered_rows) if buffered_rows is not None else max(cursor.rowcount, 0)
+        caller = SQLProfiler._get_caller()
+        stats = SQLProfiler.statements.get(statement)
+        if stats is None:
+            stats = StatementStats()
+            SQLProfiler.statements[statement] = stats
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.rows += rows
+        stats.histogram[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, elapsed_ms)] += 1
+        stats.callers[caller] += 1
+        update_query_count = SQLProfiler.update_query_count.get()
+        if update_query_count is not None:
+            update_query_count[0] += 1
+        if elapsed_ms >= SQLProfiler.slow_query_threshold_ms:
+            logging.warning(f"Slow query {elapsed_ms:.1f} ms, {rows} rows in {caller}: {statement}")
+
+    @staticmethod
+    def record_update(queries_count: int):
+        SQLProfiler.updates_count += 1
+        SQLProfiler.updates_queries_total += queries_count
+        SQLProfiler.updates_queries_max = max(SQLProfiler.updates_queries_max, queries_count)
+
+    @staticmethod
+    def get_report(limit: int = 10) -> str:
+        state = "on" if SQLProfiler._enabled else "off"
+        avg_queries = SQLProfiler.updates_queries_total / SQLProfiler.updates_count if SQLProfiler.updates_count else 0
+        report = (f"<b>SQL profiling: {state}</b>\n"
+                  f"Updates: {SQLProfiler.updates_count}, queries per update avg {avg_queries:.1f} "
+                  f"max {SQLProfiler.updates_queries_max}\n"
+                  f"Histogram buckets, ms: {', '.join(map(str, HISTOGRAM_BUCKETS_MS))}, inf\n\n")
+        top_statements = sorted(SQLProfiler.statements.items(), key=lambda item: item[1].total_ms, reverse=True)
+        for statement, stats in top_statements[:limit]:
+            caller, _ = stats.callers.most_common(1)[0]
+            report += (f"<b>{html.escape(caller)}</b> x{stats.count}, total {stats.total_ms:.1f} ms, "
+                       f"max {stats.max_ms:.1f} ms, rows {stats.rows}\n"
+                       f"{stats.histogram}\n"
+                       f"<code>{html.escape(' '.join(statement.split())[:200])}</code>\n\n")
+        return report